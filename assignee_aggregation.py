@@ -0,0 +1,83 @@
+'''
+vectorized aggregation of the assignee rows of every patent (Step 5-2)
+
+the old step ran final_data.groupby('patent_id').apply(aggregate_assignees_reg), one python call per patent.
+here the same result is built in bulk on the patent-sorted frame:
+- patents whose highest assignee_sequence is 0 keep all their rows unchanged
+- every other patent (also patents without any assignee, their maximum is NaN) keeps only its first row, with
+  assignee_type_reg, assignee_name, disambig_state and disambig_country joined with '& ' and
+  assignee_sequence joined with ', ' over all rows of the patent (values written with str(), so NaN -> 'nan')
+- assignee_type_unified maps every part of assignee_type_reg with assignee_type_mapping_unified and joins
+  them with ' & ' (every distinct assignee_type_reg is mapped once, see dimension_arrays.py)
+
+the joins are done with numpy's add.reduceat over the groups, no python code runs per patent.
+the output is the same as the groupby/apply version (see test_assignee_aggregation.py).
+'''
+
+import numpy as np
+import pandas as pd
+
+from dimension_arrays import unify_types
+
+joined_columns = ['assignee_type_reg', 'assignee_name', 'disambig_state', 'disambig_country']
+
+
+# Function to join the string values of every group, the frame must be sorted by group
+# group_starts are the positions of the first row of every group
+def join_groups(values, group_starts, separator):
+    values = np.asarray(values, dtype=object)
+    is_last = np.zeros(len(values), dtype=bool)
+    is_last[group_starts[1:] - 1] = True
+    is_last[-1] = True
+    with_separator = np.where(is_last, values, values + separator)
+    return np.add.reduceat(with_separator, group_starts)
+
+
+# Function to aggregate the assignees of every patent_id and add assignee_type_unified
+def aggregate_assignees(final_data, assignee_type_mapping_unified):
+    # groupby drops rows without patent_id and orders the patents by id, rows inside a patent keep their order
+    data = final_data[final_data['patent_id'].notna()]
+    data = data.iloc[np.argsort(data['patent_id'].to_numpy(dtype=object), kind='stable')].reset_index(drop=True)
+    if data.empty:
+        data['assignee_type_unified'] = pd.Series(dtype=object)
+        return data
+
+    patent_ids = data['patent_id'].to_numpy(dtype=object)
+    new_group = np.ones(len(data), dtype=bool)
+    new_group[1:] = patent_ids[1:] != patent_ids[:-1]
+    group_starts = np.flatnonzero(new_group)
+    group_sizes = np.diff(np.append(group_starts, len(data)))
+
+    # a patent is aggregated unless its highest assignee_sequence is exactly 0
+    sequences = data['assignee_sequence']
+    max_sequence = sequences.groupby(np.repeat(np.arange(len(group_starts)), group_sizes)).max().to_numpy()
+    aggregated_group = ~(max_sequence == 0)
+
+    unified = unify_types(data['assignee_type_reg'], assignee_type_mapping_unified)
+    keep = np.repeat(~aggregated_group, group_sizes)
+    keep[group_starts[aggregated_group]] = True
+    result = data[keep].reset_index(drop=True)
+    if not aggregated_group.any():
+        result['assignee_type_unified'] = unified[keep]
+        return result
+
+    # position of the aggregated patents' first rows in the result
+    first_rows = np.flatnonzero(np.isin(np.flatnonzero(keep), group_starts[aggregated_group]))
+    groups_to_join = np.repeat(aggregated_group, group_sizes)
+    starts_to_join = np.flatnonzero(new_group[groups_to_join])
+
+    for column in joined_columns:
+        joined = join_groups(data[column].astype(str).to_numpy()[groups_to_join], starts_to_join, '& ')
+        values = result[column].to_numpy(dtype=object).copy()
+        values[first_rows] = joined
+        result[column] = values
+
+    joined = join_groups(sequences.astype(str).to_numpy()[groups_to_join], starts_to_join, ', ')
+    values = result['assignee_sequence'].to_numpy(dtype=object).copy()
+    values[first_rows] = joined
+    result['assignee_sequence'] = values
+
+    unified_values = unified[keep].copy()
+    unified_values[first_rows] = join_groups(unified[groups_to_join], starts_to_join, ' & ')
+    result['assignee_type_unified'] = unified_values
+    return result
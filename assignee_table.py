@@ -0,0 +1,88 @@
+'''
+the g_assignee columns, the assignee type mappings and the preparation of the assignee rows (Step 3)
+
+the patent_whole_data_* scripts, fact_table.py, count_cube.py and incremental_update.py all read and prepare
+g_assignee the same way, so they take the columns, the mappings and prepare_assignees() from here. the fact
+table and the count cube are built from this code: they store assignee_logic_version() (a hash of this
+module and of dimension_arrays.py) and are rebuilt when it changes, so a fix of a mapping never leaves them
+behind the scripts.
+
+usage (in a script):
+g_assignee_df = read_tsv(g_assignee, usecols=g_assignee_columns, dtype=g_assignee_dtype,
+                         converters={'assignee_sequence': convert_assignee_sequence})
+g_assignee_df = prepare_assignees(g_assignee_df)
+'''
+
+import hashlib
+import inspect
+import sys
+
+import dimension_arrays
+from dimension_arrays import decode_assignee_types
+
+g_assignee_columns = ['patent_id', 'disambig_assignee_individual_name_first', 'disambig_assignee_individual_name_last',
+                      'disambig_assignee_organization', 'assignee_sequence', 'assignee_type', 'location_id']
+g_assignee_dtype = {'patent_id': str, 'disambig_assignee_individual_name_first': str,
+                    'disambig_assignee_individual_name_last': str, 'disambig_assignee_organization': str,
+                    'assignee_type': str, 'location_id': str}
+name_columns = ['disambig_assignee_individual_name_first', 'disambig_assignee_individual_name_last',
+                'disambig_assignee_organization']
+
+# Define a mapping dictionary for assignee_type values
+assignee_type_mapping_reg = {
+    1: 'Unassigned',
+    2: 'US Company or Corporation',
+    3: 'Foreign Company or Corporation',
+    4: 'US Individual',
+    5: 'Foreign Individual',
+    6: 'US Federal Government',
+    7: 'Foreign Government',
+    8: 'US County Government',
+    9: 'US State Government',
+}
+
+assignee_type_mapping_unified = {
+    'Unassigned': 'Unassigned',
+    'US Company or Corporation': 'Company',
+    'Foreign Company or Corporation': 'Company',
+    'US Individual': 'Individual',
+    'Foreign Individual': 'Individual',
+    'US Federal Government': 'Government',
+    'Foreign Government': 'Government',
+    'US County Government': 'Government',
+    'US State Government': 'Government',
+}
+
+
+# Define a function to convert assignee_sequence to int and handle NaN values
+def convert_assignee_sequence(value):
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return 0  # Or any other default value you prefer
+
+
+# Function to prepare the assignee rows as Step 3 of the scripts does (changes the frame and gives it back):
+# assignee_type as an integer, assignee_type_reg, and assignee_name instead of the three name columns
+def prepare_assignees(g_assignee_df):
+    # Duplicate the 'assignee_type' column to create two new columns
+    g_assignee_df['assignee_type'] = g_assignee_df['assignee_type'].fillna('0').astype(int)
+
+    # Apply the 'assignee_type_mapping_reg' mappings (an array gather by the type code, see dimension_arrays.py)
+    g_assignee_df['assignee_type_reg'] = decode_assignee_types(g_assignee_df['assignee_type'],
+                                                               assignee_type_mapping_reg)
+
+    # Merge 'disambig_assignee_individual_name_first' and 'disambig_assignee_individual_name_last' into 'assignee_name'
+    g_assignee_df['assignee_name'] = g_assignee_df['disambig_assignee_organization']
+    empty_mask = g_assignee_df['assignee_name'].isnull()
+    g_assignee_df.loc[empty_mask, 'assignee_name'] = g_assignee_df['disambig_assignee_individual_name_first'] + ' ' + \
+                                                     g_assignee_df['disambig_assignee_individual_name_last']
+    g_assignee_df.drop(columns=name_columns, inplace=True)
+    return g_assignee_df
+
+
+# Function to get the version of the assignee logic: a hash of the source of this module and of the
+# decoding in dimension_arrays.py
+def assignee_logic_version():
+    source = inspect.getsource(sys.modules[__name__]) + inspect.getsource(dimension_arrays)
+    return hashlib.sha1(source.encode()).hexdigest()[:16]
@@ -0,0 +1,87 @@
+'''
+benchmark of the keyword filter: old '|'.join regex with str.contains vs the compiled KeywordMatcher
+
+it builds synthetic abstracts and keyword lists from 10 up to 1,000 terms (the blockchain words plus
+generated technical phrases) and prints the scan time of every method for every list size.
+
+usage:
+python bench_keyword_matcher.py --docs 20000 --sizes 10 30 100 300 1000
+'''
+
+import argparse
+import random
+import time
+
+import pandas as pd
+
+from keyword_matcher import KeywordMatcher, ahocorasick
+
+blockchain_words = ['blockchain', 'bitcoin', 'bit-coin', 'block-chain', 'blocksign', 'codius', 'colored coin',
+                    'colored-coin', 'crypto currency', 'crypto-currency', 'cryptocurrency', 'distributed ledger',
+                    'distributed-ledger', 'dogecoin', 'doge-coin', 'ethereum', 'factom', 'litecoin', 'lite-coin',
+                    'pay-to-script-hash', 'p2sh', 'proof of stake', 'proof-of-stake', 'sidechain', 'smart contract',
+                    'smart-contract', 'zcash', 'zerocash']
+
+vocabulary = ['system', 'method', 'device', 'apparatus', 'data', 'network', 'node', 'signal', 'layer', 'power',
+              'module', 'unit', 'control', 'member', 'surface', 'housing', 'first', 'second', 'plurality', 'wherein',
+              'configured', 'receive', 'transmit', 'memory', 'processor', 'image', 'light', 'fluid', 'valve', 'sensor']
+
+
+# Function to build a keyword list of the given size
+def make_terms(size, rng):
+    terms = list(blockchain_words[:size])
+    while len(terms) < size:
+        length = rng.randint(5, 12)
+        word = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(length))
+        terms.append(word if rng.random() < 0.5 else rng.choice(vocabulary) + ' ' + word)
+    return terms
+
+
+# Function to build lower-cased title + abstract texts, a few of them contain a blockchain word
+def make_texts(num_docs, rng):
+    texts = []
+    for _ in range(num_docs):
+        words = rng.choices(vocabulary, k=rng.randint(60, 180))
+        if rng.random() < 0.01:
+            words.insert(rng.randrange(len(words)), rng.choice(blockchain_words))
+        texts.append(' '.join(words))
+    return pd.Series(texts)
+
+
+def time_it(function):
+    start_time = time.time()
+    result = function()
+    return time.time() - start_time, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='keyword filter scaling benchmark')
+    parser.add_argument('--docs', type=int, default=20000, help='number of synthetic abstracts')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 30, 100, 300, 1000], help='keyword list sizes')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    texts = make_texts(args.docs, rng)
+    megabytes = texts.str.len().sum() / 1e6
+    backends = ['trie'] + (['ahocorasick'] if ahocorasick is not None else [])
+    print(f'{args.docs} texts, {megabytes:.1f} MB, backends: {", ".join(backends)}')
+    print()
+
+    header = f"{'terms':>6} {'regex (s)':>10}" + ''.join(f" {b + ' (s)':>17} {'speedup':>8}" for b in backends)
+    print(header)
+    for size in args.sizes:
+        terms = make_terms(size, rng)
+        regex_time, expected = time_it(lambda: texts.str.contains('|'.join(terms), case=False))
+        line = f'{size:>6} {regex_time:>10.3f}'
+        for backend in backends:
+            matcher = KeywordMatcher(terms, backend=backend)
+            matcher_time, mask = time_it(lambda: matcher.contains(texts))
+            if not mask.equals(expected):
+                raise AssertionError(f'{backend} result differs from the regex result for {size} terms')
+            line += f' {matcher_time:>17.3f} {regex_time / matcher_time:>7.1f}x'
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+'''
+offline benchmark of the four scripts on synthetic data
+
+for every scale the tables are generated once (generate_synthetic_data.py) in <work-dir>/<scale>, then every
+script runs there in its own process. the harness records:
+- the wall time, CPU time, rows out and growth of the peak memory of every stage (the json lines the
+  scripts write through stage_profiler.py with STAGE_LOG set)
+- the wall time and peak memory (max resident set size) of every script
+results are appended to a csv, --baseline compares them with an earlier results file so a slower step
+or a higher peak memory shows up before the code is run on the real tables.
+
+the scripts run in this order, patent_whole_data_patent_list.py reads the patent list written by num_patent_cpc.py.
+the caches of tsv_cache.py, cpc_store.py and inverted_index.py in the data folder are used when they exist,
+--fresh removes them before every scale (cold run). the scripts run without their step checkpoints
+(checkpoints.py), a run that resumes from a checkpoint would not time Steps 1 to 4. a step that is only in
+the results or only in the baseline is reported by --baseline.
+
+usage:
+python benchmark_pipeline.py --scales 100k 1m
+python benchmark_pipeline.py --scales 100k --baseline benchmark_results_old.csv
+'''
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+from generate_synthetic_data import generate, scales
+
+scripts = ['num_patent_cpc.py', 'patent_whole_data_patent_list.py', 'patent_whole_data_selected_words.py',
+           'num_patent_text&cpc.py']
+
+table_names = ['g_patent', 'g_cpc_current', 'g_assignee_disambiguated', 'g_location_disambiguated']
+
+# arguments of the scripts: every step runs and is timed, none is resumed from a checkpoint
+script_args = {
+    'patent_whole_data_patent_list.py': ['--no-checkpoints'],
+    'patent_whole_data_selected_words.py': ['--no-checkpoints'],
+}
+
+# a step or script is reported as a regression when it is this much slower (or bigger) than the baseline
+regression_ratio = 1.2
+
+
+# Function to generate the tables of a scale (once) and link them under the names the scripts read
+def prepare_data(data_dir, num_patents, seed):
+    if not all(os.path.exists(os.path.join(data_dir, name + '.tsv')) for name in table_names):
+        print(f'generating {num_patents} patents in {data_dir}...')
+        generate(num_patents, data_dir, seed)
+    # patent_whole_data_selected_words.py reads the '_n' versions of the tables
+    for name in table_names:
+        link = os.path.join(data_dir, name + '_n.tsv')
+        if not os.path.exists(link):
+            os.symlink(name + '.tsv', link)
+
+
+# Function to remove the caches built next to the tables (and the checkpoints of earlier runs)
+def remove_caches(data_dir):
+    for path in glob.glob(os.path.join(data_dir, 'patentsview_cache')) + \
+            glob.glob(os.path.join(data_dir, '*.tsv.store')) + glob.glob(os.path.join(data_dir, '*.tsv.index')) + \
+            glob.glob(os.path.join(data_dir, 'checkpoints')):
+        shutil.rmtree(path)
+
+
+# Function to read the stage records a script wrote
+def read_stages(stage_log):
+    if not os.path.exists(stage_log):
+        return []
+    with open(stage_log) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# Function to run a script in data_dir, gives its output, wall time and peak memory in MB
+# the stages of the script are written to stage_log
+def run_script(script, data_dir, stage_log):
+    script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), script)
+    if os.path.exists(stage_log):
+        os.remove(stage_log)
+    env = dict(os.environ, STAGE_LOG=os.path.abspath(stage_log))
+    start_time = time.time()
+    process = subprocess.Popen([sys.executable, script_path] + script_args.get(script, []), cwd=data_dir, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, text=True, env=env)
+    output = process.stdout.read()
+    # wait4 gives the resource usage of this child only (ru_maxrss is in kilobytes on Linux)
+    _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.time() - start_time
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(f'{script} failed in {data_dir}:\n{output[-2000:]}')
+    return output, seconds, usage.ru_maxrss / 1e3
+
+
+# Function to benchmark all scripts at one scale, gives one row per step and one 'total' row per script
+# peak_mb of a step is how much it raised the peak memory, of 'total' the peak memory of the script
+def benchmark_scale(scale, work_dir, seed=1, fresh=False):
+    num_patents = scales[scale] if scale in scales else int(scale)
+    data_dir = os.path.join(work_dir, scale)
+    prepare_data(data_dir, num_patents, seed)
+    if fresh:
+        remove_caches(data_dir)
+
+    rows = []
+    stage_log = os.path.join(data_dir, 'benchmark_stages.jsonl')
+    for script in scripts:
+        print(f'[{scale}] running {script}...')
+        output, seconds, peak_mb = run_script(script, data_dir, stage_log)
+        for stage in read_stages(stage_log):
+            rows.append({'scale': scale, 'script': script, 'step': stage['stage'], 'seconds': stage['wall_seconds'],
+                         'cpu_seconds': stage['cpu_seconds'], 'rows_out': stage['rows_out'],
+                         'peak_mb': stage['peak_rss_delta_mb']})
+        rows.append({'scale': scale, 'script': script, 'step': 'total', 'seconds': round(seconds, 2),
+                     'cpu_seconds': None, 'rows_out': None, 'peak_mb': round(peak_mb, 1)})
+        print(f'[{scale}] {script}: {seconds:.2f} seconds, peak memory {peak_mb:.0f} MB')
+    return rows
+
+
+# Function to print the steps that are slower or bigger than in the baseline
+def compare_with_baseline(results, baseline_file):
+    baseline = pd.read_csv(baseline_file, dtype={'scale': str})
+    keys = ['scale', 'script', 'step']
+    baseline = baseline.drop_duplicates(keys, keep='last')
+    merged = pd.merge(results, baseline[keys + ['seconds', 'peak_mb']], on=keys, how='outer',
+                      suffixes=('', '_baseline'), indicator=True)
+    # a step missing on one side can not be compared, e.g. a step that was resumed from a checkpoint
+    # (only the scales of this run count)
+    missing = merged[(merged['_merge'] != 'both') & merged['scale'].isin(results['scale'])]
+    merged = merged[merged['_merge'] == 'both'].drop(columns='_merge')
+    merged['time_ratio'] = merged['seconds'] / merged['seconds_baseline']
+    merged['memory_ratio'] = merged['peak_mb'] / merged['peak_mb_baseline']
+    print(f"Compared with '{baseline_file}':")
+    print(merged[keys + ['seconds_baseline', 'seconds', 'time_ratio', 'peak_mb_baseline', 'peak_mb',
+                         'memory_ratio']].to_string(index=False, float_format=lambda x: f'{x:.2f}'))
+    # steps under 0.05 seconds are too short to compare
+    slower = merged[(merged['time_ratio'] > regression_ratio) & (merged['seconds_baseline'] >= 0.05)]
+    # memory below 10 MB is too small to compare
+    bigger = merged[(merged['memory_ratio'] > regression_ratio) & (merged['peak_mb_baseline'] >= 10)]
+    for _, row in pd.concat([slower, bigger]).drop_duplicates(keys).iterrows():
+        print(f"regression: {row['scale']} {row['script']} {row['step']}")
+    for _, row in missing.iterrows():
+        side = 'this run' if row['_merge'] == 'right_only' else 'the baseline'
+        print(f"missing in {side}: {row['scale']} {row['script']} {row['step']}")
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark the scripts on synthetic PatentsView data')
+    parser.add_argument('--scales', nargs='+', default=['100k'], help=f"named scales ({', '.join(scales)}) "
+                                                                       'or numbers of patents')
+    parser.add_argument('--work-dir', default='benchmark_data', help='folder of the generated tables')
+    parser.add_argument('--output', default='benchmark_results.csv', help='csv the results are appended to')
+    parser.add_argument('--baseline', default=None, help='earlier results csv to compare with')
+    parser.add_argument('--fresh', action='store_true', help='remove the caches before every scale')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rows = []
+    for scale in args.scales:
+        rows += benchmark_scale(scale, args.work_dir, args.seed, args.fresh)
+    results = pd.DataFrame(rows)
+    results.insert(0, 'run', time.strftime('%Y-%m-%d %H:%M:%S'))
+    results.to_csv(args.output, mode='a', index=False, header=not os.path.exists(args.output))
+    print()
+    print(results.drop(columns='run').to_string(index=False))
+    print(f"results have been appended to '{args.output}'.")
+    if args.baseline:
+        print()
+        compare_with_baseline(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+'''
+checkpoints of the steps of the patent_whole_data_* scripts
+
+Steps 1 to 4 of these scripts read and join the big tables. a crash or an out of memory error in a later step
+used to lose all of that work. now the state after every step (the frames the next step needs) is written to
+a pickle file, and a rerun resumes from the last step that has a valid checkpoint.
+
+every checkpoint is keyed by a hash of:
+- the key of the step before it (the keys are chained, so a change in Step 1 also invalidates Steps 2 to 4)
+- the parameters of the step (e.g. the selected words, the cpc sequence, the columns and dtypes it reads)
+- the name, size and modification time of the input files of the step
+- the code of the step: the source of the step function and of every function and class of the project it
+  calls (also through other functions and in other modules, e.g. read_tsv, prepare_assignees) and the values
+  of the plain globals they read (column lists, dtypes, mappings). code the step does not call is not part
+  of the key
+the aggregation and the output (Steps 5 and 6) are not part of any key, so changing the output columns or the
+aggregation reruns only these steps. files are written to a temporary name and renamed, so a crash while
+writing never leaves a broken checkpoint. a checkpoint that can not be read is ignored.
+
+checkpoints are kept in 'checkpoints/<script>/', only the last one of every step is kept.
+'''
+
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import re
+import sys
+
+checkpoint_dir_name = 'checkpoints'
+
+# types of the globals whose value is part of the key of a step
+value_types = (str, int, float, bool, list, tuple, dict, set, frozenset, type(None), re.Pattern)
+# globals that are filled while the scripts run (the scan and memory reports), not settings of a step
+runtime_globals = {'tsv_cache.scan_log', 'patent_schema.memory_log'}
+
+
+class Step:
+    '''
+    one checkpointed step: run(state) takes the state (a dict of frames) of the step before it
+    and gives the state after this step. setup() is called before run when the step runs (not when it is
+    resumed), it must not change the state (e.g. it starts reading the tables of the next steps), so it is
+    not part of the key
+    '''
+
+    def __init__(self, name, run, params=None, files=(), setup=None):
+        self.name = name
+        self.run = run
+        self.params = params or {}
+        self.files = list(files)
+        self.setup = setup
+
+
+# Function to describe an input file by name, size and modification time
+def file_signature(file_path):
+    stat = os.stat(file_path)
+    return [os.path.basename(file_path), stat.st_size, stat.st_mtime_ns]
+
+
+# Function to get the global names used by a code object and by the code objects inside it
+def code_names(code):
+    names = set(code.co_names)
+    for constant in code.co_consts:
+        if inspect.iscode(constant):
+            names |= code_names(constant)
+    return names
+
+
+# Function to check that a function, class or module is defined in a module of the project (a file in the
+# directory)
+def is_project_object(value, directory):
+    module = value if inspect.ismodule(value) else sys.modules.get(getattr(value, '__module__', None) or '')
+    file_path = getattr(module, '__file__', None)
+    return file_path is not None and os.path.dirname(os.path.abspath(file_path)) == directory
+
+
+def source_of(item):
+    try:
+        return inspect.getsource(item)
+    except (OSError, TypeError):
+        return item.__qualname__
+
+
+# sets are sorted, their order changes from one run to the next
+def stable_repr(value):
+    if isinstance(value, (set, frozenset)):
+        return repr(sorted(value, key=repr))
+    return repr(value)
+
+
+# Function to get the code objects of a function or of the methods of a class
+def item_codes(item):
+    if not inspect.isclass(item):
+        return [item.__code__]
+    codes = []
+    for member in vars(item).values():
+        if isinstance(member, (staticmethod, classmethod)):
+            member = member.__func__
+        elif isinstance(member, property):
+            member = member.fget
+        if inspect.isfunction(member):
+            codes.append(member.__code__)
+    return codes
+
+
+# Function to get the code a step function depends on: the source of every function and class of the project
+# it calls (also through other functions and in other modules) and the values of the plain globals they read
+# (column lists, dtypes, mappings, default arguments). only what the step uses is part of it, so an edit of
+# code that only a later step uses (e.g. the aggregation) keeps the key
+def step_source(function):
+    directory = os.path.dirname(os.path.abspath(sys.modules[function.__module__].__file__))
+    sources, values = {}, {}
+    pending = [function]
+    while pending:
+        item = inspect.unwrap(pending.pop())
+        name = f'{item.__module__}.{item.__qualname__}'
+        if name in sources:
+            continue
+        sources[name] = source_of(item)
+        defaults = [] if inspect.isclass(item) else list(item.__defaults__ or ()) + list(
+            (item.__kwdefaults__ or {}).values())
+        for i, default in enumerate(defaults):
+            if isinstance(default, value_types):
+                values[f'{name}:default{i}'] = stable_repr(default)
+
+        module_globals = vars(sys.modules[item.__module__])
+        names = set()
+        for code in item_codes(item):
+            names |= code_names(code)
+        # the globals the code reads, and the attributes it reads of the project modules it uses
+        # (selected_words.g_patent)
+        used = [(f"{item.__module__}.{n}", module_globals[n]) for n in names if n in module_globals]
+        for module in [value for _, value in used if inspect.ismodule(value)]:
+            if is_project_object(module, directory):
+                used += [(f'{module.__name__}.{n}', getattr(module, n)) for n in names if hasattr(module, n)]
+        for global_name, value in used:
+            if inspect.isfunction(value) or inspect.isclass(value):
+                if is_project_object(value, directory):
+                    pending.append(value)
+            elif isinstance(value, value_types) and global_name not in runtime_globals:
+                values[global_name] = stable_repr(value)
+
+    return {'functions': [sources[name] for name in sorted(sources)], 'values': values}
+
+
+# Function to compute the key of a step from the key of the step before it
+def step_key(step, parent_key=''):
+    description = {'parent': parent_key, 'step': step.name, 'params': step.params, 'source': step_source(step.run),
+                   'files': [file_signature(file_path) for file_path in step.files]}
+    return hashlib.sha1(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def slug(name):
+    return ''.join(c if c.isalnum() else '_' for c in name).strip('_')
+
+
+class CheckpointStore:
+    '''
+    checkpoints of one script
+    '''
+
+    def __init__(self, script, checkpoint_dir=checkpoint_dir_name):
+        self.directory = os.path.join(checkpoint_dir, script)
+
+    def path(self, step, key):
+        return os.path.join(self.directory, f'{slug(step.name)}-{key[:16]}.pkl')
+
+    # Function to load the state of a step, None if there is no valid checkpoint
+    def load(self, step, key):
+        path = self.path(step, key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except Exception as error:
+            print(f"checkpoint '{path}' can not be read ({error}), it is ignored.")
+            return None
+
+    # Function to write the state of a step and remove its older checkpoints
+    def save(self, step, key, state):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(step, key)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+        prefix = slug(step.name) + '-'
+        for file_name in os.listdir(self.directory):
+            if file_name.startswith(prefix) and os.path.join(self.directory, file_name) != path:
+                os.remove(os.path.join(self.directory, file_name))
+
+    # Function to remove all checkpoints of the script
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for file_name in os.listdir(self.directory):
+                os.remove(os.path.join(self.directory, file_name))
+
+
+# Function to run the steps in order, resuming from the last step with a valid checkpoint
+# with store=None the steps run without checkpoints
+def run_steps(steps, store, profiler, state=None):
+    state = state or {}
+    if store is None:
+        for step in steps:
+            if step.setup is not None:
+                step.setup()
+            state = step.run(state)
+        return state
+
+    keys = []
+    parent_key = ''
+    for step in steps:
+        parent_key = step_key(step, parent_key)
+        keys.append(parent_key)
+
+    start = 0
+    for i in reversed(range(len(steps))):
+        if not os.path.exists(store.path(steps[i], keys[i])):
+            continue
+        with profiler.stage(f'resume from {steps[i].name}'):
+            loaded = store.load(steps[i], keys[i])
+        if loaded is not None:
+            print(f"resumed from the checkpoint of '{steps[i].name}' in '{store.directory}'.")
+            print()
+            state = loaded
+            start = i + 1
+            break
+
+    for step, key in zip(steps[start:], keys[start:]):
+        if step.setup is not None:
+            step.setup()
+        state = step.run(state)
+        with profiler.stage(f'checkpoint {step.name}', quiet=True):
+            store.save(step, key, state)
+    return state
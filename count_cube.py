@@ -0,0 +1,256 @@
+'''
+precomputed counts of distinct patents by grant year, CPC, country and assignee type
+
+num_patent_cpc.py and num_patent_text&cpc.py print counts like "Number of distinct patent IDs with
+sequence=0 and CPC prefix", which read and deduplicate a whole table every time. this cube is built once per
+release (g_patent.tsv.cube next to the TSV) and answers counts and trends without reading the tables:
+- dims.parquet: the patent-level dimension table, the distinct combinations of year (of patent_date),
+  cpc_section / cpc_class / cpc_subclass (of the cpc_sequence == 0 rows), disambig_country (of the assignee
+  locations) and assignee_type_unified of every patent
+- cube.parquet: the number of distinct patents of every group of every grouping set (no CPC level or one of
+  the three, with or without year, country and assignee type: 32 grouping sets)
+- meta.json: size and modification time of the four source TSVs, the version of the assignee logic
+  (assignee_table.assignee_logic_version) and the dimensions with one value per patent. the cube is out of
+  date when a source or the assignee logic changes
+
+a query with filters and group-by dimensions is answered from the grouping set of exactly these dimensions,
+summing the groups of the filter values. a sum over several values only counts every patent once when the
+dimension has one value per patent (year and the primary CPC); a patent with assignees in two countries is in
+both country groups. so a filter with several values of such a dimension is answered from dims.parquet.
+missing values (a patent without cpc row or assignee) are a group of their own.
+keyword predicates still need the text scan of the scripts.
+
+usage:
+python count_cube.py build g_patent.tsv g_cpc_current.tsv g_assignee_disambiguated.tsv g_location_disambiguated.tsv
+python count_cube.py count g_patent.tsv --subclass F24S H02S
+python count_cube.py count g_patent.tsv --subclass F24S H02S --by year
+python count_cube.py count g_patent.tsv --country US JP --year 2015-2020 --by assignee_type
+'''
+
+import argparse
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from assignee_table import assignee_logic_version, assignee_type_mapping_reg, assignee_type_mapping_unified
+from dimension_arrays import LocationDimension, decode_assignee_types, unify_types
+from fact_table import source_signatures
+from tsv_cache import pq, read_tsv
+
+cpc_levels = ['cpc_section', 'cpc_class', 'cpc_subclass']
+other_dims = ['year', 'disambig_country', 'assignee_type_unified']
+dims = ['year'] + cpc_levels + ['disambig_country', 'assignee_type_unified']
+
+# short names of the dimensions for the command line
+dim_names = {'year': 'year', 'section': 'cpc_section', 'class': 'cpc_class', 'subclass': 'cpc_subclass',
+             'country': 'disambig_country', 'assignee_type': 'assignee_type_unified'}
+
+
+def default_cube_dir(file_path):
+    return file_path + '.cube'
+
+
+# Function to check that a cube exists and was built from the current versions of the four TSVs, with the
+# current assignee logic
+def cube_is_current(g_patent, g_cpc, g_assignee, g_location, cube_dir=None):
+    if pq is None:
+        return False
+    meta_path = os.path.join(cube_dir or default_cube_dir(g_patent), 'meta.json')
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return (meta['sources'] == source_signatures([g_patent, g_cpc, g_assignee, g_location])
+            and meta.get('assignee_logic') == assignee_logic_version())
+
+
+# Function to list the grouping sets: no CPC level or one of them, with any of the other dimensions
+def grouping_sets():
+    sets = []
+    for cpc_level in [None] + cpc_levels:
+        for size in range(len(other_dims) + 1):
+            for others in itertools.combinations(other_dims, size):
+                grouping = [d for d in dims if d in others or d == cpc_level]
+                sets.append(grouping)
+    return sets
+
+
+def grouping_name(grouping):
+    return ','.join(grouping)
+
+
+# Function to build the patent-level dimension table: the distinct dimension values of every patent
+def build_dimension_table(g_patent, g_cpc, g_assignee, g_location):
+    patents = read_tsv(g_patent, usecols=['patent_id', 'patent_date'], dtype=str)
+    patents['year'] = pd.to_numeric(patents['patent_date'].str[:4], errors='coerce').astype('Int16')
+    patents = patents.drop(columns='patent_date').drop_duplicates('patent_id')
+
+    g_cpc_df = read_tsv(g_cpc, usecols=['patent_id', 'cpc_sequence'] + cpc_levels, dtype=str)
+    g_cpc_df = g_cpc_df[g_cpc_df['cpc_sequence'] == '0'][['patent_id'] + cpc_levels].drop_duplicates()
+
+    g_assignee_df = read_tsv(g_assignee, usecols=['patent_id', 'assignee_type', 'location_id'], dtype=str)
+    g_location_df = read_tsv(g_location, usecols=['location_id', 'disambig_country'], dtype=str)
+    g_assignee_df = LocationDimension(g_location_df, columns=['disambig_country']).join(g_assignee_df)
+    # the unified type of the scripts: assignee_type -> assignee_type_reg -> assignee_type_unified
+    assignee_type_reg = decode_assignee_types(g_assignee_df['assignee_type'].fillna('0').astype(int),
+                                              assignee_type_mapping_reg)
+    g_assignee_df['assignee_type_unified'] = unify_types(assignee_type_reg, assignee_type_mapping_unified)
+    g_assignee_df = g_assignee_df[['patent_id', 'disambig_country', 'assignee_type_unified']].drop_duplicates()
+
+    # patents that are only in g_cpc or g_assignee count too, with a missing year
+    other_ids = pd.Index(g_cpc_df['patent_id']).union(pd.Index(g_assignee_df['patent_id'])).difference(
+        pd.Index(patents['patent_id']))
+    if len(other_ids):
+        patents = pd.concat([patents, pd.DataFrame({'patent_id': other_ids.to_numpy(dtype=object)})],
+                            ignore_index=True)
+
+    rows = pd.merge(patents, g_cpc_df, on='patent_id', how='left')
+    rows = pd.merge(rows, g_assignee_df, on='patent_id', how='left')
+    rows['patent_key'] = pd.factorize(rows['patent_id'])[0].astype(np.int64)
+    rows = rows.drop(columns='patent_id')
+    for column in dims[1:]:
+        rows[column] = rows[column].astype('category')
+    return rows[['patent_key'] + dims]
+
+
+# Function to count the distinct patents of every group of a grouping set
+def count_grouping(rows, grouping):
+    if not grouping:
+        return pd.DataFrame({'num_patents': [rows['patent_key'].nunique()]})
+    counts = rows.groupby(grouping, observed=True, dropna=False)['patent_key'].nunique()
+    return counts.rename('num_patents').reset_index()
+
+
+# Function to build the cube of a release
+def build_cube(g_patent, g_cpc, g_assignee, g_location, cube_dir=None):
+    if pq is None:
+        raise ImportError('the count cube needs the pyarrow package')
+    cube_dir = cube_dir or default_cube_dir(g_patent)
+    os.makedirs(cube_dir, exist_ok=True)
+    sources = source_signatures([g_patent, g_cpc, g_assignee, g_location])
+    start_time = time.time()
+
+    rows = build_dimension_table(g_patent, g_cpc, g_assignee, g_location)
+    print(f'dimension table of {rows["patent_key"].nunique()} patents, {len(rows)} rows '
+          f'({time.time() - start_time:.0f} seconds)')
+    values_per_patent = rows.groupby('patent_key')[dims].nunique(dropna=False).max()
+    single_valued = [d for d in dims if values_per_patent[d] <= 1]
+
+    parts = []
+    for grouping in grouping_sets():
+        part = count_grouping(rows, grouping)
+        part.insert(0, 'grouping', grouping_name(grouping))
+        parts.append(part)
+    cube = pd.concat(parts, ignore_index=True)
+    for column in dims[1:]:
+        cube[column] = cube[column].astype(object)
+    cube['year'] = cube['year'].astype('Int16')
+    cube['grouping'] = cube['grouping'].astype('category')
+
+    rows.to_parquet(os.path.join(cube_dir, 'dims.parquet'), index=False)
+    cube.to_parquet(os.path.join(cube_dir, 'cube.parquet'), index=False)
+    meta = {'sources': sources, 'assignee_logic': assignee_logic_version(), 'patents': int(rows['patent_key'].nunique()),
+            'dimension_rows': len(rows), 'cube_rows': len(cube), 'single_valued': single_valued}
+    with open(os.path.join(cube_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=1)
+    print(f'cube of {len(cube)} groups stored in {cube_dir} ({time.time() - start_time:.0f} seconds)')
+    return meta
+
+
+class CountCube:
+    def __init__(self, cube_dir):
+        self.cube_dir = cube_dir
+        with open(os.path.join(cube_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.cube = pd.read_parquet(os.path.join(cube_dir, 'cube.parquet'))
+        self.cube_groups = {name: rows for name, rows in self.cube.groupby('grouping', observed=True)}
+        self.rows = None
+
+    # Function to load the patent-level dimension table (only for queries the cube can not sum)
+    def dimension_table(self):
+        if self.rows is None:
+            self.rows = pd.read_parquet(os.path.join(self.cube_dir, 'dims.parquet'))
+        return self.rows
+
+    # Function to count the distinct patents that match filters ({dimension: value or list of values}),
+    # gives a number, or with by (list of dimensions) a frame of the counts of every group
+    def count(self, filters=None, by=None):
+        filters = {d: list(v) if isinstance(v, (list, tuple, set)) else [v] for d, v in (filters or {}).items()}
+        if 'year' in filters:
+            filters['year'] = [int(year) for year in filters['year']]
+        by = list(by or [])
+        grouping = [d for d in dims if d in filters or d in by]
+        name = grouping_name(grouping)
+        summable = all(len(values) == 1 or d in self.meta['single_valued'] for d, values in filters.items())
+
+        if name in self.cube_groups and summable:
+            rows = self.cube_groups[name]
+            count_column = 'num_patents'
+        else:
+            # several values of a dimension with more than one value per patent, or two CPC levels
+            rows = self.dimension_table()
+            count_column = 'patent_key'
+        mask = np.ones(len(rows), dtype=bool)
+        for d, values in filters.items():
+            mask &= rows[d].isin(values).to_numpy()
+        rows = rows[mask]
+
+        if count_column == 'num_patents':
+            if not by:
+                return int(rows['num_patents'].sum())
+            counts = rows.groupby(by, dropna=False)['num_patents'].sum()
+        else:
+            if not by:
+                return int(rows['patent_key'].nunique())
+            counts = rows.groupby(by, observed=True, dropna=False)['patent_key'].nunique()
+        return counts.rename('num_patents').reset_index().sort_values(by, ignore_index=True)
+
+
+# Function to turn year arguments ('2015' or '2015-2020') into a list of years
+def parse_years(values):
+    years = []
+    for value in values:
+        first, _, last = value.partition('-')
+        years += list(range(int(first), int(last or first) + 1))
+    return years
+
+
+def main():
+    parser = argparse.ArgumentParser(description='precomputed distinct patent counts')
+    parser.add_argument('command', choices=['build', 'count'])
+    parser.add_argument('g_patent', help='g_patent TSV')
+    parser.add_argument('tables', nargs='*', help='build: g_cpc, g_assignee and g_location TSVs')
+    parser.add_argument('--cube-dir', default=None)
+    parser.add_argument('--year', nargs='+', default=None, help="years or ranges like '2015-2020'")
+    for name in dim_names:
+        if name != 'year':
+            parser.add_argument('--' + name.replace('_', '-'), nargs='+', default=None, dest=name)
+    parser.add_argument('--by', nargs='+', default=[], choices=list(dim_names), help='dimensions to group by')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        if len(args.tables) != 3:
+            parser.error('build needs the g_cpc, g_assignee and g_location TSVs')
+        build_cube(args.g_patent, *args.tables, cube_dir=args.cube_dir)
+        return
+
+    cube = CountCube(args.cube_dir or default_cube_dir(args.g_patent))
+    filters = {dim_names[name]: getattr(args, name) for name in dim_names if getattr(args, name)}
+    if args.year:
+        filters['year'] = parse_years(args.year)
+    start_time = time.time()
+    result = cube.count(filters, by=[dim_names[name] for name in args.by])
+    seconds = time.time() - start_time
+    if isinstance(result, int):
+        print('Number of distinct patent IDs:', result)
+    else:
+        print(result.to_string(index=False))
+    print(f'({seconds * 1000:.1f} ms)')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+'''
+partitioned CPC store built from g_cpc_current.tsv
+
+the CPC scripts read every row of g_cpc_current to keep the cpc_sequence == 0 rows of a few subclasses.
+this store is built once per release (g_cpc_current.tsv.store next to the TSV):
+- primary/<subclass>.parquet: the primary classification (cpc_sequence == 0), one file per cpc_subclass,
+  sorted by cpc_group, so a subclass query only opens its own file and a group query is a binary search
+- all/<class>.parquet: all rows, one file per cpc_class, for queries on other sequences
+- meta.json: size and modification time of the source TSV and the rows / patents of every partition
+
+section, class, subclass and group codes are all prefixes of cpc_group ('H', 'H02', 'H02S', 'H02S10/', 'H02S10/40'),
+so every level is answered with the same prefix query. rows come back in the order of the TSV.
+
+usage:
+python cpc_store.py build g_cpc_current.tsv
+python cpc_store.py count g_cpc_current.tsv F24S H02S
+python cpc_store.py count g_cpc_current.tsv Y02E10/5 --prefix
+'''
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from tsv_cache import iter_tsv_chunks, pa, pq
+
+store_columns = ['patent_id', 'cpc_sequence', 'cpc_section', 'cpc_class', 'cpc_subclass', 'cpc_group']
+build_chunksize = 1000000
+# partition name of the rows without a code
+no_code = '_none'
+
+
+def default_store_dir(file_path):
+    return file_path + '.store'
+
+
+def partition_name(code):
+    return code if isinstance(code, str) and code else no_code
+
+
+# Function to build the store of a g_cpc TSV
+def build_store(file_path, store_dir=None, chunksize=build_chunksize):
+    if pq is None:
+        raise ImportError('the CPC store needs the pyarrow package')
+    store_dir = store_dir or default_store_dir(file_path)
+    os.makedirs(os.path.join(store_dir, 'primary'), exist_ok=True)
+    os.makedirs(os.path.join(store_dir, 'all'), exist_ok=True)
+    stat = os.stat(file_path)
+
+    schema = None
+    class_writers = {}
+    class_rows = {}
+    primary_chunks = []
+    num_rows = 0
+    start_time = time.time()
+    try:
+        for chunk in iter_tsv_chunks(file_path, usecols=store_columns, dtype=str, chunksize=chunksize):
+            chunk = chunk.copy()
+            chunk['row_number'] = chunk.index.to_numpy(dtype=np.int64)
+            if schema is None:
+                schema = pa.schema([(c, pa.int64() if c == 'row_number' else pa.string()) for c in chunk.columns])
+            primary_chunks.append(chunk[chunk['cpc_sequence'] == '0'])
+
+            for cpc_class, rows in chunk.groupby(chunk['cpc_class'].map(partition_name), sort=False):
+                if cpc_class not in class_writers:
+                    class_writers[cpc_class] = pq.ParquetWriter(
+                        os.path.join(store_dir, 'all', cpc_class + '.parquet'), schema, compression='zstd')
+                class_writers[cpc_class].write_table(pa.Table.from_pandas(rows, schema=schema, preserve_index=False))
+                class_rows[cpc_class] = class_rows.get(cpc_class, 0) + len(rows)
+            num_rows += len(chunk)
+            print(f'read {num_rows} CPC rows ({time.time() - start_time:.0f} seconds)')
+    finally:
+        for writer in class_writers.values():
+            writer.close()
+
+    primary = pd.concat(primary_chunks) if primary_chunks else pd.DataFrame(columns=store_columns + ['row_number'])
+    primary['sort_group'] = primary['cpc_group'].fillna('')
+    primary = primary.sort_values(['sort_group', 'row_number'], kind='stable').drop(columns='sort_group')
+    subclass_meta = {}
+    for subclass, rows in primary.groupby(primary['cpc_subclass'].map(partition_name), sort=True):
+        rows.to_parquet(os.path.join(store_dir, 'primary', subclass + '.parquet'), index=False, compression='zstd')
+        subclass_meta[subclass] = {'rows': len(rows), 'patents': int(rows['patent_id'].nunique())}
+
+    meta = {'source': os.path.basename(file_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'rows': num_rows, 'columns': [c for c in schema.names if c != 'row_number'] if schema else store_columns,
+            'primary': subclass_meta, 'all': class_rows}
+    with open(os.path.join(store_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=1)
+    print(f'CPC store of {num_rows} rows ({len(subclass_meta)} primary subclasses) stored in {store_dir}')
+    return meta
+
+
+# Function to check that a store exists and was built from the current version of the TSV
+def store_is_current(file_path, store_dir=None):
+    if pq is None:
+        return False
+    meta_path = os.path.join(store_dir or default_store_dir(file_path), 'meta.json')
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    stat = os.stat(file_path)
+    return meta['size'] == stat.st_size and meta['mtime_ns'] == stat.st_mtime_ns
+
+
+class CpcStore:
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+
+    # Function to read one partition file
+    def _read_partition(self, kind, name, columns):
+        path = os.path.join(self.store_dir, kind, name + '.parquet')
+        read_columns = list(dict.fromkeys(columns + ['cpc_group', 'cpc_subclass', 'cpc_sequence', 'row_number']))
+        df = pq.read_table(path, columns=read_columns).to_pandas()
+        for column in df.columns:
+            if column != 'row_number':
+                df[column] = df[column].where(df[column].notna(), np.nan)
+        return df
+
+    # Function to get the rows of the given subclasses (exact codes) and/or code prefixes
+    # sequence='0' reads the primary partitions, another sequence or None (all) reads the class partitions
+    # columns: output columns (in TSV order), rows in the order of the TSV
+    def query(self, subclasses=None, prefixes=None, sequence='0', columns=None):
+        columns = [c for c in self.meta['columns'] if columns is None or c in columns]
+        subclasses = set(subclasses or [])
+        prefixes = list(prefixes or [])
+
+        if sequence is not None and str(sequence) == '0':
+            kind, partitions = 'primary', self.meta['primary']
+            wanted = lambda name: name in subclasses or any(
+                name.startswith(p) or p.startswith(name) for p in prefixes)
+        else:
+            kind, partitions = 'all', self.meta['all']
+            wanted = lambda name: any(s.startswith(name) for s in subclasses) or any(
+                name.startswith(p) or p.startswith(name) for p in prefixes)
+
+        parts = []
+        for name in sorted(partitions):
+            if name == no_code or not wanted(name):
+                continue
+            df = self._read_partition(kind, name, columns)
+            mask = df['cpc_subclass'].isin(subclasses).to_numpy()
+            if prefixes:
+                groups = df['cpc_group'].fillna('').to_numpy(dtype=object)
+                if kind == 'primary':
+                    # sorted by cpc_group: every prefix is one contiguous range
+                    for prefix in prefixes:
+                        start = np.searchsorted(groups, prefix, side='left')
+                        end = np.searchsorted(groups, prefix + '\uffff', side='left')
+                        mask[start:end] = True
+                else:
+                    mask |= df['cpc_group'].fillna('').str.startswith(tuple(prefixes)).to_numpy()
+            if sequence is not None:
+                mask &= (df['cpc_sequence'] == str(sequence)).to_numpy()
+            parts.append(df[mask])
+
+        if not parts:
+            return pd.DataFrame(columns=columns, dtype=object)
+        result = pd.concat(parts).sort_values('row_number', kind='stable')
+        return result[columns].reset_index(drop=True)
+
+    # Function to count the distinct patents of a query
+    def count_patents(self, subclasses=None, prefixes=None, sequence='0'):
+        return self.query(subclasses, prefixes, sequence, columns=['patent_id'])['patent_id'].nunique()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='partitioned CPC store')
+    parser.add_argument('command', choices=['build', 'count'])
+    parser.add_argument('file_path', help='g_cpc_current TSV')
+    parser.add_argument('codes', nargs='*', help='CPC subclasses (or prefixes with --prefix) to count')
+    parser.add_argument('--prefix', action='store_true', help='treat the codes as section/class/subclass/group prefixes')
+    parser.add_argument('--sequence', default='0', help="cpc_sequence to count, 'all' for every sequence")
+    parser.add_argument('--store-dir', default=None)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_store(args.file_path, args.store_dir)
+        return
+    store = CpcStore(args.store_dir or default_store_dir(args.file_path))
+    sequence = None if args.sequence == 'all' else args.sequence
+    start_time = time.time()
+    if args.prefix:
+        num_patents = store.count_patents(prefixes=args.codes, sequence=sequence)
+    else:
+        num_patents = store.count_patents(subclasses=args.codes, sequence=sequence)
+    print(f"Number of distinct patent IDs: {num_patents} ({(time.time() - start_time) * 1000:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
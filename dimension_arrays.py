@@ -0,0 +1,95 @@
+'''
+array-backed lookups of the location and assignee type dimensions
+
+Step 4 of the patent_whole_data_* scripts merged g_location onto every assignee row (a hash join that copies
+every column of the joined rows) only to add disambig_state and disambig_country, and Step 3 decoded
+assignee_type with Series.map of a python dict. here the dimensions are built once into arrays:
+- LocationDimension: the location ids are mapped to a dense index 0..n-1, state and country are dictionary
+  encoded (an int32 code per location and the array of the distinct values). the rows of a table get their
+  index with one vectorized lookup of their location_id, and the two columns are gathered with numpy
+  indexing. a location_id that is not in g_location gets NaN, as with the left join.
+- assignee types: the codes 0..9 index an array of the names, 'Unknown' for codes without a name, as
+  .map(assignee_type_mapping_reg).fillna('Unknown') gives.
+- unified types: the distinct assignee_type_reg values are mapped once and gathered by their codes.
+the results are the same as the merge and the map, the merge is still used when g_location has a
+location_id more than once (the join would repeat the rows).
+
+usage (in a script):
+locations = LocationDimension(g_location_df)
+final_data = locations.join(final_data)
+g_assignee_df['assignee_type_reg'] = decode_assignee_types(g_assignee_df['assignee_type'], assignee_type_mapping_reg)
+'''
+
+import numpy as np
+import pandas as pd
+
+location_columns = ['disambig_state', 'disambig_country']
+unknown_type = 'Unknown'
+
+
+# Function to dictionary encode a column: an int32 code per row (-1 for missing) and the distinct values
+def encode_column(values):
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    return codes.astype(np.int32), np.append(np.asarray(uniques, dtype=object), np.nan)
+
+
+class LocationDimension:
+    '''
+    g_location as arrays: a dense index of the location ids and the dictionary encoded columns
+    '''
+
+    def __init__(self, g_location_df, columns=location_columns):
+        self.columns = list(columns)
+        self.ids = pd.Index(g_location_df['location_id'].to_numpy(dtype=object))
+        self.unique = self.ids.is_unique
+        self.g_location_df = g_location_df
+        # the code -1 (missing value) indexes the NaN at the end of the values
+        self.encoded = {column: encode_column(g_location_df[column]) for column in self.columns}
+
+    # Function to find the dense index of every location_id (-1 when it is not in g_location)
+    def positions(self, location_ids):
+        return self.ids.get_indexer(pd.Series(location_ids, dtype=object).to_numpy(dtype=object))
+
+    # Function to gather a column for the rows at the given positions (NaN for -1)
+    def gather(self, positions, column):
+        codes, values = self.encoded[column]
+        if not len(codes):
+            return np.full(len(positions), np.nan, dtype=object)
+        row_codes = np.where(positions >= 0, codes[positions], -1)
+        return values[row_codes]
+
+    # Function to add the location columns to a table by its location_id, the same as a left join on location_id
+    def join(self, df):
+        if not self.unique:
+            return pd.merge(df, self.g_location_df[['location_id'] + self.columns], on='location_id', how='left')
+        df = df.reset_index(drop=True)
+        positions = self.positions(df['location_id'])
+        for column in self.columns:
+            df[column] = self.gather(positions, column)
+        return df
+
+
+# Function to build the array of the assignee type names, indexed by the type code
+def assignee_type_names(assignee_type_mapping_reg):
+    names = np.full(max(assignee_type_mapping_reg) + 1, unknown_type, dtype=object)
+    for code, name in assignee_type_mapping_reg.items():
+        names[code] = name
+    return names
+
+
+# Function to decode the integer assignee types into their names, the same as
+# .map(assignee_type_mapping_reg).fillna('Unknown').astype(str)
+def decode_assignee_types(assignee_type, assignee_type_mapping_reg):
+    names = assignee_type_names(assignee_type_mapping_reg)
+    codes = np.asarray(assignee_type, dtype=np.int64)
+    known = (codes >= 0) & (codes < len(names))
+    return np.where(known, names[np.where(known, codes, 0)], unknown_type)
+
+
+# Function to map every assignee_type_reg value to its unified type (unknown types are kept as they are,
+# without the spaces around them), each distinct value is mapped once
+def unify_types(assignee_type_reg, assignee_type_mapping_unified):
+    codes, uniques = pd.factorize(pd.Series(assignee_type_reg, dtype=object), use_na_sentinel=False)
+    stripped = pd.Series(uniques, dtype=object).astype(str).str.strip()
+    unified = stripped.map(assignee_type_mapping_unified).fillna(stripped).to_numpy(dtype=object)
+    return unified[codes]
@@ -0,0 +1,216 @@
+'''
+pre-joined fact table of all patents, for the enrichment of patent lists
+
+patent_whole_data_patent_list.py joins g_patent, the first cpc code of g_cpc, g_assignee and g_location for
+the patents of a list. even for a few hundred patents every run read and joined the big tables again.
+this table holds the joined rows of every patent (before the assignee aggregation of Step 5), built once
+per release (g_patent.tsv.facts next to the TSV):
+- rows.arrow: the joined rows sorted by patent, as an uncompressed arrow file. the rows of a patent are in
+  the order the left joins of the script give (cpc rows, then assignee rows, in the order of the TSVs)
+- keys.npy: the int64 key (patent_schema.encode_patent_id) of every patent, sorted
+- starts.npy: the first row of every patent in rows.arrow (one more entry for the end)
+- meta.json: size and modification time of the four source TSVs and the version of the assignee logic
+  (assignee_table.assignee_logic_version), the table is out of date when either changes
+
+a list is enriched with a binary search of its keys in keys.npy and a gather of their rows from rows.arrow.
+both are memory mapped, so a lookup only reads the pages of the rows it needs (compressed row groups, as in
+the parquet caches, would have to be decompressed whole for every patent). patents of g_cpc or g_assignee that are not in g_patent are in the table too,
+with empty g_patent columns, as the left joins of the script give them.
+
+usage:
+python fact_table.py build g_patent.tsv g_cpc_current.tsv g_assignee_disambiguated.tsv g_location_disambiguated.tsv
+python fact_table.py lookup g_patent.tsv 10000000 10000001
+'''
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from assignee_table import (assignee_logic_version, convert_assignee_sequence, g_assignee_columns, g_assignee_dtype,
+                            prepare_assignees)
+from dimension_arrays import LocationDimension
+from patent_schema import encode_patent_id, patent_id_pattern, prefix_codes
+from tsv_cache import pa, read_tsv
+
+# patents joined and written at a time while building
+build_patents = 500000
+
+patent_columns = ['patent_id', 'patent_date', 'patent_type', 'patent_abstract', 'patent_title']
+cpc_columns = ['patent_id', 'cpc_subclass', 'cpc_sequence']
+location_columns = ['location_id', 'disambig_state', 'disambig_country']
+# integer columns of the table, the other columns are strings
+int_columns = ['assignee_sequence', 'assignee_type']
+
+
+def default_fact_dir(file_path):
+    return file_path + '.facts'
+
+
+def source_signatures(file_paths):
+    signatures = {}
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        signatures[os.path.basename(file_path)] = [stat.st_size, stat.st_mtime_ns]
+    return signatures
+
+
+# Function to check that a fact table exists and was built from the current versions of the four TSVs, with
+# the current assignee logic
+def fact_table_is_current(g_patent, g_cpc, g_assignee, g_location, fact_dir=None):
+    if pa is None:
+        return False
+    meta_path = os.path.join(fact_dir or default_fact_dir(g_patent), 'meta.json')
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return (meta['sources'] == source_signatures([g_patent, g_cpc, g_assignee, g_location])
+            and meta.get('assignee_logic') == assignee_logic_version())
+
+
+# Function to read g_assignee and add assignee_type_reg and assignee_name, as Step 3 of the scripts does
+def read_assignees(g_assignee):
+    g_assignee_df = read_tsv(g_assignee, usecols=g_assignee_columns, dtype=g_assignee_dtype,
+                             converters={'assignee_sequence': convert_assignee_sequence})
+    return prepare_assignees(g_assignee_df)
+
+
+# Function to sort a table by patent key, the rows of a patent keep their order
+def sort_by_key(df):
+    keys = encode_patent_id(df['patent_id'].to_numpy(dtype=object))
+    order = np.argsort(keys, kind='stable')
+    return df.iloc[order].reset_index(drop=True), keys[order]
+
+
+# Function to build the fact table of a release
+def build_fact_table(g_patent, g_cpc, g_assignee, g_location, fact_dir=None, chunk_patents=build_patents):
+    if pa is None:
+        raise ImportError('the fact table needs the pyarrow package')
+    fact_dir = fact_dir or default_fact_dir(g_patent)
+    os.makedirs(fact_dir, exist_ok=True)
+    sources = source_signatures([g_patent, g_cpc, g_assignee, g_location])
+    start_time = time.time()
+
+    patents = read_tsv(g_patent, usecols=patent_columns, dtype=str)
+    g_cpc_df = read_tsv(g_cpc, usecols=cpc_columns, dtype=str)
+    g_cpc_df = g_cpc_df[g_cpc_df['cpc_sequence'] == '0']
+    g_assignee_df = read_assignees(g_assignee)
+    locations = LocationDimension(read_tsv(g_location, usecols=location_columns, dtype=str))
+    print(f'read the tables ({time.time() - start_time:.0f} seconds)')
+
+    # patents that are only in g_cpc or g_assignee get a row with empty g_patent columns
+    other_ids = pd.Index(g_cpc_df['patent_id'].dropna()).union(pd.Index(g_assignee_df['patent_id'].dropna()))
+    other_ids = other_ids.difference(pd.Index(patents['patent_id']))
+    if len(other_ids):
+        patents = pd.concat([patents, pd.DataFrame({'patent_id': other_ids.to_numpy(dtype=object)})],
+                            ignore_index=True)
+    patents, patent_keys = sort_by_key(patents)
+    g_cpc_df, cpc_keys = sort_by_key(g_cpc_df)
+    g_assignee_df, assignee_keys = sort_by_key(g_assignee_df)
+
+    writer = None
+    row_keys = []
+    num_rows = 0
+    temp_path = os.path.join(fact_dir, 'rows.arrow.tmp')
+    try:
+        for start in range(0, len(patents), chunk_patents):
+            chunk = patents.iloc[start:start + chunk_patents]
+            low, high = patent_keys[start], patent_keys[min(start + chunk_patents, len(patents)) - 1]
+            cpc_rows = g_cpc_df.iloc[np.searchsorted(cpc_keys, low):np.searchsorted(cpc_keys, high, side='right')]
+            assignee_rows = g_assignee_df.iloc[np.searchsorted(assignee_keys, low):
+                                               np.searchsorted(assignee_keys, high, side='right')]
+            rows = pd.merge(chunk, cpc_rows, on='patent_id', how='left')
+            rows = pd.merge(rows, assignee_rows, on='patent_id', how='left')
+            rows = locations.join(rows)
+            for column in int_columns:
+                rows[column] = rows[column].astype('Int64')
+            if writer is None:
+                schema = pa.schema([(c, pa.int64() if c in int_columns else pa.string()) for c in rows.columns])
+                writer = pa.ipc.new_file(temp_path, schema)
+            writer.write_table(pa.Table.from_pandas(rows, schema=schema, preserve_index=False))
+            row_keys.append(encode_patent_id(rows['patent_id'].to_numpy(dtype=object)))
+            num_rows += len(rows)
+            print(f'joined {min(start + chunk_patents, len(patents))} patents, {num_rows} rows '
+                  f'({time.time() - start_time:.0f} seconds)')
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(temp_path, os.path.join(fact_dir, 'rows.arrow'))
+
+    row_keys = np.concatenate(row_keys) if row_keys else np.zeros(0, dtype=np.int64)
+    keys, starts = np.unique(row_keys, return_index=True)
+    np.save(os.path.join(fact_dir, 'keys.npy'), keys.astype(np.int64))
+    np.save(os.path.join(fact_dir, 'starts.npy'), np.append(starts, len(row_keys)).astype(np.int64))
+    meta = {'sources': sources, 'assignee_logic': assignee_logic_version(), 'rows': num_rows, 'patents': len(keys),
+            'columns': schema.names if writer is not None else []}
+    with open(os.path.join(fact_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=1)
+    print(f'fact table of {len(keys)} patents ({num_rows} rows) stored in {fact_dir}')
+    return meta
+
+
+class FactTable:
+    def __init__(self, fact_dir):
+        self.fact_dir = fact_dir
+        with open(os.path.join(fact_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.keys = np.load(os.path.join(fact_dir, 'keys.npy'), mmap_mode='r')
+        self.starts = np.load(os.path.join(fact_dir, 'starts.npy'), mmap_mode='r')
+        # zero-copy table over the memory mapped file, nothing is read before a lookup
+        self.rows = pa.ipc.open_file(pa.memory_map(os.path.join(fact_dir, 'rows.arrow'))).read_all()
+
+    # Function to find the row numbers of the given patents (patents not in the table are left out)
+    def row_numbers(self, patent_ids):
+        patent_ids = pd.Series(pd.unique(pd.Series(patent_ids, dtype=object).dropna()), dtype=object)
+        parts = patent_ids.str.extract(patent_id_pattern)
+        valid = parts[1].notna() & parts[0].isin(prefix_codes)
+        wanted = np.unique(encode_patent_id(patent_ids[valid].to_numpy(dtype=object)))
+        positions = np.searchsorted(self.keys, wanted)
+        found = positions < len(self.keys)
+        found[found] = self.keys[positions[found]] == wanted[found]
+        positions = positions[found]
+        starts, ends = self.starts[positions], self.starts[positions + 1]
+        # row numbers starts[i] .. ends[i] - 1 of every found patent
+        lengths = ends - starts
+        offsets = np.repeat(starts - np.cumsum(np.append(0, lengths[:-1])), lengths)
+        return offsets + np.arange(lengths.sum())
+
+    # Function to get the joined rows of the given patents, sorted by patent
+    def lookup(self, patent_ids, columns=None):
+        rows = self.row_numbers(patent_ids)
+        columns = [c for c in self.meta['columns'] if columns is None or c in columns]
+        df = self.rows.select(columns).take(pa.array(rows, type=pa.int64())).to_pandas()
+        for column in df.columns:
+            if column not in int_columns:
+                # arrow gives None for missing strings, read_csv gives NaN
+                df[column] = df[column].where(df[column].notna(), np.nan)
+        return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description='pre-joined fact table of all patents')
+    parser.add_argument('command', choices=['build', 'lookup'])
+    parser.add_argument('g_patent', help='g_patent TSV')
+    parser.add_argument('values', nargs='*', help='build: g_cpc, g_assignee and g_location TSVs, '
+                                                  'lookup: patent ids')
+    parser.add_argument('--fact-dir', default=None)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        if len(args.values) != 3:
+            parser.error('build needs the g_cpc, g_assignee and g_location TSVs')
+        build_fact_table(args.g_patent, *args.values, fact_dir=args.fact_dir)
+        return
+    fact_table = FactTable(args.fact_dir or default_fact_dir(args.g_patent))
+    start_time = time.time()
+    rows = fact_table.lookup(args.values)
+    print(rows.to_string(index=False))
+    print(f'{rows["patent_id"].nunique()} patents, {len(rows)} rows ({(time.time() - start_time) * 1000:.1f} ms)')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+'''
+synthetic PatentsView tables for offline tests and benchmarks
+
+writes g_patent.tsv, g_cpc_current.tsv, g_assignee_disambiguated.tsv and g_location_disambiguated.tsv with the
+column sets and quoting of the downloaded files, at a chosen number of patents.
+the data follows the shape of the real tables:
+- patent types: mostly utility, about 8% design (no abstract), some plant, reissue and SIR patents
+- abstracts: log-normal number of words (median about 110), titles of 3 to 15 words, some abstracts with
+  line breaks and quotes, the keywords of the scripts in a small share of the patents
+- cpc: one to about a dozen rows per patent (sequence 0 is the primary classification), a few hundred
+  subclasses with a skewed frequency, about 2% of patents without cpc rows
+- assignees: about 15% of patents without assignee, most with one, a tail with several; organizations
+  and individuals, some missing assignee_type and location_id
+- locations: states only for US locations
+
+usage:
+python generate_synthetic_data.py --scale 100k --output-dir synthetic_100k
+python generate_synthetic_data.py --patents 250000 --output-dir synthetic --seed 7
+'''
+
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+# number of patents of the named scales
+scales = {'10k': 10000, '100k': 100000, '1m': 1000000, '8m': 8000000}
+
+# rows generated and written at a time
+block_size = 200000
+
+# abstracts and titles are drawn from a pool of generated texts (the keywords are added per patent)
+text_pool_size = 50000
+
+words = ('system method device apparatus data network node transaction ledger user computer signal layer '
+         'power solar panel tooth dental abutment screw fixture cell module block chain contract proof token '
+         'first second plurality configured surface portion member unit control processing memory wherein '
+         'includes housing assembly light energy circuit substrate material image vehicle sensor').split()
+
+# keywords of the scripts, each one is put in the title or abstract of a small share of the patents
+keywords = ['blockchain', 'bitcoin', 'distributed ledger', 'smart contract', 'proof of stake', 'cryptocurrency',
+            'block-chain', 'p2sh', 'ethereum', 'dental implant', 'dental implant fixture',
+            'dental implant abutment', 'solar panel', 'photovoltaic', 'solar collector']
+keyword_rate = 0.03
+
+patent_types = ['utility', 'design', 'plant', 'reissue', 'statutory invention registration']
+patent_type_shares = [0.908, 0.08, 0.005, 0.006, 0.001]
+patent_prefixes = {'utility': '', 'design': 'D', 'plant': 'PP', 'reissue': 'RE',
+                   'statutory invention registration': 'H'}
+patent_number_starts = {'utility': 3930271, 'design': 242583, 'plant': 3987, 'reissue': 28671,
+                        'statutory invention registration': 1}
+
+# subclasses the scripts select, always part of the generated classification
+fixed_subclasses = ['A61C', 'F24S', 'H02S', 'H04L', 'G06Q', 'G06F', 'A61B', 'B65D', 'G07C', 'H01L', 'Y02E']
+num_subclasses = 600
+
+# share of patents with 0, 1, 2, 3, ... assignees
+assignee_count_shares = [0.15, 0.80, 0.04, 0.007, 0.002, 0.001]
+organization_share = 0.93
+assignee_types = ['2', '3', '4', '5', '6', '7', '8', '9', '']
+assignee_type_shares = [0.50, 0.44, 0.01, 0.01, 0.02, 0.005, 0.001, 0.001, 0.013]
+missing_location_rate = 0.03
+
+countries = ['US', 'JP', 'KR', 'DE', 'CN', 'TW', 'FR', 'GB', 'CA', 'CH', 'IE', 'JE']
+country_shares = [0.50, 0.17, 0.07, 0.07, 0.06, 0.03, 0.025, 0.02, 0.02, 0.01, 0.01, 0.015]
+states = ['CA', 'NY', 'TX', 'MA', 'WA', 'IL', 'MI', 'NJ', 'MD', 'MN', 'OH', 'PA', 'FL', 'GA', 'NC']
+
+g_patent_columns = ['patent_id', 'patent_type', 'patent_date', 'patent_title', 'patent_abstract', 'wipo_kind',
+                    'num_claims', 'withdrawn', 'filename']
+g_cpc_columns = ['patent_id', 'cpc_sequence', 'cpc_section', 'cpc_class', 'cpc_subclass', 'cpc_group', 'cpc_type']
+g_assignee_columns = ['patent_id', 'assignee_sequence', 'assignee_id', 'disambig_assignee_individual_name_first',
+                      'disambig_assignee_individual_name_last', 'disambig_assignee_organization', 'assignee_type',
+                      'location_id']
+g_location_columns = ['location_id', 'disambig_city', 'disambig_state', 'disambig_country', 'latitude', 'longitude',
+                      'county', 'state_fips', 'county_fips']
+
+
+# Function to write a block of rows in the quoting of the PatentsView files (every field quoted, missing -> "")
+def write_block(f, df, header):
+    df.to_csv(f, sep='\t', index=False, header=header, quoting=csv.QUOTE_ALL, lineterminator='\n')
+
+
+# Function to build a pool of texts with a log-normal number of words
+def text_pool(rng, size, median_words, sigma, min_words, max_words):
+    lengths = np.clip(rng.lognormal(np.log(median_words), sigma, size).astype(int), min_words, max_words)
+    vocabulary = np.array(words, dtype=object)
+    texts = [' '.join(vocabulary[rng.integers(0, len(vocabulary), length)]) for length in lengths]
+    for i in np.flatnonzero(rng.random(size) < 0.02):
+        # line breaks and quotes inside a field, as in the real abstracts
+        texts[i] = texts[i][:30] + '\n' + texts[i][30:] + ' "quoted"'
+    return np.array(texts, dtype=object)
+
+
+# Function to put a keyword at a random word boundary of some of the texts
+def add_keywords(rng, texts, rate):
+    texts = texts.copy()
+    for i in np.flatnonzero(rng.random(len(texts)) < rate):
+        keyword = keywords[rng.integers(0, len(keywords))]
+        position = texts[i].find(' ', int(rng.integers(0, max(len(texts[i]), 1))))
+        texts[i] = keyword + ' ' + texts[i] if position < 0 else texts[i][:position] + ' ' + keyword + texts[i][position:]
+    return texts
+
+
+# Function to build the subclass list (fixed ones first) and their skewed frequencies
+def make_subclasses(rng):
+    sections = list('ABCDEFGHY')
+    subclasses = list(fixed_subclasses)
+    while len(subclasses) < num_subclasses:
+        code = f'{sections[rng.integers(0, len(sections))]}{rng.integers(1, 100):02d}{chr(65 + rng.integers(0, 26))}'
+        if code not in subclasses:
+            subclasses.append(code)
+    weights = 1 / np.arange(1, len(subclasses) + 1) ** 0.8
+    return np.array(subclasses, dtype=object), weights / weights.sum()
+
+
+# Function to generate the g_patent rows of patents [start, start + size)
+def patent_block(rng, start, size, abstracts, titles):
+    types = np.array(patent_types, dtype=object)[rng.choice(len(patent_types), size, p=patent_type_shares)]
+    numbers = np.array([patent_number_starts[t] for t in types]) + start + np.arange(size)
+    patent_ids = [patent_prefixes[t] + (f'{n:06d}' if t == 'statutory invention registration' else str(n))
+                  for t, n in zip(types, numbers)]
+
+    # more patents in later years
+    years = np.clip(1976 + (48 * np.sqrt(rng.random(size))).astype(int), 1976, 2024)
+    dates = [f'{y}-{m:02d}-{d:02d}' for y, m, d in zip(years, rng.integers(1, 13, size), rng.integers(1, 29, size))]
+
+    abstract = add_keywords(rng, abstracts[rng.integers(0, len(abstracts), size)], keyword_rate)
+    abstract[types == 'design'] = ''
+    abstract[rng.random(size) < 0.01] = ''
+    title = add_keywords(rng, titles[rng.integers(0, len(titles), size)], keyword_rate / 3)
+    title = [t[:1].upper() + t[1:] for t in title]
+    return pd.DataFrame({
+        'patent_id': patent_ids, 'patent_type': types, 'patent_date': dates, 'patent_title': title,
+        'patent_abstract': abstract, 'wipo_kind': np.where(types == 'design', 'S1', 'B2'),
+        'num_claims': rng.integers(1, 40, size), 'withdrawn': 0,
+        'filename': ['ipg%02d%02d%02d.xml' % (y % 100, m, 1) for y, m in zip(years, rng.integers(1, 13, size))],
+    })
+
+
+# Function to generate the g_cpc rows of a block of patents
+def cpc_block(rng, patent_ids, subclasses, subclass_shares):
+    counts = np.clip(rng.geometric(0.25, len(patent_ids)), 1, 12)
+    counts[rng.random(len(patent_ids)) < 0.02] = 0
+    patent_id = np.repeat(np.array(patent_ids, dtype=object), counts)
+    sequence = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    subclass = subclasses[rng.choice(len(subclasses), len(patent_id), p=subclass_shares)]
+    group = [f'{s}{g}/{n:02d}' for s, g, n in zip(subclass, rng.integers(1, 60, len(patent_id)),
+                                                  rng.integers(0, 100, len(patent_id)))]
+    return pd.DataFrame({
+        'patent_id': patent_id, 'cpc_sequence': sequence, 'cpc_section': [s[0] for s in subclass],
+        'cpc_class': [s[:3] for s in subclass], 'cpc_subclass': subclass, 'cpc_group': group,
+        'cpc_type': np.where(sequence == 0, 'inventional', np.where(rng.random(len(patent_id)) < 0.5,
+                                                                    'inventional', 'additional')),
+    })
+
+
+# Function to generate the g_assignee rows of a block of patents
+def assignee_block(rng, patent_ids, num_assignees, location_ids):
+    counts = rng.choice(len(assignee_count_shares), len(patent_ids), p=assignee_count_shares)
+    patent_id = np.repeat(np.array(patent_ids, dtype=object), counts)
+    size = len(patent_id)
+    sequence = np.arange(size) - np.repeat(np.cumsum(counts) - counts, counts)
+    assignee_number = np.minimum(rng.zipf(1.3, size), num_assignees) - 1
+    is_organization = (assignee_number % 100) < organization_share * 100
+    assignee_type = np.array(assignee_types, dtype=object)[rng.choice(len(assignee_types), size,
+                                                                      p=assignee_type_shares)]
+    assignee_type[~is_organization] = np.where(rng.random((~is_organization).sum()) < 0.6, '4', '5')
+    location = location_ids[assignee_number % len(location_ids)].copy()
+    location[rng.random(size) < missing_location_rate] = ''
+    return pd.DataFrame({
+        'patent_id': patent_id, 'assignee_sequence': sequence,
+        'assignee_id': [f'a{n:08x}' for n in assignee_number],
+        'disambig_assignee_individual_name_first': [('' if org else f'First{n % 1000}') for org, n in
+                                                    zip(is_organization, assignee_number)],
+        'disambig_assignee_individual_name_last': [('' if org else f'Last{n}') for org, n in
+                                                   zip(is_organization, assignee_number)],
+        'disambig_assignee_organization': [(f'COMPANY {n}, INC.' if org else '') for org, n in
+                                           zip(is_organization, assignee_number)],
+        'assignee_type': assignee_type, 'location_id': location,
+    })
+
+
+# Function to generate the location table
+def location_table(rng, num_locations):
+    country = np.array(countries, dtype=object)[rng.choice(len(countries), num_locations, p=country_shares)]
+    state = np.array(states, dtype=object)[rng.integers(0, len(states), num_locations)]
+    state[country != 'US'] = ''
+    return pd.DataFrame({
+        'location_id': [f'loc{n:08x}' for n in range(num_locations)],
+        'disambig_city': [f'City {n}' for n in range(num_locations)], 'disambig_state': state,
+        'disambig_country': country, 'latitude': np.round(rng.uniform(-60, 70, num_locations), 4),
+        'longitude': np.round(rng.uniform(-170, 170, num_locations), 4), 'county': '', 'state_fips': '',
+        'county_fips': '',
+    })
+
+
+# Function to write the four tables for num_patents patents in output_dir
+def generate(num_patents, output_dir, seed=1):
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    start_time = time.time()
+
+    abstracts = text_pool(rng, text_pool_size, 110, 0.45, 20, 400)
+    titles = text_pool(rng, text_pool_size, 7, 0.35, 3, 15)
+    subclasses, subclass_shares = make_subclasses(rng)
+    num_locations = max(2000, num_patents // 40)
+    num_assignees = max(5000, num_patents // 20)
+    locations = location_table(rng, num_locations)
+    location_ids = locations['location_id'].to_numpy(dtype=object)
+
+    paths = {name: os.path.join(output_dir, name + '.tsv') for name in
+             ['g_patent', 'g_cpc_current', 'g_assignee_disambiguated', 'g_location_disambiguated']}
+    with open(paths['g_location_disambiguated'], 'w', newline='') as f:
+        write_block(f, locations[g_location_columns], header=True)
+
+    with open(paths['g_patent'], 'w', newline='') as patent_file, \
+            open(paths['g_cpc_current'], 'w', newline='') as cpc_file, \
+            open(paths['g_assignee_disambiguated'], 'w', newline='') as assignee_file:
+        for start in range(0, num_patents, block_size):
+            size = min(block_size, num_patents - start)
+            patents = patent_block(rng, start, size, abstracts, titles)
+            patent_ids = patents['patent_id'].tolist()
+            write_block(patent_file, patents[g_patent_columns], header=start == 0)
+            write_block(cpc_file, cpc_block(rng, patent_ids, subclasses, subclass_shares)[g_cpc_columns],
+                        header=start == 0)
+            write_block(assignee_file, assignee_block(rng, patent_ids, num_assignees, location_ids)[g_assignee_columns],
+                        header=start == 0)
+            print(f'generated {start + size} of {num_patents} patents ({time.time() - start_time:.0f} seconds)')
+
+    for name, path in paths.items():
+        print(f"{path}: {os.path.getsize(path) / 1e6:.1f} MB")
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='write synthetic PatentsView tables')
+    parser.add_argument('--scale', choices=sorted(scales), default=None, help='named number of patents')
+    parser.add_argument('--patents', type=int, default=None, help='number of patents (instead of --scale)')
+    parser.add_argument('--output-dir', default='synthetic')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    num_patents = args.patents or scales[args.scale or '100k']
+    generate(num_patents, args.output_dir, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+'''
+incremental update of final_data_blockchain for a new PatentsView release
+
+every release is mostly the same patents as the one before. instead of running
+patent_whole_data_selected_words.py from scratch, this keeps a fingerprint of every patent of the last
+release and only reprocesses the patents whose fingerprint changed:
+- the fingerprint of a patent is the sum of the row hashes (pd.util.hash_pandas_object) of its g_patent row,
+  its g_cpc rows and its g_assignee rows, only over the columns the script uses. the hash of an assignee row
+  includes the hash of its location row, so a changed location changes the patents of its assignees.
+- added and changed patents go through the keyword filter and Steps 2 to 5 of the script again, with the
+  table reads limited to these patents
+- removed and changed patents are dropped from the previous result, the new rows are merged in and the
+  result is written in the order of a whole run
+
+the fingerprints are computed by streaming the tables once (hashing, no keyword scan, join or aggregation).
+the fingerprints only cover the tables, so meta.json also keeps the selected words, the cpc filter and a hash
+of them and of the code of the pipeline (see pipeline_hash). the whole release is processed if the previous
+result or fingerprints are missing, if this hash changed (new words, other columns, a fix of the script or
+of a module it uses), or if the delta would change how the numeric assignee columns are written (they are
+floats when some patent has no assignee).
+
+usage (in the folder of the tables and the previous result):
+python incremental_update.py
+python incremental_update.py --state-dir incremental_state
+'''
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import patent_whole_data_selected_words as selected_words
+from assignee_table import g_assignee_columns
+from checkpoints import step_source
+from keyword_matcher import compile_keywords
+from stage_profiler import StageProfiler
+from tsv_cache import iter_tsv_chunks, print_scan_report, read_tsv
+
+default_state_dir = 'incremental_state'
+fingerprint_chunksize = 1000000
+
+# columns of every table that the result depends on
+fingerprint_columns = {
+    'g_patent': ['patent_id', 'patent_type', 'patent_date', 'patent_title', 'patent_abstract'],
+    'g_cpc': ['patent_id', 'cpc_sequence', 'cpc_class', 'cpc_subclass'],
+    'g_assignee': g_assignee_columns,
+    'g_location': ['location_id', 'disambig_state', 'disambig_country'],
+}
+
+
+# Function to add up uint64 hashes per key (wraps around on overflow), gives a Series indexed by key
+def sum_hashes(keys, hashes):
+    codes, uniques = pd.factorize(keys)
+    sums = np.zeros(len(uniques), dtype=np.uint64)
+    np.add.at(sums, codes, hashes)
+    return pd.Series(sums, index=pd.Index(uniques, name='patent_id'))
+
+
+# Function to hash the rows of a frame
+def row_hashes(df):
+    return pd.util.hash_pandas_object(df, index=False).to_numpy(dtype=np.uint64)
+
+
+# Function to sum the row hashes of a table per patent, streaming it in chunks
+# extra_hashes(chunk) can give another uint64 column to hash with every row (the location of an assignee)
+def table_fingerprints(file_path, columns, extra_hashes=None):
+    parts = []
+    for chunk in iter_tsv_chunks(file_path, usecols=columns, dtype=str, chunksize=fingerprint_chunksize):
+        chunk = chunk[columns]
+        if extra_hashes is not None:
+            chunk = chunk.assign(extra_hash=extra_hashes(chunk))
+        parts.append(sum_hashes(chunk['patent_id'].to_numpy(dtype=object), row_hashes(chunk)))
+    if not parts:
+        return pd.Series(dtype=np.uint64)
+    parts = pd.concat(parts)
+    return sum_hashes(parts.index.to_numpy(dtype=object), parts.to_numpy(dtype=np.uint64))
+
+
+# Function to compute the fingerprint of every patent of a release, a Series of uint64 indexed by patent_id
+def release_fingerprints(g_patent, g_cpc, g_assignee, g_location):
+    locations = read_tsv(g_location, usecols=fingerprint_columns['g_location'], dtype=str)
+    location_hashes = pd.Series(row_hashes(locations[fingerprint_columns['g_location']]),
+                                index=locations['location_id'].to_numpy(dtype=object))
+    location_hashes = location_hashes[~location_hashes.index.duplicated()]
+
+    def assignee_location_hashes(chunk):
+        return chunk['location_id'].map(location_hashes).fillna(0).astype(np.uint64).to_numpy()
+
+    fingerprints = table_fingerprints(g_patent, fingerprint_columns['g_patent'])
+    for part in [table_fingerprints(g_cpc, fingerprint_columns['g_cpc']),
+                 table_fingerprints(g_assignee, fingerprint_columns['g_assignee'], assignee_location_hashes)]:
+        # only the patents of g_patent count, rows of other patents are left out
+        part = part.reindex(fingerprints.index, fill_value=0).to_numpy(dtype=np.uint64)
+        fingerprints = pd.Series(fingerprints.to_numpy(dtype=np.uint64) + part, index=fingerprints.index)
+    return fingerprints
+
+
+def fingerprint_path(state_dir):
+    return os.path.join(state_dir, 'fingerprints.pkl')
+
+
+def load_fingerprints(state_dir):
+    path = fingerprint_path(state_dir)
+    return pd.read_pickle(path) if os.path.exists(path) else None
+
+
+# Function to get the selection of the script: the selected words and the cpc rows it keeps
+def pipeline_selection():
+    return {'selected_word': sorted(selected_words.selected_word), 'g_cpc_columns': selected_words.g_cpc_columns,
+            'cpc_sequence': '0'}
+
+
+# Function to hash the selection and the code of the pipeline: the functions and classes of the project that
+# update_selected_words calls and the globals they read (see checkpoints.step_source)
+def pipeline_hash():
+    description = {'selection': pipeline_selection(), 'code': step_source(update_selected_words)}
+    return hashlib.sha1(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def load_meta(state_dir):
+    path = os.path.join(state_dir, 'meta.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_fingerprints(state_dir, fingerprints, output_file):
+    os.makedirs(state_dir, exist_ok=True)
+    temp_path = fingerprint_path(state_dir) + '.tmp'
+    fingerprints.to_pickle(temp_path)
+    os.replace(temp_path, fingerprint_path(state_dir))
+    with open(os.path.join(state_dir, 'meta.json'), 'w') as f:
+        json.dump({'output_file': output_file, 'patents': len(fingerprints),
+                   'updated': time.strftime('%Y-%m-%d %H:%M:%S'), **pipeline_selection(),
+                   'pipeline_hash': pipeline_hash()}, f, indent=1)
+
+
+# Function to find the patents to reprocess (added or changed) and to drop (removed or changed)
+def diff_fingerprints(old_fingerprints, new_fingerprints):
+    added = new_fingerprints.index.difference(old_fingerprints.index)
+    removed = old_fingerprints.index.difference(new_fingerprints.index)
+    common = new_fingerprints.index.intersection(old_fingerprints.index)
+    differs = (old_fingerprints.reindex(common).to_numpy(dtype=np.uint64) !=
+               new_fingerprints.reindex(common).to_numpy(dtype=np.uint64))
+    changed = set(common[differs]) | set(added)
+    return changed, set(removed), set(added)
+
+
+# Function to run the keyword filter of the script on the given patents only
+def filter_changed_patents(patent_ids):
+    g_patent_df = read_tsv(selected_words.g_patent, usecols=['patent_id', 'patent_date', 'patent_type',
+                                                             'patent_abstract', 'patent_title'],
+                           dtype=str, keep_keys={'patent_id': patent_ids})
+    g_patent_df['combined_text'] = g_patent_df['patent_title'].str.lower() + ' ' + g_patent_df['patent_abstract'].str.lower().fillna('')
+    matcher = compile_keywords(selected_words.selected_word)
+    return g_patent_df[matcher.contains(g_patent_df['combined_text'])]
+
+
+# Function to get the rows of a result as the text the csv holds
+def as_csv_text(df):
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False)
+    buffer.seek(0)
+    return pd.read_csv(buffer, dtype=str, keep_default_na=False)
+
+
+# Function to process the whole release and keep its fingerprints
+def full_update(state_dir, fingerprints, output_file):
+    selected_words.main()
+    save_fingerprints(state_dir, fingerprints, output_file)
+
+
+# Function to update final_data_blockchain for the current tables
+def update_selected_words(state_dir=default_state_dir):
+    output_file = selected_words.final_data_file
+    profiler = StageProfiler('incremental_update')
+
+    print('Computing the fingerprints of the release...')
+    with profiler.stage('fingerprint the release') as stage:
+        new_fingerprints = release_fingerprints(selected_words.g_patent, selected_words.g_cpc,
+                                                selected_words.g_assignee, selected_words.g_location)
+        stage.rows_out = len(new_fingerprints)
+    old_fingerprints = load_fingerprints(state_dir)
+    if old_fingerprints is None or not os.path.exists(output_file):
+        print('no previous result or fingerprints, processing the whole release...')
+        full_update(state_dir, new_fingerprints, output_file)
+        return
+    if load_meta(state_dir).get('pipeline_hash') != pipeline_hash():
+        print('the selected words, the cpc filter or the code of the pipeline changed, '
+              'processing the whole release...')
+        full_update(state_dir, new_fingerprints, output_file)
+        return
+
+    changed, removed, added = diff_fingerprints(old_fingerprints, new_fingerprints)
+    print(f'{len(added)} added, {len(changed) - len(added)} changed and {len(removed)} removed patents')
+    if not changed and not removed:
+        print(f"'{output_file}' is up to date.")
+        return
+
+    old_result = pd.read_csv(output_file, dtype=str, keep_default_na=False)
+    kept = old_result[~old_result['patent_id'].isin(changed | removed)]
+    # a whole run writes the assignee numbers as floats when some patent has no assignee
+    old_floats = (old_result['assignee_sequence_y'] == '').any()
+
+    print('Step 1: Filtering the added and changed patents based on selected words...')
+    with profiler.stage('Step 1: keyword scan of the delta', rows_in=len(changed)) as stage:
+        filtered_patents = filter_changed_patents(changed)
+        stage.rows_out = len(filtered_patents)
+    delta = selected_words.join_and_aggregate(filtered_patents, profiler, float_sequences=old_floats)
+
+    new_floats = (kept['assignee_sequence_y'] == '').any() or delta['assignee_sequence_y'].isna().any()
+    if new_floats != old_floats:
+        print('the numeric assignee columns change type, processing the whole release...')
+        full_update(state_dir, new_fingerprints, output_file)
+        return
+
+    with profiler.stage('merge and write the result', rows_in=len(kept) + len(delta)) as stage:
+        result = pd.concat([kept, as_csv_text(delta)], ignore_index=True)
+        # same order as a whole run: by patent_id, the rows of a patent in their order
+        result = result.iloc[np.argsort(result['patent_id'].to_numpy(dtype=object), kind='stable')]
+        temp_file = output_file + '.tmp'
+        result.to_csv(temp_file, index=False)
+        os.replace(temp_file, output_file)
+        stage.rows_out = len(result)
+    save_fingerprints(state_dir, new_fingerprints, output_file)
+    print(f"'{output_file}' has been updated: {len(delta)} rows reprocessed, {len(kept)} rows kept.")
+    print()
+    profiler.print_summary()
+    print_scan_report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='incremental update of the result for a new release')
+    parser.add_argument('--state-dir', default=default_state_dir, help='folder of the fingerprints')
+    args = parser.parse_args()
+    update_selected_words(args.state_dir)
+
+
+if __name__ == "__main__":
+    main()
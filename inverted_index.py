@@ -0,0 +1,308 @@
+'''
+persistent inverted index over patent_title + patent_abstract
+
+built once per release, it answers a keyword set without rescanning every abstract.
+
+index folder (g_patent.tsv.index next to the TSV):
+- vocab.txt + vocab_starts.npy: sorted vocabulary of the tokens (runs of a-z / 0-9 in the lower-cased text)
+- postings.bin + posting_offsets.npy: per token the sorted row numbers of the patents that contain it,
+  delta encoded and compressed with variable-length bytes
+- docs.bin + doc_offsets.npy: every g_patent row compressed on its own, for random access
+- meta.json: size and modification time of the source TSV, number of rows and columns
+
+a keyword (also a phrase like 'distributed ledger' or 'proof-of-stake') is split with the same tokenizer.
+the first token may be the end of a longer token, the last token may be the start of one and the tokens
+in the middle must match exactly; the posting lists of the vocabulary tokens that fit are unioned per
+keyword token and intersected over the tokens. a one-token keyword with letters/digits only gives the
+exact answer, for the other keywords the candidates are checked against the stored text, so the result
+is always the same as the substring scan of filter_g_patent.
+
+usage:
+python inverted_index.py build g_patent.tsv
+python inverted_index.py query g_patent.tsv blockchain "distributed ledger" "proof of stake" --check
+'''
+
+import argparse
+import json
+import os
+import re
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from keyword_matcher import compile_keywords
+from patent_reader import combined_text, g_patent_columns, iter_g_patent_chunks
+
+token_pattern = re.compile(r'[a-z0-9]+')
+build_chunksize = 100000
+
+# a keyword token whose posting lists cover more than this share of the patents is not intersected
+# (it hardly removes candidates), the text check of the candidates still makes the result exact
+max_intersect_share = 0.2
+
+
+def default_index_dir(file_path):
+    return file_path + '.index'
+
+
+# Function to encode non-negative integers as variable-length bytes (7 bits per byte, high bit = more)
+def varint_encode(values):
+    values = np.asarray(values, dtype=np.uint64)
+    num_bytes = np.ones(len(values), dtype=np.int64)
+    for shift in (7, 14, 21, 28, 35):
+        num_bytes += values >= (1 << shift)
+    ends = np.cumsum(num_bytes)
+    starts = ends - num_bytes
+    encoded = np.zeros(int(ends[-1]) if len(values) else 0, dtype=np.uint8)
+    for k in range(int(num_bytes.max()) if len(values) else 0):
+        has_byte = num_bytes > k
+        byte = (values[has_byte] >> np.uint64(7 * k)) & np.uint64(0x7f)
+        more = (num_bytes[has_byte] > k + 1).astype(np.uint64) << np.uint64(7)
+        encoded[starts[has_byte] + k] = (byte | more).astype(np.uint8)
+    return encoded
+
+
+def varint_decode(encoded):
+    encoded = np.frombuffer(encoded, dtype=np.uint8) if isinstance(encoded, bytes) else encoded
+    if len(encoded) == 0:
+        return np.zeros(0, dtype=np.int64)
+    last_byte = encoded < 0x80
+    value_index = np.concatenate(([0], np.cumsum(last_byte)[:-1]))
+    value_starts = np.concatenate(([0], np.flatnonzero(last_byte)[:-1] + 1))
+    shift = (np.arange(len(encoded)) - value_starts[value_index]) * 7
+    parts = (encoded & 0x7f).astype(np.int64) << shift
+    return np.bincount(value_index, weights=parts).astype(np.int64)
+
+
+# Function to encode the posting lists: deltas inside every token's list, first value kept as is
+# the pairs come in row order, so a stable sort by token keeps every list sorted by row
+def encode_postings(token_ids, doc_ids, vocab_size):
+    order = np.argsort(token_ids, kind='stable')
+    token_ids = token_ids[order].astype(np.int64)
+    doc_ids = doc_ids[order].astype(np.int64)
+    deltas = np.diff(doc_ids, prepend=0)
+    list_starts = np.flatnonzero(np.diff(token_ids, prepend=-1))
+    deltas[list_starts] = doc_ids[list_starts]
+    encoded = varint_encode(deltas)
+
+    # byte offset of every token's list, every vocabulary token has at least one posting
+    doc_freq = np.bincount(token_ids, minlength=vocab_size)
+    value_ends = np.flatnonzero(encoded < 0x80) + 1
+    offsets = np.zeros(vocab_size + 1, dtype=np.int64)
+    offsets[1:] = value_ends[np.cumsum(doc_freq) - 1]
+    return encoded, offsets, doc_freq.astype(np.int64)
+
+
+# Function to build the index of a g_patent TSV
+def build_index(file_path, index_dir=None, chunksize=build_chunksize):
+    index_dir = index_dir or default_index_dir(file_path)
+    os.makedirs(index_dir, exist_ok=True)
+    stat = os.stat(file_path)
+
+    vocab = {}
+    token_chunks = []
+    doc_chunks = []
+    doc_offsets = [0]
+    columns = None
+    num_docs = 0
+    start_time = time.time()
+    with open(os.path.join(index_dir, 'docs.bin'), 'wb') as docs_file:
+        for chunk in iter_g_patent_chunks(file_path, usecols=g_patent_columns, chunksize=chunksize):
+            columns = list(chunk.columns)
+            # compressed rows, missing values stored as null
+            for row in chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None):
+                compressed = zlib.compress(json.dumps(row).encode('utf-8'))
+                docs_file.write(compressed)
+                doc_offsets.append(doc_offsets[-1] + len(compressed))
+
+            tokens = combined_text(chunk).fillna('').str.findall(token_pattern).explode().dropna()
+            pairs = pd.DataFrame({'doc': tokens.index.to_numpy() - chunk.index[0] + num_docs,
+                                  'token': tokens.to_numpy()}).drop_duplicates()
+            for token in pairs['token'].unique():
+                if token not in vocab:
+                    vocab[token] = len(vocab)
+            token_chunks.append(pairs['token'].map(vocab).to_numpy(dtype=np.uint32))
+            doc_chunks.append(pairs['doc'].to_numpy(dtype=np.uint32))
+            num_docs += len(chunk)
+            print(f'indexed {num_docs} patents ({time.time() - start_time:.0f} seconds)')
+
+    # renumber the tokens in sorted order, so the vocabulary can be searched as one sorted text
+    sorted_vocab = sorted(vocab)
+    new_ids = np.empty(len(vocab), dtype=np.uint32)
+    new_ids[[vocab[token] for token in sorted_vocab]] = np.arange(len(sorted_vocab), dtype=np.uint32)
+    token_ids = new_ids[np.concatenate(token_chunks)] if token_chunks else np.zeros(0, dtype=np.uint32)
+    doc_ids = np.concatenate(doc_chunks) if doc_chunks else np.zeros(0, dtype=np.uint32)
+    del token_chunks, doc_chunks
+
+    encoded, posting_offsets, doc_freq = encode_postings(token_ids, doc_ids, len(sorted_vocab))
+    encoded.tofile(os.path.join(index_dir, 'postings.bin'))
+    np.save(os.path.join(index_dir, 'posting_offsets.npy'), posting_offsets)
+    np.save(os.path.join(index_dir, 'doc_freq.npy'), doc_freq)
+    np.save(os.path.join(index_dir, 'doc_offsets.npy'), np.array(doc_offsets, dtype=np.int64))
+
+    vocab_text = '\n' + '\n'.join(sorted_vocab) + '\n'
+    with open(os.path.join(index_dir, 'vocab.txt'), 'w', encoding='ascii') as f:
+        f.write(vocab_text)
+    token_lengths = np.array([len(token) + 1 for token in sorted_vocab], dtype=np.int64)
+    np.save(os.path.join(index_dir, 'vocab_starts.npy'), np.cumsum(token_lengths) - token_lengths)
+
+    meta = {'source': os.path.basename(file_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'num_docs': num_docs, 'vocab_size': len(sorted_vocab), 'columns': columns or g_patent_columns}
+    with open(os.path.join(index_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=1)
+    print(f'index of {num_docs} patents and {len(sorted_vocab)} tokens stored in {index_dir}')
+    return meta
+
+
+# Function to check that an index exists and was built from the current version of the TSV
+def index_is_current(file_path, index_dir=None):
+    meta_path = os.path.join(index_dir or default_index_dir(file_path), 'meta.json')
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    stat = os.stat(file_path)
+    return meta['size'] == stat.st_size and meta['mtime_ns'] == stat.st_mtime_ns
+
+
+# Function to split a keyword into tokens with a match rule per token
+# rules: 'contains', 'endswith', 'startswith', 'equals' (a token can only grow where the keyword
+# does not have a separator next to it)
+def keyword_tokens(keyword):
+    matches = list(token_pattern.finditer(keyword))
+    rules = []
+    for i, match in enumerate(matches):
+        open_left = i == 0 and match.start() == 0
+        open_right = i == len(matches) - 1 and match.end() == len(keyword)
+        rule = {(True, True): 'contains', (True, False): 'endswith',
+                (False, True): 'startswith', (False, False): 'equals'}[(open_left, open_right)]
+        rules.append((match.group(), rule))
+    return rules
+
+
+class PatentIndex:
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        with open(os.path.join(index_dir, 'vocab.txt'), encoding='ascii') as f:
+            self._vocab_text = f.read()
+        self._vocab_starts = np.load(os.path.join(index_dir, 'vocab_starts.npy'))
+        self._posting_offsets = np.load(os.path.join(index_dir, 'posting_offsets.npy'), mmap_mode='r')
+        self._doc_freq = np.load(os.path.join(index_dir, 'doc_freq.npy'), mmap_mode='r')
+        self._doc_offsets = np.load(os.path.join(index_dir, 'doc_offsets.npy'), mmap_mode='r')
+        self._postings = np.memmap(os.path.join(index_dir, 'postings.bin'), dtype=np.uint8, mode='r') \
+            if os.path.getsize(os.path.join(index_dir, 'postings.bin')) else np.zeros(0, dtype=np.uint8)
+
+    @property
+    def num_docs(self):
+        return self.meta['num_docs']
+
+    # Function to find the vocabulary tokens that fit a keyword token and rule
+    def vocab_ids(self, token, rule):
+        pattern = {'contains': token, 'endswith': token + '\n',
+                   'startswith': '\n' + token, 'equals': '\n' + token + '\n'}[rule]
+        positions = []
+        position = self._vocab_text.find(pattern)
+        while position != -1:
+            positions.append(position + (1 if pattern[0] == '\n' else 0))
+            position = self._vocab_text.find(pattern, position + 1)
+        if not positions:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.searchsorted(self._vocab_starts, positions, side='right') - 1)
+
+    # Function to get the sorted row numbers of the patents that contain one of the tokens
+    def postings(self, token_ids):
+        lists = [np.cumsum(varint_decode(self._postings[self._posting_offsets[i]:self._posting_offsets[i + 1]]))
+                 for i in token_ids]
+        if not lists:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(lists))
+
+    # Function to get the candidate rows of one keyword and whether they are exact (no text check needed)
+    def keyword_candidates(self, keyword):
+        rules = keyword_tokens(keyword.lower())
+        if not rules:
+            return np.arange(self.num_docs), False
+        token_sets = [self.vocab_ids(token, rule) for token, rule in rules]
+        sizes = [int(self._doc_freq[ids].sum()) if len(ids) else 0 for ids in token_sets]
+        exact = len(rules) == 1 and rules[0][1] == 'contains' and rules[0][0] == keyword.lower()
+
+        candidates = None
+        for size, ids in sorted(zip(sizes, token_sets), key=lambda pair: pair[0]):
+            if candidates is not None and size > max_intersect_share * self.num_docs:
+                break
+            rows = self.postings(ids)
+            candidates = rows if candidates is None else np.intersect1d(candidates, rows, assume_unique=True)
+            if len(candidates) == 0:
+                break
+        return candidates, exact
+
+    # Function to read stored rows, returns a frame like the g_patent read (index = row number)
+    def fetch(self, doc_ids):
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        rows = []
+        with open(os.path.join(self.index_dir, 'docs.bin'), 'rb') as docs_file:
+            for doc_id in doc_ids:
+                start, end = self._doc_offsets[doc_id], self._doc_offsets[doc_id + 1]
+                docs_file.seek(start)
+                rows.append(json.loads(zlib.decompress(docs_file.read(end - start))))
+        df = pd.DataFrame(rows, columns=self.meta['columns'], index=doc_ids, dtype=object)
+        return df.where(df.notna(), np.nan)
+
+    # Function to get the sorted row numbers of the patents with at least one of the selected words
+    def search(self, selected_word):
+        matcher = compile_keywords(selected_word)
+        exact_rows = []
+        to_check = []
+        for keyword in matcher.terms:
+            candidates, exact = self.keyword_candidates(keyword)
+            (exact_rows if exact else to_check).append(candidates)
+        found = np.unique(np.concatenate(exact_rows)) if exact_rows else np.zeros(0, dtype=np.int64)
+        if to_check:
+            unchecked = np.setdiff1d(np.unique(np.concatenate(to_check)), found, assume_unique=True)
+            if len(unchecked):
+                candidate_rows = self.fetch(unchecked)
+                checked = unchecked[matcher.contains(combined_text(candidate_rows)).to_numpy()]
+                found = np.union1d(found, checked)
+        return found
+
+    # Function to answer a keyword set with the same frame as the substring scan of filter_g_patent
+    def filter(self, selected_word, usecols=None, return_terms=False):
+        filtered = self.fetch(self.search(selected_word))
+        if usecols is not None:
+            filtered = filtered[[c for c in filtered.columns if c in usecols]]
+        filtered['combined_text'] = combined_text(filtered)
+        if return_terms:
+            matcher = compile_keywords(selected_word)
+            filtered['matched_terms'] = matcher.matching_terms(filtered['combined_text']).str.join('; ')
+        return filtered
+
+
+def main():
+    parser = argparse.ArgumentParser(description='inverted index over patent titles and abstracts')
+    parser.add_argument('command', choices=['build', 'query'])
+    parser.add_argument('file_path', help='g_patent TSV')
+    parser.add_argument('words', nargs='*', help='keywords for the query command')
+    parser.add_argument('--index-dir', default=None)
+    parser.add_argument('--check', action='store_true', help='compare the query result with a full scan')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_index(args.file_path, args.index_dir)
+        return
+
+    index = PatentIndex(args.index_dir or default_index_dir(args.file_path))
+    start_time = time.time()
+    filtered_patents = index.filter(args.words)
+    print(f"{len(filtered_patents)} patents, time taken: {time.time() - start_time:.3f} seconds")
+    if args.check:
+        from patent_reader import filter_g_patent_chunked
+        expected = filter_g_patent_chunked(args.file_path, args.words)
+        print('same result as the full scan:', filtered_patents.equals(expected))
+
+
+if __name__ == "__main__":
+    main()
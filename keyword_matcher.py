@@ -0,0 +1,182 @@
+'''
+multi-pattern keyword matcher for the title + abstract search
+
+the old filter built one regex with '|'.join(selected_word) and ran str.contains(..., case=False)
+on every row, so every row was tried against every term. here the keyword set is compiled once into
+an automaton and each batch of texts is scanned in one linear pass, no matter how many terms there are.
+
+backends:
+- 'ahocorasick': Aho-Corasick automaton from the pyahocorasick package (used when it is installed)
+- 'trie': the terms are folded into a prefix-trie regex, so the regex engine only follows one branch
+  per character instead of trying every alternative (pure python fallback, no extra package)
+
+the terms are matched as plain lower-case substrings of the (already lower-cased) combined_text,
+which is what the old regex did for our keyword sets (they have no regex special characters).
+'''
+
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# texts are joined with this character before a scan, so a term can never match across two rows
+ROW_SEPARATOR = '\x00'
+
+
+# Function to build a nested dict trie, a node that ends a term is cut (a shorter term already matches)
+def build_trie(terms):
+    trie = {}
+    for term in sorted(terms, key=len):
+        node = trie
+        for char in term:
+            if '' in node:
+                break
+            node = node.setdefault(char, {})
+        else:
+            node.clear()
+            node[''] = True
+    return trie
+
+
+# Function to turn the trie into a regex with shared prefixes
+def trie_to_pattern(node):
+    if '' in node:
+        return ''
+    branches = []
+    single_chars = []
+    for char in sorted(node):
+        tail = trie_to_pattern(node[char])
+        if tail == '':
+            single_chars.append(re.escape(char))
+        else:
+            branches.append(re.escape(char) + tail)
+    if len(single_chars) == 1:
+        branches.append(single_chars[0])
+    elif single_chars:
+        branches.append('[' + ''.join(single_chars) + ']')
+    if len(branches) == 1:
+        return branches[0]
+    return '(?:' + '|'.join(branches) + ')'
+
+
+class KeywordMatcher:
+    '''
+    compiled matcher for one keyword set, build it once and reuse it for every chunk of texts
+    '''
+
+    def __init__(self, selected_word, backend=None):
+        self.terms = tuple(sorted({word.lower() for word in selected_word if word}))
+        if any(ROW_SEPARATOR in term for term in self.terms):
+            raise ValueError('keywords can not contain the row separator character')
+        if backend is None:
+            backend = 'ahocorasick' if ahocorasick is not None else 'trie'
+        if backend == 'ahocorasick' and ahocorasick is None:
+            raise ImportError("backend 'ahocorasick' needs the pyahocorasick package")
+        if backend not in ('ahocorasick', 'trie'):
+            raise ValueError(f"unknown backend '{backend}'")
+        self.backend = backend
+
+        if backend == 'ahocorasick':
+            self._automaton = ahocorasick.Automaton()
+            for term_index, term in enumerate(self.terms):
+                self._automaton.add_word(term, term_index)
+            if self.terms:
+                self._automaton.make_automaton()
+        else:
+            self._regex = re.compile(trie_to_pattern(build_trie(self.terms))) if self.terms else None
+
+    def __repr__(self):
+        return f'KeywordMatcher({len(self.terms)} terms, backend={self.backend!r})'
+
+    # Function to test a single text
+    def search(self, text):
+        if not isinstance(text, str):
+            return False
+        if not self.terms:
+            return True
+        if self.backend == 'ahocorasick':
+            return next(self._automaton.iter(text), None) is not None
+        return self._regex.search(text) is not None
+
+    # Function to list the terms found in a single text
+    def find_terms(self, text):
+        if not isinstance(text, str) or not self.terms:
+            return ()
+        if self.backend == 'ahocorasick':
+            return tuple(self.terms[i] for i in sorted({value for _, value in self._automaton.iter(text)}))
+        return tuple(term for term in self.terms if term in text)
+
+    # Function to scan a batch of texts in one pass, yields (row, term_index) for every hit
+    # term_index is None for the trie backend, which stops at the first hit of a row
+    def _scan_batch(self, texts):
+        joined = ROW_SEPARATOR.join(texts)
+        row_ends = np.cumsum([len(text) + 1 for text in texts])
+
+        if self.backend == 'ahocorasick':
+            hits = list(self._automaton.iter(joined))
+            if not hits:
+                return
+            positions = np.fromiter((end for end, _ in hits), dtype=np.int64, count=len(hits))
+            rows = np.searchsorted(row_ends, positions, side='right')
+            for row, (_, term_index) in zip(rows.tolist(), hits):
+                yield row, term_index
+        else:
+            position = 0
+            while True:
+                match = self._regex.search(joined, position)
+                if match is None:
+                    return
+                row = int(np.searchsorted(row_ends, match.start(), side='right'))
+                yield row, None
+                position = int(row_ends[row])
+
+    def _batches(self, texts, batch_size):
+        values = [text if isinstance(text, str) else '' for text in texts]
+        for start in range(0, len(values), batch_size):
+            yield start, values[start:start + batch_size]
+
+    # Function to get a boolean mask of the rows with at least one term (missing texts are False)
+    def contains(self, texts, batch_size=10000):
+        texts = pd.Series(texts)
+        if not self.terms:
+            # same as str.contains('') with an empty keyword set: every row passes
+            return pd.Series(texts.notna().to_numpy(), index=texts.index)
+        mask = np.zeros(len(texts), dtype=bool)
+        for start, batch in self._batches(texts, batch_size):
+            for row, _ in self._scan_batch(batch):
+                mask[start + row] = True
+        return pd.Series(mask, index=texts.index)
+
+    # Function to get the matched terms of every row as a tuple (empty tuple if nothing matched)
+    def matching_terms(self, texts, batch_size=10000):
+        texts = pd.Series(texts)
+        found = [()] * len(texts)
+        for start, batch in self._batches(texts, batch_size):
+            if self.backend == 'ahocorasick':
+                hit_terms = {}
+                for row, term_index in self._scan_batch(batch):
+                    hit_terms.setdefault(row, set()).add(term_index)
+                for row, term_indexes in hit_terms.items():
+                    found[start + row] = tuple(self.terms[i] for i in sorted(term_indexes))
+            else:
+                for row, _ in self._scan_batch(batch):
+                    found[start + row] = self.find_terms(batch[row])
+        return pd.Series(found, index=texts.index, dtype=object)
+
+
+# Function to get the compiled matcher of a keyword set, it is built only once per set
+@lru_cache(maxsize=32)
+def _cached_matcher(terms, backend):
+    return KeywordMatcher(terms, backend=backend)
+
+
+def compile_keywords(selected_word, backend=None):
+    if isinstance(selected_word, KeywordMatcher):
+        return selected_word
+    return _cached_matcher(frozenset(selected_word), backend)
@@ -9,17 +9,30 @@ save resulted patent id in csv
 p.s: I have checked my result with sampling
 '''
 
-import pandas as pd
-import time
+import argparse
+
+from tsv_cache import read_tsv
+from stage_profiler import StageProfiler
+from cpc_store import CpcStore, default_store_dir, store_is_current
+from count_cube import CountCube, cube_is_current, default_cube_dir
 
 # go to this address to download the dataset
 # https://patentsview.org/download/data-download-tables
 g_cpc = 'g_cpc_current.tsv'
+# the count cube of the release (see count_cube.py) is built from all four tables
+g_patent = 'g_patent.tsv'
+g_assignee = 'g_assignee_disambiguated.tsv'
+g_location = 'g_location_disambiguated.tsv'
 
 # Function to filter g_cpc by sequence and list of CPCs
+# if an up to date CPC store exists only the partitions of the selected subclasses are read (see cpc_store.py)
 def filter_g_cpc_by_sequence_and_cpcs(file_path, sequence='0', cpc_prefix=''):
     columns_to_keep = ['patent_id', 'cpc_subclass', 'cpc_sequence','cpc_class','cpc_group']
-    filtered_g_cpc = pd.read_csv(file_path, sep='\t', usecols=columns_to_keep, dtype=str)
+    if cpc_prefix and store_is_current(file_path):
+        store = CpcStore(default_store_dir(file_path))
+        return store.query(subclasses=cpc_prefix, sequence=sequence, columns=columns_to_keep)
+
+    filtered_g_cpc = read_tsv(file_path, usecols=columns_to_keep, dtype=str)
 
     # Filter the DataFrame to keep only rows where cpc_sequence is equal to the given sequence
     filtered_g_cpc = filtered_g_cpc[filtered_g_cpc['cpc_sequence'] == str(sequence)]
@@ -31,25 +44,46 @@ def filter_g_cpc_by_sequence_and_cpcs(file_path, sequence='0', cpc_prefix=''):
     return filtered_g_cpc
 
 #Main
-def main():
+# with count_only=True only the counts are printed (no csv), from the count cube when it is up to date
+def main(count_only=False):
     cpc_prefix_to_filter = ['F24S','H02S']
 
+    profiler = StageProfiler('num_patent_cpc')
+
+    if count_only and cube_is_current(g_patent, g_cpc, g_assignee, g_location):
+        print('Counting from the count cube...')
+        with profiler.stage('count from the cube'):
+            cube = CountCube(default_cube_dir(g_patent))
+            num_distinct_patents = cube.count({'cpc_subclass': cpc_prefix_to_filter})
+            patents_per_year = cube.count({'cpc_subclass': cpc_prefix_to_filter}, by=['year'])
+        print(patents_per_year.to_string(index=False))
+        print("Number of distinct patent IDs with sequence=0 and CPC prefix:", num_distinct_patents)
+        profiler.print_summary()
+        return
+
     # Step 2: Filter g_cpc by sequence and list of CPCs
     print('Step 2: Filtering g_cpc based on sequence=0 and CPC prefix...')
-    start_time = time.time()
-    filtered_g_cpc = filter_g_cpc_by_sequence_and_cpcs(g_cpc, sequence='0', cpc_prefix=cpc_prefix_to_filter)
-    print(f"Time taken: {time.time() - start_time:.2f} seconds")
+    with profiler.stage('Step 2: filter g_cpc') as stage:
+        filtered_g_cpc = filter_g_cpc_by_sequence_and_cpcs(g_cpc, sequence='0', cpc_prefix=cpc_prefix_to_filter)
+        stage.rows_out = len(filtered_g_cpc)
     print()
 
     # Step 4: Store the filtered data in a CSV
-    output_file = 'num_patent_cpc_solar.csv'
-    filtered_g_cpc.to_csv(output_file, index=False)
-    print(f"'num_patent_cpc' data has been stored in '{output_file}'.")
-    print()
+    if not count_only:
+        output_file = 'num_patent_cpc_solar.csv'
+        with profiler.stage('Step 4: write the csv', rows_in=len(filtered_g_cpc)):
+            filtered_g_cpc.to_csv(output_file, index=False)
+        print(f"'num_patent_cpc' data has been stored in '{output_file}'.")
+        print()
 
     # Step 5: Print the number of distinct patent IDs with sequence=0
     num_distinct_patents = filtered_g_cpc['patent_id'].nunique()
     print("Number of distinct patent IDs with sequence=0 and CPC prefix:", num_distinct_patents)
+    profiler.print_summary()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count-only', action='store_true',
+                        help='only print the counts, from the count cube when it is up to date')
+    args = parser.parse_args()
+    main(count_only=args.count_only)
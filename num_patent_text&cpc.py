@@ -4,39 +4,136 @@ selected words for search in the abstract + title
 cpc subclass, if you want to keep certain cpc then filter the patents based on selected words.
 if not, you can leave "cpc_codes_input" empty.
 
+the keyword scan and the cpc semi-join are ordered by a small planner (see plan_filters): the filter that
+drops the most patents per second of work runs first, and the other one only sees the patents it kept.
+when the cpc semi-join goes first it is pushed into the read of g_patent, so only the title and abstract
+of the patents of the cpc codes are read and scanned. the csv is the same in every order.
+
 sample result:
 Number of patents in this topic
 and
 csv file with these columns:
 'patent_id', 'patent_date', 'patent_abstract', 'patent_title', 'cpc_subclass', 'cpc_sequence'
+
+batch mode:
+many topics (each with its own keywords and optional cpc subclasses) in one pass over g_patent and g_cpc,
+one csv per topic and a summary of the counts, see topics_example.json for the file format
+python "num_patent_text&cpc.py" --topics topics_example.json --output-dir topics
 '''
 
 
-import pandas as pd
+import argparse
+import json
+import os
+import re
 import time
+import pandas as pd
+from functools import lru_cache
+
+from keyword_matcher import compile_keywords
+from tsv_cache import read_tsv, valid_cache_meta
+from cpc_store import CpcStore, default_store_dir, store_is_current
+from patent_schema import align_key, compact_frame, print_memory_report, restore_frame
+from stage_profiler import StageProfiler
 
 # go to this address to download the dataset
 # https://patentsview.org/download/data-download-tables
 g_patent = 'g_patent.tsv'
 g_cpc = 'g_cpc_current.tsv'
 
-# keep specific columns in g_patent database
-print('start reading g_patent file and choosing selected columns')
-g_patent_df = pd.read_csv(g_patent, sep='\t', usecols=['patent_id', 'patent_date', 'patent_abstract', 'patent_title'], dtype=str)
-g_patent_df['combined_text'] = g_patent_df['patent_title'].str.lower() + ' ' + g_patent_df['patent_abstract'].str.lower().fillna('')
+# keep the loaded tables in compact dtypes (see patent_schema.py), can be turned on with --compact
+compact_dtypes = False
+
+# patents at the start of g_patent the planner estimates the filters on
+plan_sample_rows = 20000
+
+g_patent_columns = ['patent_id', 'patent_date', 'patent_abstract', 'patent_title']
+
+
+# Function to add the combined title + abstract text the keywords are searched in
+def add_combined_text(g_patent_df):
+    g_patent_df['combined_text'] = g_patent_df['patent_title'].str.lower() + ' ' + g_patent_df['patent_abstract'].str.lower().fillna('')
+    return g_patent_df
+
+
+# Function to load g_patent with the combined title + abstract text
+# it is read on first use (not at import) and kept for the next calls, see query_server.py for a resident process
+# compact=True gives the table in the compact dtypes of patent_schema.py
+@lru_cache(maxsize=2)
+def load_g_patent(file_path=g_patent, compact=False):
+    # keep specific columns in g_patent database
+    print('start reading g_patent file and choosing selected columns')
+    g_patent_df = add_combined_text(read_tsv(file_path, usecols=g_patent_columns, dtype=str))
+    if compact:
+        g_patent_df = compact_frame(g_patent_df, 'g_patent')
+    return g_patent_df
+
+
+# Function to load only the g_patent rows of the given patents (the cpc semi-join pushed into the read)
+def load_g_patent_of(patent_ids, file_path=g_patent, compact=False):
+    print('start reading the g_patent rows of the selected cpc codes')
+    g_patent_df = add_combined_text(read_tsv(file_path, usecols=g_patent_columns, dtype=str,
+                                             keep_keys={'patent_id': patent_ids}))
+    if compact:
+        g_patent_df = compact_frame(g_patent_df, 'g_patent')
+    return g_patent_df
+
+
+# Function to get the number of patents of g_patent without reading it (None if it is not known)
+def count_patents(file_path=g_patent):
+    meta = valid_cache_meta(file_path)
+    return meta['rows'] if meta is not None else None
+
+
+# Function to plan the order of the keyword scan and the cpc semi-join
+# both are timed on the first sample_rows patents, the share of patents the keywords keep is estimated on them
+# and the share of the cpc semi-join is exact when the number of patents is known. the filters are sorted by
+# seconds per patent / share of patents dropped, so the cheap filter that drops the most runs first.
+def plan_filters(matcher, cpc_patent_ids, file_path=g_patent, sample_rows=plan_sample_rows):
+    sample = add_combined_text(pd.read_csv(file_path, sep='\t', usecols=g_patent_columns, dtype=str, nrows=sample_rows))
+    cpc_patent_ids = set(cpc_patent_ids)
+    num_patents = count_patents(file_path)
+
+    start_time = time.perf_counter()
+    kept = matcher.contains(sample['combined_text'])
+    keyword_seconds = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    in_cpc = sample['patent_id'].isin(cpc_patent_ids)
+    cpc_seconds = time.perf_counter() - start_time
+
+    rows = max(len(sample), 1)
+    plan = [{'filter': 'keyword scan', 'share': kept.sum() / rows if len(sample) else 1.0,
+             'seconds_per_row': keyword_seconds / rows},
+            {'filter': 'cpc semi-join', 'share': min(len(cpc_patent_ids) / num_patents, 1.0) if num_patents
+             else (in_cpc.sum() / rows if len(sample) else 1.0), 'seconds_per_row': cpc_seconds / rows}]
+    for step in plan:
+        step['rank'] = step['seconds_per_row'] / max(1 - step['share'], 1e-9)
+    return sorted(plan, key=lambda step: step['rank'])
+
+
+def print_plan(plan):
+    print(f"  {'filter':<15} {'kept (est.)':>12} {'us per patent':>14}")
+    for step in plan:
+        print(f"  {step['filter']:<15} {step['share']:>12.3%} {step['seconds_per_row'] * 1e6:>14.2f}")
 
 
 # Function to filter g_patent database based on selected_word dictionary
+# the keyword set is compiled once into a multi-pattern matcher (see keyword_matcher.py)
 def filter_g_patent(selected_word,certain_database):
-    filtered_patents = certain_database[certain_database['combined_text'].str.contains('|'.join(selected_word), case=False)]
+    matcher = compile_keywords(selected_word)
+    filtered_patents = certain_database[matcher.contains(certain_database['combined_text'])]
 
     return filtered_patents
 
 # Function to filter g_cpc based on CPC codes
+# if an up to date CPC store exists only the partitions of the selected subclasses are read (see cpc_store.py)
 def filter_g_cpc_by_sequence(file_path, cpc_codes=None, sequence='0'):
     # Read the 'g_cpc' TSV file into a DataFrame and select only the required columns
     columns_to_keep = ['patent_id', 'cpc_subclass', 'cpc_sequence']
-    filtered_g_cpc = pd.read_csv(file_path, sep='\t', usecols=columns_to_keep, dtype=str)
+    if cpc_codes and store_is_current(file_path):
+        store = CpcStore(default_store_dir(file_path))
+        return store.query(subclasses=cpc_codes, sequence=sequence, columns=columns_to_keep)
+    filtered_g_cpc = read_tsv(file_path, usecols=columns_to_keep, dtype=str)
 
     # Filter the DataFrame to keep only rows where cpc_sequence is equal to the given sequence
     filtered_g_cpc = filtered_g_cpc[filtered_g_cpc['cpc_sequence'] == str(sequence)]
@@ -51,40 +148,170 @@ def filter_g_cpc_by_sequence(file_path, cpc_codes=None, sequence='0'):
 def left_join(left_df, right_df, key):
     return pd.merge(left_df, right_df, on=key, how='left')
 
+# Function to read a topics file: a json list of {"name": ..., "words": [...], "cpc_codes": [...]}
+# cpc_codes is optional, a topic without it keeps every cpc subclass (like an empty cpc_codes in main)
+def load_topics(topics_file):
+    with open(topics_file) as f:
+        topics = json.load(f)
+    names = set()
+    for topic in topics:
+        if not topic.get('words'):
+            raise ValueError(f"topic '{topic.get('name')}' has no words")
+        if topic['name'] in names:
+            raise ValueError(f"topic '{topic['name']}' is listed twice")
+        names.add(topic['name'])
+        topic.setdefault('cpc_codes', [])
+    return topics
+
+
+def topic_file_name(name):
+    return 'topic_' + re.sub(r'[^A-Za-z0-9_-]+', '_', name).strip('_') + '.csv'
+
+
+# Function to run all topics with one keyword scan and one g_cpc read
+# every topic csv is the same as the output of main() with the words and cpc_codes of that topic
+def filter_topics(topics, output_dir='.'):
+    os.makedirs(output_dir, exist_ok=True)
+    profiler = StageProfiler('num_patent_text&cpc topics')
+
+    # Step 0: Read g_cpc once for the cpc codes of all topics (all subclasses if a topic has none)
+    print('Step 0: Filtering g_cpc based on the CPC codes of all topics...')
+    with profiler.stage('Step 0: filter g_cpc') as stage:
+        if all(topic['cpc_codes'] for topic in topics):
+            all_cpc_codes = sorted(set().union(*(topic['cpc_codes'] for topic in topics)))
+            filtered_g_cpc = filter_g_cpc_by_sequence(g_cpc, all_cpc_codes, sequence='0')
+        else:
+            filtered_g_cpc = filter_g_cpc_by_sequence(g_cpc, None, sequence='0')
+        stage.rows_out = len(filtered_g_cpc)
+    print()
+
+    # Step 1-0: Plan the filters, the patents of no topic cpc code are only dropped before the scan when
+    # every topic has cpc codes
+    matcher = compile_keywords(set().union(*(topic['words'] for topic in topics)))
+    pushdown = False
+    if all(topic['cpc_codes'] for topic in topics):
+        print('Step 1-0: Planning the order of the keyword scan and the cpc semi-join...')
+        with profiler.stage('Step 1-0: plan the filters'):
+            plan = plan_filters(matcher, filtered_g_cpc['patent_id'].dropna())
+        print_plan(plan)
+        pushdown = plan[0]['filter'] == 'cpc semi-join'
+
+    print('Step 1-1: Reading g_patent...')
+    with profiler.stage('Step 1-1: read g_patent') as stage:
+        if pushdown:
+            g_patent_df = load_g_patent_of(filtered_g_cpc['patent_id'].dropna())
+        else:
+            g_patent_df = load_g_patent()
+        stage.rows_out = len(g_patent_df)
+
+    # Step 1: Search the keywords of all topics in one pass, every row gets the terms it contains
+    print(f'Step 1: Searching the keywords of {len(topics)} topics in g_patent...')
+    with profiler.stage('Step 1: keyword scan of all topics', rows_in=len(g_patent_df)) as stage:
+        found_terms = matcher.matching_terms(g_patent_df['combined_text'])
+        has_terms = (found_terms.map(len) > 0).to_numpy()
+        candidates = g_patent_df[has_terms]
+        candidate_terms = found_terms[has_terms]
+        stage.rows_out = len(candidates)
+    print(f"{len(candidates)} patents contain at least one keyword ({len(matcher.terms)} keywords)")
+    print()
+
+    # Step 3: Split the candidates per topic, join them with the cpc rows of the topic and store them
+    print('Step 3: Storing the patents of every topic...')
+    with profiler.stage('Step 3: split, join and write the topics', rows_in=len(candidates)) as stage:
+        summary = []
+        for topic in topics:
+            topic_terms = {word.lower() for word in topic['words']}
+            in_topic = candidate_terms.map(lambda terms: not topic_terms.isdisjoint(terms)).to_numpy(dtype=bool)
+            topic_cpc = filtered_g_cpc
+            if topic['cpc_codes']:
+                topic_cpc = filtered_g_cpc[filtered_g_cpc['cpc_subclass'].isin(topic['cpc_codes'])]
+            topic_patents = left_join(candidates[in_topic], topic_cpc, 'patent_id')
+            topic_patents = topic_patents.dropna(subset=['cpc_subclass'])
+
+            output_file = os.path.join(output_dir, topic_file_name(topic['name']))
+            topic_patents.to_csv(output_file, index=False)
+            summary.append({'topic': topic['name'], 'num_words': len(topic_terms),
+                            'cpc_codes': ' '.join(topic['cpc_codes']), 'num_rows': topic_patents.shape[0],
+                            'num_patents': topic_patents['patent_id'].nunique(), 'output_file': output_file})
+        summary = pd.DataFrame(summary)
+        summary_file = os.path.join(output_dir, 'topic_summary.csv')
+        summary.to_csv(summary_file, index=False)
+        stage.rows_out = int(summary['num_rows'].sum())
+    print()
+
+    print(summary[['topic', 'cpc_codes', 'num_rows', 'num_patents']].to_string(index=False))
+    print(f"the summary has been stored in '{summary_file}'.")
+    profiler.print_summary()
+    return summary
+
 # Main function
-def main():
+# with compact=True the join runs on the compact tables, the csv is the same
+# the keyword scan and the cpc semi-join run in the order of plan_filters, the csv is the same in every order
+def main(compact=compact_dtypes):
     selected_word = {'dental implant', 'Dental implant fixture', 'Dental implant fix', 'Dental implant screw',
                      'dental implant abutment', 'dental implant connect', 'dental implant connector',
                      'Dental implant artificial teeth', 'Dental implant artificial tooth', 'Dental implant artificial cap'}
     cpc_codes = ['A61C']
 
+    profiler = StageProfiler('num_patent_text&cpc')
+
     # Step 2: Filter g_cpc
     print('Step 2: Filtering g_cpc based on the provided CPC codes...')
-    start_time = time.time()
-    filtered_g_cpc = filter_g_cpc_by_sequence(g_cpc, cpc_codes, sequence='0')
-    print(f"Time taken: {time.time() - start_time:.2f} seconds")
+    with profiler.stage('Step 2: filter g_cpc') as stage:
+        filtered_g_cpc = filter_g_cpc_by_sequence(g_cpc, cpc_codes, sequence='0')
+        cpc_patent_ids = filtered_g_cpc['patent_id'].dropna()
+        if compact:
+            filtered_g_cpc = compact_frame(filtered_g_cpc, 'g_cpc')
+        stage.rows_out = len(filtered_g_cpc)
     print()
 
-    # Step 3: Left join g_patent with filtered_g_cpc
-    print('Step 3: Performing left join between g_patent and filtered_g_cpc...')
-    start_time = time.time()
-    joined_g_cpc = left_join(g_patent_df, filtered_g_cpc, 'patent_id')
-    print(f"Time taken: {time.time() - start_time:.2f} seconds")
+    # Step 3-0: Plan the order of the keyword scan and the cpc semi-join
+    print('Step 3-0: Planning the order of the keyword scan and the cpc semi-join...')
+    with profiler.stage('Step 3-0: plan the filters'):
+        matcher = compile_keywords(selected_word)
+        plan = plan_filters(matcher, cpc_patent_ids)
+    print_plan(plan)
+    pushdown = plan[0]['filter'] == 'cpc semi-join'
+
+    # Step 3-1: Read g_patent, only the rows of the cpc patents when the semi-join goes first
+    print('Step 3-1: Reading g_patent...')
+    with profiler.stage('Step 3-1: read g_patent') as stage:
+        if pushdown:
+            g_patent_df = load_g_patent_of(cpc_patent_ids, compact=compact)
+        else:
+            g_patent_df = load_g_patent(compact=compact)
+        stage.rows_out = len(g_patent_df)
     print()
 
-    # Step 4: Search the selected keywords in joined_g_cpc (previously filtered by CPC)
-    print('Step 4: Searching selected keywords in the filtered data...')
-    start_time = time.time()
-    filtered_patents = filter_g_patent(selected_word,joined_g_cpc)
-    print(f"Time taken: {time.time() - start_time:.2f} seconds")
+    # Step 3: Apply the filters in the order of the plan, each one on the patents the one before kept
+    g_patent_df, filtered_g_cpc = align_key(g_patent_df, filtered_g_cpc, 'patent_id')
+    for step in plan:
+        if step['filter'] == 'cpc semi-join' and pushdown:
+            continue
+        print(f"Step 3: {step['filter']} of {len(g_patent_df)} patents...")
+        with profiler.stage(f"Step 3: {step['filter']}", rows_in=len(g_patent_df)) as stage:
+            if step['filter'] == 'keyword scan':
+                g_patent_df = filter_g_patent(selected_word, g_patent_df)
+            else:
+                g_patent_df = g_patent_df[g_patent_df['patent_id'].isin(filtered_g_cpc['patent_id'])]
+            stage.rows_out = len(g_patent_df)
     print()
 
-    filtered_patents = filtered_patents.dropna(subset=['cpc_subclass'])
+    # Step 4: Join the patents that passed both filters with their cpc rows
+    print('Step 4: Performing inner join between the filtered g_patent and filtered_g_cpc...')
+    with profiler.stage('Step 4: join g_patent and g_cpc', rows_in=len(g_patent_df)) as stage:
+        filtered_patents = pd.merge(g_patent_df, filtered_g_cpc, on='patent_id', how='inner')
+        filtered_patents = filtered_patents.dropna(subset=['cpc_subclass'])
+        if compact:
+            filtered_patents = restore_frame(filtered_patents)
+        stage.rows_out = len(filtered_patents)
+    print()
 
 
     # Step 5: Store the final_data in a CSV
     output_file = 'new_topic_all.csv'
-    filtered_patents.to_csv(output_file, index=False)
+    with profiler.stage('Step 5: write the csv', rows_in=len(filtered_patents)):
+        filtered_patents.to_csv(output_file, index=False)
     print(f"new_topic has been stored in '{output_file}'.")
     print()
 
@@ -92,6 +319,17 @@ def main():
     # Step 6: Print the number of rows in the new_topic file
     num_rows = filtered_patents.shape[0]
     print("Number of patents in this topic:", num_rows)
+    profiler.print_summary()
+    print_memory_report()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='count the patents of a topic (keywords + optional cpc subclasses)')
+    parser.add_argument('--topics', default=None, help='json file with many topics, runs them all in one pass')
+    parser.add_argument('--output-dir', default='.', help='folder of the topic csv files (with --topics)')
+    parser.add_argument('--compact', action='store_true', default=compact_dtypes,
+                        help='keep the loaded tables in compact dtypes (same output, less memory)')
+    args = parser.parse_args()
+    if args.topics:
+        filter_topics(load_topics(args.topics), args.output_dir)
+    else:
+        main(compact=args.compact)
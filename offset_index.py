@@ -0,0 +1,221 @@
+'''
+patent_id -> byte offset index over the raw g_patent.tsv
+
+to look at the title and abstract of a few patents (spot checks, the sampling checks of the results) the
+scripts read all of g_patent. this index is built once per release (g_patent.tsv.offsets next to the TSV):
+- keys.npy: the int64 key (patent_schema.encode_patent_id) of every record, sorted
+- offsets.npy, lengths.npy: the byte offset and length of the record of every key in the TSV
+- meta.json: size and modification time of the TSV, its header line and number of records
+
+a record ends at a line break outside quotes: the TSV quotes fields with '"' (a quote inside a field is
+written as '""'), so a line break ends a record when the number of quotes since the start of the file is
+even. a quote inside a field that is not quoted is read as a plain character by read_csv but flips the
+count, so the record starts are checked against the lines that start with a patent id and a tab (see
+patent_reader.is_record_start). when they differ those lines are the record starts, if their number is
+the number of rows read_csv reads (otherwise the index is not built).
+the arrays and the TSV are memory mapped, a fetch only reads the records it needs and parses them
+with the header of the file, so the rows are the same as read_csv of the whole file gives.
+
+usage:
+python offset_index.py build g_patent.tsv
+python offset_index.py fetch g_patent.tsv 10000000 10000001
+python offset_index.py fetch g_patent.tsv --ids-file num_patent_cpc_solar.csv --output sample.csv
+'''
+
+import argparse
+import io
+import json
+import mmap
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from patent_reader import record_start_pattern
+from patent_schema import encode_patent_id, patent_id_pattern, prefix_codes
+from tsv_cache import valid_cache_meta
+
+# bytes of the TSV scanned at a time while building
+build_block_size = 1 << 26
+
+
+def default_offset_dir(file_path):
+    return file_path + '.offsets'
+
+
+# Function to find the end (position of the line break) of every record of a file, outside quotes
+def record_ends(data, block_size=build_block_size):
+    ends = []
+    quotes_before = 0
+    for start in range(0, len(data), block_size):
+        block = data[start:start + block_size]
+        quote_positions = np.flatnonzero(block == ord('"'))
+        line_breaks = np.flatnonzero(block == ord('\n'))
+        # number of quotes before every line break, from the start of the file
+        quote_counts = quotes_before + np.searchsorted(quote_positions, line_breaks)
+        ends.append(line_breaks[quote_counts % 2 == 0] + start)
+        quotes_before += len(quote_positions)
+    ends = np.concatenate(ends) if ends else np.zeros(0, dtype=np.int64)
+    if len(data) and (len(ends) == 0 or ends[-1] != len(data) - 1):
+        # last record without a line break
+        ends = np.append(ends, len(data))
+    return ends.astype(np.int64)
+
+
+# Function to find the starts of the lines that start with a patent id and a tab, after the header line
+def pattern_record_starts(mapped, header_end):
+    return np.fromiter((match.start() + 1 for match in record_start_pattern.finditer(mapped, header_end)),
+                       dtype=np.int64)
+
+
+# Function to count the records of a TSV as read_csv reads them (from the cache when it is up to date)
+def count_rows(file_path):
+    meta = valid_cache_meta(file_path)
+    if meta is not None:
+        return meta['rows']
+    return sum(len(chunk) for chunk in pd.read_csv(file_path, sep='\t', usecols=[0], dtype=str,
+                                                    chunksize=1000000))
+
+
+# Function to get the first field (patent_id) of every record
+def first_fields(data, starts):
+    fields = []
+    for start in starts.tolist():
+        fields.append(bytes(data[start:start + 40]).split(b'\t', 1)[0].strip(b'"').decode())
+    return fields
+
+
+# Function to build the offset index of a g_patent TSV
+def build_offset_index(file_path, offset_dir=None, block_size=build_block_size):
+    offset_dir = offset_dir or default_offset_dir(file_path)
+    os.makedirs(offset_dir, exist_ok=True)
+    stat = os.stat(file_path)
+    start_time = time.time()
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        data = np.frombuffer(mapped, dtype=np.uint8)
+        ends = record_ends(data, block_size)
+        header = bytes(data[:ends[0]]).decode().rstrip('\r')
+        header_end = int(ends[0])
+        # the first record is the header
+        starts = ends[:-1] + 1
+        ends = ends[1:]
+        keep = ends > starts
+        starts, ends = starts[keep], ends[keep]
+        line_starts = pattern_record_starts(mapped, header_end)
+        if not np.array_equal(starts, line_starts):
+            # a quote that read_csv reads as a plain character flipped the count
+            rows = count_rows(file_path)
+            if len(line_starts) != rows:
+                raise ValueError(f'the record starts of {file_path} cannot be found: {len(starts)} by the quotes, '
+                                 f'{len(line_starts)} lines that start with a patent id, {rows} rows')
+            print(f'the quotes give {len(starts)} records, using the {rows} lines that start with a patent id')
+            last_end = len(data) - 1 if data[-1] == ord('\n') else len(data)
+            starts, ends = line_starts, np.append(line_starts[1:] - 1, last_end)
+        print(f'found {len(starts)} records ({time.time() - start_time:.0f} seconds)')
+        keys = encode_patent_id(first_fields(data, starts))
+        del data
+
+    order = np.argsort(keys, kind='stable')
+    np.save(os.path.join(offset_dir, 'keys.npy'), keys[order])
+    np.save(os.path.join(offset_dir, 'offsets.npy'), starts[order])
+    np.save(os.path.join(offset_dir, 'lengths.npy'), (ends - starts)[order].astype(np.int32))
+    meta = {'source': os.path.basename(file_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'header': header, 'records': len(keys)}
+    with open(os.path.join(offset_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=1)
+    print(f'offset index of {len(keys)} records stored in {offset_dir} ({time.time() - start_time:.0f} seconds)')
+    return meta
+
+
+# Function to check that an offset index exists and was built from the current version of the TSV
+def offset_index_is_current(file_path, offset_dir=None):
+    meta_path = os.path.join(offset_dir or default_offset_dir(file_path), 'meta.json')
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    stat = os.stat(file_path)
+    return meta['size'] == stat.st_size and meta['mtime_ns'] == stat.st_mtime_ns
+
+
+class OffsetIndex:
+    def __init__(self, file_path, offset_dir=None):
+        self.file_path = file_path
+        offset_dir = offset_dir or default_offset_dir(file_path)
+        with open(os.path.join(offset_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.keys = np.load(os.path.join(offset_dir, 'keys.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(offset_dir, 'offsets.npy'), mmap_mode='r')
+        self.lengths = np.load(os.path.join(offset_dir, 'lengths.npy'), mmap_mode='r')
+
+    # Function to find the index positions of the records of the given patents, in the order of the file
+    def positions(self, patent_ids):
+        patent_ids = pd.Series(pd.unique(pd.Series(patent_ids, dtype=object).dropna()), dtype=object)
+        parts = patent_ids.str.extract(patent_id_pattern)
+        valid = parts[1].notna() & parts[0].isin(prefix_codes)
+        wanted = encode_patent_id(patent_ids[valid].to_numpy(dtype=object))
+        # a patent_id can have more than one record
+        lows = np.searchsorted(self.keys, wanted, side='left')
+        highs = np.searchsorted(self.keys, wanted, side='right')
+        counts = highs - lows
+        positions = np.repeat(lows - np.cumsum(np.append(0, counts[:-1])), counts) + np.arange(counts.sum())
+        return positions[np.argsort(self.offsets[positions], kind='stable')]
+
+    # Function to read the raw records (bytes without the line break) of the given patents
+    def records(self, patent_ids):
+        positions = self.positions(patent_ids)
+        with open(self.file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return [mapped[offset:offset + length] for offset, length in
+                    zip(self.offsets[positions].tolist(), self.lengths[positions].tolist())]
+
+    # Function to get the rows of the given patents as read_csv of the TSV gives them, in the order of the file
+    def fetch(self, patent_ids, usecols=None, dtype=str):
+        text = self.meta['header'].encode() + b'\n' + b'\n'.join(self.records(patent_ids)) + b'\n'
+        return pd.read_csv(io.BytesIO(text), sep='\t', usecols=usecols, dtype=dtype)
+
+
+# Function to read patent ids from a csv with a patent_id column or a file with one id per line
+def read_ids_file(ids_file):
+    with open(ids_file) as f:
+        first_line = f.readline()
+    if 'patent_id' in first_line:
+        return pd.read_csv(ids_file, usecols=['patent_id'], dtype=str)['patent_id'].tolist()
+    with open(ids_file) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='patent_id offset index over g_patent.tsv')
+    parser.add_argument('command', choices=['build', 'fetch'])
+    parser.add_argument('file_path', help='g_patent TSV')
+    parser.add_argument('patent_ids', nargs='*', help='patent ids to fetch')
+    parser.add_argument('--ids-file', default=None, help='csv with a patent_id column, or one id per line')
+    parser.add_argument('--columns', nargs='+', default=['patent_id', 'patent_title', 'patent_abstract'],
+                        help='columns to show or write')
+    parser.add_argument('--output', default=None, help='csv to write the fetched rows to')
+    parser.add_argument('--offset-dir', default=None)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_offset_index(args.file_path, args.offset_dir)
+        return
+    patent_ids = list(args.patent_ids)
+    if args.ids_file:
+        patent_ids += read_ids_file(args.ids_file)
+    index = OffsetIndex(args.file_path, args.offset_dir)
+    start_time = time.time()
+    rows = index.fetch(patent_ids, usecols=args.columns)
+    print(f'fetched {len(rows)} of {len(set(patent_ids))} patents ({(time.time() - start_time) * 1000:.1f} ms)')
+    if args.output:
+        rows.to_csv(args.output, index=False)
+        print(f"rows have been stored in '{args.output}'.")
+    else:
+        for row in rows.itertuples(index=False):
+            print()
+            for column, value in zip(rows.columns, row):
+                print(f'{column}: {value}')
+
+
+if __name__ == "__main__":
+    main()
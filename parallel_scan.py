@@ -0,0 +1,196 @@
+'''
+multi-core keyword scan of g_patent.tsv
+
+the file is split into byte ranges that start and end on record boundaries, every range is read and
+filtered by its own process and the matching rows are put back together in file order.
+
+abstracts are quoted and can contain new lines, so a new line only ends a record when it is outside
+of quotes. the quotes are counted from the previous range start up to every split point (escaped quotes
+are doubled, so the count stays even outside of a field) and the range starts at the first new line
+after the split point that has an even number of quotes before it.
+
+a quote inside a field that is not quoted is read as a plain character by read_csv but flips the count,
+so every range start is checked to be a line that starts with a patent id and a tab (see
+patent_reader.is_record_start), otherwise the range starts at the next such line. the records of all
+ranges are checked against the rows of the columnar cache (when there is one), and on a mismatch or a
+range that cannot be parsed the file is scanned by the chunked single process filter instead.
+
+usage (speedup report):
+python parallel_scan.py g_patent.tsv --workers 1 2 4 8 16 32
+'''
+
+import argparse
+import io
+import mmap
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from keyword_matcher import compile_keywords
+from patent_reader import filter_chunk, filter_g_patent_chunked, g_patent_columns, is_record_start, \
+    next_record_start
+from tsv_cache import valid_cache_meta
+
+# shards per worker, a few small shards balance the load better than one big shard per worker
+shards_per_worker = 4
+count_block_size = 1 << 24
+
+
+# Function to count the quotes of mm[start:end] without copying the whole range at once
+def count_quotes(mm, start, end):
+    count = 0
+    for block_start in range(start, end, count_block_size):
+        count += mm[block_start:min(block_start + count_block_size, end)].count(b'"')
+    return count
+
+
+# Function to find the byte ranges of the records, split into about num_shards equal parts
+# returns the header line as column names and a list of (start, end) ranges in file order
+def find_record_ranges(file_path, num_shards):
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        header_line = f.readline()
+    header = pd.read_csv(io.BytesIO(header_line), sep='\t', nrows=0).columns.tolist()
+    data_start = len(header_line)
+    if file_size <= data_start:
+        return header, []
+
+    boundaries = [data_start]
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        quotes_before = 0
+        position = data_start
+        for shard in range(1, num_shards):
+            target = data_start + (file_size - data_start) * shard // num_shards
+            if target <= boundaries[-1]:
+                continue
+            quotes_before += count_quotes(mm, position, target)
+            position = target
+            # walk to the next new line that is outside of quotes
+            while True:
+                newline = mm.find(b'\n', position)
+                if newline == -1:
+                    position = file_size
+                    break
+                quotes_before += count_quotes(mm, position, newline + 1)
+                position = newline + 1
+                if quotes_before % 2 == 0:
+                    break
+            if position < file_size and not is_record_start(mm, position):
+                # a quote that read_csv reads as a plain character flipped the count
+                position = next_record_start(mm, target)
+            if position >= file_size:
+                break
+            boundaries.append(position)
+            # a range starts outside of quotes, the next split point counts from here
+            quotes_before = 0
+    boundaries.append(file_size)
+    return header, list(zip(boundaries[:-1], boundaries[1:]))
+
+
+# file object that only reads the bytes of one range, so a worker can stream its shard
+class RangeReader(io.RawIOBase):
+    def __init__(self, file_path, start, end):
+        self._file = open(file_path, 'rb')
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        read = self._file.readinto(memoryview(buffer)[:size])
+        self._remaining -= read
+        return read
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+# Function to filter one byte range, runs in a worker process
+# returns the matching rows (index counted from the start of the range) and the number of records read
+def scan_range(file_path, start, end, header, usecols, selected_word, return_terms, chunksize):
+    matcher = compile_keywords(selected_word)
+    filtered_chunks = []
+    num_records = 0
+    with io.BufferedReader(RangeReader(file_path, start, end), buffer_size=1 << 20) as shard:
+        for chunk in pd.read_csv(shard, sep='\t', header=None, names=header, usecols=usecols, dtype=str,
+                                 chunksize=chunksize):
+            num_records += len(chunk)
+            filtered_chunks.append(filter_chunk(chunk, matcher, return_terms))
+    filtered = pd.concat(filtered_chunks) if filtered_chunks else None
+    return filtered, num_records
+
+
+# Function to run the keyword filter on g_patent with a process pool
+# gives the same rows, columns and index as the single process filter
+def filter_g_patent_parallel(file_path, selected_word, workers, usecols=None, chunksize=200000,
+                             return_terms=False):
+    usecols = usecols or g_patent_columns
+    header, ranges = find_record_ranges(file_path, workers * shards_per_worker)
+    selected_word = frozenset(selected_word)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(scan_range, file_path, start, end, header, usecols, selected_word,
+                                       return_terms, chunksize) for start, end in ranges]
+            results = [future.result() for future in futures]
+    except pd.errors.ParserError as error:
+        print(f'  a range of {file_path} could not be parsed ({error}), scanning it in one process')
+        return filter_g_patent_chunked(file_path, selected_word, usecols, chunksize, return_terms)
+
+    # the ranges must hold every record once
+    meta = valid_cache_meta(file_path)
+    records_read = sum(num_records for _, num_records in results)
+    if meta is not None and records_read != meta['rows']:
+        print(f"  the ranges of {file_path} hold {records_read:,} records instead of {meta['rows']:,}, "
+              f"scanning it in one process")
+        return filter_g_patent_chunked(file_path, selected_word, usecols, chunksize, return_terms)
+
+    # shift every shard's row index by the records of the shards before it
+    filtered_shards = []
+    records_before = 0
+    for filtered, num_records in results:
+        if filtered is not None:
+            filtered.index = filtered.index + records_before
+            filtered_shards.append(filtered)
+        records_before += num_records
+    if not filtered_shards:
+        return pd.DataFrame(columns=[c for c in header if c in usecols] + ['combined_text'], dtype=str)
+    return pd.concat(filtered_shards)
+
+
+# Main: time the scan for every worker count and print the speedup per core count
+def main():
+    from bench_keyword_matcher import blockchain_words
+
+    parser = argparse.ArgumentParser(description='speedup report of the parallel g_patent keyword scan')
+    parser.add_argument('file_path', nargs='?', default='g_patent.tsv')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--words', nargs='+', default=blockchain_words, help='keywords to search for')
+    args = parser.parse_args()
+
+    print(f"{'workers':>7} {'time (s)':>9} {'speedup':>8} {'efficiency':>10} {'patents':>8}")
+    # speedup and efficiency are relative to the first worker count (1 by default)
+    base_time = None
+    expected = None
+    for workers in args.workers:
+        start_time = time.time()
+        filtered_patents = filter_g_patent_parallel(args.file_path, args.words, workers)
+        elapsed = time.time() - start_time
+        if expected is None:
+            expected = filtered_patents
+        elif not filtered_patents.equals(expected):
+            raise AssertionError(f'result with {workers} workers differs from the first run')
+        base_time = base_time or elapsed
+        speedup = base_time / elapsed
+        efficiency = speedup / (workers / args.workers[0])
+        print(f'{workers:>7} {elapsed:>9.2f} {speedup:>7.2f}x {efficiency:>9.0%} {len(filtered_patents):>8}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+'''
+chunked reading of g_patent.tsv
+
+the keyword filter used to read the whole g_patent file and add a lower-cased combined_text column
+for every patent, so peak memory was several times the file size. here the file is read in chunks of
+`chunksize` rows, each chunk is filtered as soon as it arrives and only the matching rows are kept,
+so peak memory depends on the chunk size and not on the size of the dump.
+
+the raw file is also cut at record starts (parallel_scan.py, offset_index.py, topic_estimate.py): a record
+starts at a line that starts with a patent id and a tab, see is_record_start().
+'''
+
+import re
+
+import pandas as pd
+
+from keyword_matcher import compile_keywords
+from tsv_cache import iter_tsv_chunks
+
+g_patent_columns = ['patent_id', 'patent_date', 'patent_type', 'patent_abstract', 'patent_title']
+
+# start of a record: a line that starts with a patent id (quoted or not) and a tab
+record_start_pattern = re.compile(rb'\n"?[A-Z]*\d{1,12}"?\t')
+# how far the next record start is searched at a time
+record_search_bytes = 1 << 16
+
+
+# Function to check that a position of the raw file (bytes or mmap) is the start of a record
+def is_record_start(data, position):
+    return 0 < position < len(data) and record_start_pattern.match(data, position - 1) is not None
+
+
+# Function to find the first record start after a position of the raw file (len(data) if there is none)
+def next_record_start(data, position):
+    position = max(position, 1)
+    while position < len(data):
+        # the windows overlap, so a match across the end of a window is found in the next one
+        match = record_start_pattern.search(data, position - 1, position + record_search_bytes + 64)
+        if match is not None:
+            return match.start() + 1
+        position += record_search_bytes
+    return len(data)
+
+
+# Function to build the lower-cased title + abstract text that the keywords are searched in
+def combined_text(g_patent_df):
+    return g_patent_df['patent_title'].str.lower() + ' ' + g_patent_df['patent_abstract'].str.lower().fillna('')
+
+
+# Function to read g_patent chunk by chunk (the row index keeps counting across chunks)
+# goes through the columnar cache when it is available (see tsv_cache.py)
+def iter_g_patent_chunks(file_path, usecols=None, chunksize=500000):
+    return iter_tsv_chunks(file_path, usecols=usecols or g_patent_columns, dtype=str, chunksize=chunksize)
+
+
+# Function to filter one chunk of g_patent, combined_text is kept only for the matching rows
+def filter_chunk(chunk, matcher, return_terms=False):
+    text = combined_text(chunk)
+    mask = matcher.contains(text)
+    filtered = chunk[mask].copy()
+    filtered['combined_text'] = text[mask]
+    if return_terms:
+        filtered['matched_terms'] = matcher.matching_terms(filtered['combined_text']).str.join('; ')
+    return filtered
+
+
+# Function to stream g_patent and keep the patents that contain one of the selected words
+# gives the same rows, columns and index as filtering the fully loaded file
+def filter_g_patent_chunked(file_path, selected_word, usecols=None, chunksize=500000, return_terms=False):
+    matcher = compile_keywords(selected_word)
+    filtered_chunks = [filter_chunk(chunk, matcher, return_terms)
+                       for chunk in iter_g_patent_chunks(file_path, usecols, chunksize)]
+    if not filtered_chunks:
+        return pd.DataFrame(columns=(usecols or g_patent_columns) + ['combined_text'], dtype=str)
+    return pd.concat(filtered_chunks)
@@ -0,0 +1,147 @@
+'''
+compact dtypes for the loaded PatentsView tables
+
+every table is read with dtype=str, so each value is a python string object. compact_frame converts the
+known columns of a frame to smaller dtypes:
+- patent_id: int64 key, reversible (see encode_patent_id), so merges on patent_id compare integers
+- location_id and the low-cardinality columns (patent_type, cpc_sequence, cpc_section, cpc_class,
+  cpc_subclass, assignee_type, disambig_state, disambig_country): categoricals (dictionary codes)
+- assignee_sequence: int16 (missing -> 0, like convert_assignee_sequence in the scripts)
+- patent_date: datetime64
+
+restore_frame turns a compact frame back into the str version, so a csv written after restore_frame is
+the same as without the compact dtypes. a column is only converted when it converts without loss
+(e.g. an id that does not fit the key format keeps patent_id a categorical, an invalid date keeps
+patent_date as strings).
+
+compact_frame records the memory of every table before and after, see print_memory_report().
+'''
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# kind of every known column
+column_kinds = {
+    'patent_id': 'patent_key',
+    'location_id': 'category',
+    'patent_type': 'category',
+    'patent_date': 'date',
+    'cpc_sequence': 'category',
+    'cpc_section': 'category',
+    'cpc_class': 'category',
+    'cpc_subclass': 'category',
+    'assignee_sequence': 'int16',
+    'assignee_type': 'category',
+    'disambig_state': 'category',
+    'disambig_country': 'category',
+}
+
+# code of the letter prefix of a patent number (utility patents have none)
+patent_prefixes = ['', 'D', 'PP', 'RE', 'H', 'T', 'X', 'RX', 'AI']
+prefix_codes = {prefix: code for code, prefix in enumerate(patent_prefixes)}
+patent_id_pattern = re.compile(r'^([A-Z]*)(\d{1,12})$')
+number_base = 10 ** 12
+max_width = 16
+
+date_format = '%Y-%m-%d'
+
+# memory of every compacted table, see print_memory_report()
+memory_log = []
+
+
+# Function to encode patent ids as int64 keys: (prefix code * 16 + number of digits) * 10**12 + number
+# the number of digits keeps leading zeros ('H002100'), raises ValueError for an id of another format
+def encode_patent_id(patent_ids):
+    parts = pd.Series(patent_ids, dtype=object).str.extract(patent_id_pattern)
+    if parts[1].isna().any() or not parts[0].isin(prefix_codes).all():
+        raise ValueError('patent ids that do not fit the key format')
+    prefix = parts[0].map(prefix_codes).to_numpy(dtype=np.int64)
+    width = parts[1].str.len().to_numpy(dtype=np.int64)
+    number = parts[1].astype(np.int64).to_numpy()
+    return (prefix * max_width + width) * number_base + number
+
+
+# Function to turn int64 keys back into the patent id strings
+def decode_patent_id(keys):
+    keys = np.asarray(keys, dtype=np.int64)
+    number = keys % number_base
+    width = (keys // number_base) % max_width
+    prefix = keys // number_base // max_width
+    return np.array([f'{patent_prefixes[p]}{n:0{w}d}' for p, w, n in zip(prefix.tolist(), width.tolist(),
+                                                                        number.tolist())], dtype=object)
+
+
+# Function to convert one column, returns the column unchanged when it does not convert without loss
+def compact_column(values, kind):
+    if kind == 'int16':
+        numbers = pd.to_numeric(values, errors='coerce').fillna(0)
+        if (numbers.abs() > np.iinfo(np.int16).max).any() or (numbers % 1 != 0).any():
+            return values
+        return numbers.astype(np.int16)
+    if values.dtype != object:
+        return values
+    if kind == 'patent_key':
+        if values.isna().any():
+            return values.astype('category')
+        try:
+            return pd.Series(encode_patent_id(values), index=values.index, name=values.name)
+        except ValueError:
+            return values.astype('category')
+    if kind == 'date':
+        dates = pd.to_datetime(values, format=date_format, errors='coerce')
+        if not (dates.dt.strftime(date_format).where(dates.notna()) == values).where(values.notna(), True).all():
+            return values
+        return dates
+    return values.astype('category')
+
+
+# Function to convert the known columns of a frame to the compact dtypes, name is used in the memory report
+def compact_frame(df, name=None):
+    memory_before = df.memory_usage(deep=True).sum()
+    df = df.copy()
+    for column in df.columns:
+        if column in column_kinds:
+            df[column] = compact_column(df[column], column_kinds[column])
+    if name is not None:
+        memory_log.append({'table': name, 'rows': len(df), 'bytes_before': int(memory_before),
+                           'bytes_after': int(df.memory_usage(deep=True).sum())})
+    return df
+
+
+# Function to turn the compact columns back into the str version of the frame
+def restore_frame(df):
+    df = df.copy()
+    for column in df.columns:
+        kind = column_kinds.get(column)
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            df[column] = values.astype(object).where(values.notna(), np.nan)
+        elif kind == 'patent_key' and values.dtype == np.int64:
+            df[column] = decode_patent_id(values.to_numpy())
+        elif kind == 'date' and pd.api.types.is_datetime64_any_dtype(values):
+            df[column] = values.dt.strftime(date_format).where(values.notna(), np.nan)
+        elif kind == 'int16' and values.dtype == np.int16:
+            df[column] = values.astype(np.int64)
+    return df
+
+
+# Function to print the memory of every compacted table before and after
+def print_memory_report():
+    if not memory_log:
+        return
+    print('Memory of the loaded tables:')
+    print(f"  {'table':<30} {'rows':>12} {'str (MB)':>10} {'compact (MB)':>13} {'ratio':>7}")
+    for entry in memory_log:
+        ratio = entry['bytes_before'] / entry['bytes_after'] if entry['bytes_after'] else 0
+        print(f"  {entry['table']:<30} {entry['rows']:>12,} {entry['bytes_before'] / 1e6:>10.1f} "
+              f"{entry['bytes_after'] / 1e6:>13.1f} {ratio:>6.1f}x")
+
+
+# Function to give the key column the same dtype on both sides of a merge
+# (when one side could not be compacted both keys go back to strings)
+def align_key(left_df, right_df, key):
+    if left_df[key].dtype == right_df[key].dtype:
+        return left_df, right_df
+    return restore_frame(left_df), restore_frame(right_df)
@@ -12,8 +12,24 @@ this code is for running on server, rows are not limited and selected words are
 '''
 
 
+import argparse
 import pandas as pd
-import time
+
+from keyword_matcher import compile_keywords
+from tsv_cache import print_scan_report, read_tsv
+from stage_profiler import StageProfiler
+from assignee_aggregation import aggregate_assignees
+from patent_reader import filter_g_patent_chunked
+from parallel_scan import filter_g_patent_parallel
+from inverted_index import PatentIndex, default_index_dir, index_is_current
+from checkpoints import CheckpointStore, Step, run_steps
+from table_loader import TableLoader
+from result_writer import format_extensions, result_path, write_result
+from dimension_arrays import LocationDimension
+from assignee_table import (assignee_type_mapping_unified, convert_assignee_sequence, g_assignee_columns,
+                            g_assignee_dtype, prepare_assignees)
+from topic_estimate import default_blocks, estimate_topic, print_estimate
+from patent_schema import align_key, compact_frame, print_memory_report, restore_frame
 
 # go to this address to download the dataset
 # https://patentsview.org/download/data-download-tables
@@ -22,11 +38,61 @@ g_assignee = 'g_assignee_disambiguated_n.tsv'
 g_location = 'g_location_disambiguated_n.tsv'
 g_cpc = 'g_cpc_current_n.tsv'
 
+# number of g_patent rows read and filtered at a time, set to None to read the whole file at once
+g_patent_chunksize = 500000
+
+# number of processes for the keyword scan of g_patent (Step 1), can be changed with --workers
+g_patent_workers = 1
+
+final_data_file = 'final_data_blockchain_2024_n_1.csv'
+
+# format of the result of Step 6 (see result_writer.py): 'csv', 'csv.gz', 'csv.zst' or 'parquet',
+# can be changed with --output-format (the extension of the output file changes with it)
+result_format = 'csv'
+
+# keep the state after Steps 1 to 4 in 'checkpoints/' so a rerun resumes there, can be turned off with --no-checkpoints
+use_checkpoints = True
+
+# MB of tables read in threads while Step 1 runs (see table_loader.py), 0 reads them after it
+# the patents of Step 1 are not known yet, so g_cpc, g_assignee and g_location are read whole: set it (e.g.
+# --read-ahead-mb 4096) only with memory to spare and more than one CPU
+read_ahead_mb = 0
+
+# keep the frames of Steps 2 to 4 (and their checkpoints) in compact dtypes (see patent_schema.py), they are
+# turned back into strings before Step 5 so the result is the same, can be turned on with --compact
+compact_dtypes = False
+
+# columns read from the tables in Steps 2 to 4 (the g_assignee columns are in assignee_table.py)
+g_cpc_columns = ['patent_id', 'cpc_subclass', 'cpc_sequence','cpc_class']
+g_location_columns = ['location_id', 'disambig_state', 'disambig_country']
+
+selected_word = {'blockchain', 'bitcoin','bit-coin', 'block-chain', 'blocksign','codius','colored coin',
+                 'colored-coin', 'crypto currency', 'crypto-currency', 'cryptocurrency', 'distributed ledger',
+                 'distributed-ledger', 'dogecoin', 'doge-coin', 'ethereum','factom','litecoin','lite-coin',
+                 'pay-to-script-hash', 'p2sh', 'proof of stake', 'proof-of-stake', 'sidechain','smart contract',
+                 'smart-contract', 'factom','zcash','zerocash'}
+
 # Function to filter g_patent database based on selected_word dictionary
-def filter_g_patent(selected_word):
-    g_patent_df = pd.read_csv(g_patent, sep='\t', usecols=['patent_id', 'patent_date', 'patent_type', 'patent_abstract', 'patent_title'], dtype=str)
+# the keyword set is compiled once into a multi-pattern matcher (see keyword_matcher.py)
+# return_terms=True adds a 'matched_terms' column with the terms found in each patent
+# with a chunksize the file is streamed and only the matching rows are kept (see patent_reader.py)
+# with more than one worker the file is split into byte ranges scanned in parallel (see parallel_scan.py)
+# if an up to date inverted index of g_patent exists it answers the query instead (see inverted_index.py)
+def filter_g_patent(selected_word, return_terms=False, chunksize=g_patent_chunksize, workers=1, use_index=True):
+    if use_index and index_is_current(g_patent):
+        return PatentIndex(default_index_dir(g_patent)).filter(selected_word, return_terms=return_terms)
+    if workers > 1:
+        return filter_g_patent_parallel(g_patent, selected_word, workers, chunksize=chunksize or 200000,
+                                        return_terms=return_terms)
+    if chunksize:
+        return filter_g_patent_chunked(g_patent, selected_word, chunksize=chunksize, return_terms=return_terms)
+    matcher = compile_keywords(selected_word)
+    g_patent_df = read_tsv(g_patent, usecols=['patent_id', 'patent_date', 'patent_type', 'patent_abstract', 'patent_title'], dtype=str)
     g_patent_df['combined_text'] = g_patent_df['patent_title'].str.lower() + ' ' + g_patent_df['patent_abstract'].str.lower().fillna('')
-    filtered_patents = g_patent_df[g_patent_df['combined_text'].str.contains('|'.join(selected_word), case=False)]
+    filtered_patents = g_patent_df[matcher.contains(g_patent_df['combined_text'])]
+    if return_terms:
+        filtered_patents = filtered_patents.copy()
+        filtered_patents['matched_terms'] = matcher.matching_terms(filtered_patents['combined_text']).str.join('; ')
     return filtered_patents
 
 
@@ -34,178 +100,231 @@ def filter_g_patent(selected_word):
 def left_join(left_df, right_df, key):
     return pd.merge(left_df, right_df, on=key, how='left')
 
-def filter_g_cpc_by_sequence(file_path, sequence='0'):
+# with patent_ids only the rows of these patents are read (semi-join pushdown)
+# with a loader the table read ahead is used (see table_loader.py)
+def filter_g_cpc_by_sequence(file_path, sequence='0', patent_ids=None, loader=None):
     # Read the 'g_cpc' TSV file into a DataFrame and select only the required columns
-    columns_to_keep = ['patent_id', 'cpc_subclass', 'cpc_sequence','cpc_class']
-    filtered_g_cpc = pd.read_csv(file_path, sep='\t', usecols=columns_to_keep, dtype=str)
+    keep_keys = {'patent_id': patent_ids} if patent_ids is not None else None
+    read = loader.read_tsv if loader is not None else read_tsv
+    filtered_g_cpc = read(file_path, usecols=g_cpc_columns, dtype=str, keep_keys=keep_keys)
 
     # Filter the DataFrame to keep only rows where cpc_sequence is equal to the given sequence
     filtered_g_cpc = filtered_g_cpc[filtered_g_cpc['cpc_sequence'] == str(sequence)]
 
     return filtered_g_cpc
 
-# Step 3-1: Concatenate assignee_sequence for each patent_id
-def concat_sequence(group):
-    # Convert 'assignee_sequence' to string type and fill NaN with '0'
-    group['assignee_sequence'] = group['assignee_sequence'].astype(str).fillna('0')
-    #sorted_sequences = sorted(group['assignee_sequence'])
-    return ', '.join(group['assignee_sequence'])
-
-# Step 3-3: If assignee_sequence is greater than 0, aggregate the columns for each patent_id
-def aggregate_assignees_reg(group):
-    max_sequence = group['assignee_sequence'].max()
-    if max_sequence != 0:
-        group['assignee_sequence'] = concat_sequence(group)
-        assignee_types = '& '.join(group['assignee_type_reg'].astype(str))
-        assignee_names = '& '.join(group['assignee_name'].astype(str))
-        disambig_states = '& '.join(group['disambig_state'].astype(str))
-        disambig_countries = '& '.join(group['disambig_country'].astype(str))
-        group.iloc[0, group.columns.get_loc('assignee_type_reg')] = assignee_types
-        group.iloc[0, group.columns.get_loc('assignee_name')] = assignee_names
-        group.iloc[0, group.columns.get_loc('disambig_state')] = disambig_states
-        group.iloc[0, group.columns.get_loc('disambig_country')] = disambig_countries
-        return group.iloc[[0]]
-    else:
-        return group
-
-
-#Define a function to convert assignee_sequence to int and handle NaN values
-def convert_assignee_sequence(value):
-    try:
-        return int(value)
-    except (ValueError, TypeError):
-        return 0  # Or any other default value you prefer
-
-# Main function
-def main():
-
-
-    selected_word = {'blockchain', 'bitcoin','bit-coin', 'block-chain', 'blocksign','codius','colored coin',
-                 'colored-coin', 'crypto currency', 'crypto-currency', 'cryptocurrency', 'distributed ledger',
-                 'distributed-ledger', 'dogecoin', 'doge-coin', 'ethereum','factom','litecoin','lite-coin',
-                 'pay-to-script-hash', 'p2sh', 'proof of stake', 'proof-of-stake', 'sidechain','smart contract',
-                 'smart-contract', 'factom','zcash','zerocash'}
-
-
-    # Define a mapping dictionary for assignee_type values
-    assignee_type_mapping_reg = {
-        1: 'Unassigned',
-        2: 'US Company or Corporation',
-        3: 'Foreign Company or Corporation',
-        4: 'US Individual',
-        5: 'Foreign Individual',
-        6: 'US Federal Government',
-        7: 'Foreign Government',
-        8: 'US County Government',
-        9: 'US State Government',
-    }
-
-    assignee_type_mapping_unified = {
-        'Unassigned': 'Unassigned',
-        'US Company or Corporation': 'Company',
-        'Foreign Company or Corporation': 'Company',
-        'US Individual': 'Individual',
-        'Foreign Individual': 'Individual',
-        'US Federal Government': 'Government',
-        'Foreign Government': 'Government',
-        'US County Government': 'Government',
-        'US State Government': 'Government',
-    }
-    # Step 1: Filter g_patent
-    print('Step 1: Filtering g_patent based on selected words...')
-    start_time = time.time()
-    filtered_patents = filter_g_patent(selected_word)
-    print(f"Time taken: {time.time() - start_time:.2f} seconds")
-    print('First 3 rows of filtered_patents:')
-    print(filtered_patents.head(3))
-    print()
+# Function to start reading the tables of Steps 2 to 4 in threads, with the arguments the steps read them with
+def start_read_ahead(loader):
+    loader.prefetch(g_cpc, usecols=g_cpc_columns, dtype=str)
+    loader.prefetch(g_assignee, usecols=g_assignee_columns, dtype=g_assignee_dtype,
+                    converters={'assignee_sequence': convert_assignee_sequence})
+    loader.prefetch(g_location, usecols=g_location_columns, dtype=str)
 
+# Function to join the filtered patents with the first cpc code of g_cpc (Step 2)
+# with compact=True the join runs on the compact tables (see patent_schema.py)
+def join_cpc(filtered_patents, profiler, loader=None, compact=False):
     # Step 2-0: keep first cpc code in g_cpc
     print('Step 2-0: keep data with sequence= 0 in cpc file')
-    filtered_g_cpc= filter_g_cpc_by_sequence(g_cpc, sequence='0')
+    with profiler.stage('Step 2-0: read g_cpc') as stage:
+        filtered_g_cpc= filter_g_cpc_by_sequence(g_cpc, sequence='0', patent_ids=filtered_patents['patent_id'],
+                                                 loader=loader)
+        if compact:
+            filtered_patents = compact_frame(filtered_patents, 'filtered g_patent')
+            filtered_g_cpc = compact_frame(filtered_g_cpc, 'g_cpc')
+            filtered_patents, filtered_g_cpc = align_key(filtered_patents, filtered_g_cpc, 'patent_id')
+        stage.rows_out = len(filtered_g_cpc)
 
     # Step 2: Left join g_patent with g_cpc
     print('Step 2: Performing left join between g_patent and g_cpc...')
-    start_time = time.time()
-    joined_g_cpc = left_join(filtered_patents, filtered_g_cpc, 'patent_id')
-    print(f"Time taken: {time.time() - start_time:.2f} seconds")
+    with profiler.stage('Step 2: join g_cpc', rows_in=len(filtered_patents)) as stage:
+        joined_g_cpc = left_join(filtered_patents, filtered_g_cpc, 'patent_id')
+        stage.rows_out = len(joined_g_cpc)
     print()
     print('First 3 rows of cpc and patent joined:')
     print(joined_g_cpc.head(3))
     print()
+    return joined_g_cpc
 
+
+# Function to join the assignees of the patents (Step 3), gives the joined rows and the assignee rows
+# with compact=True the join runs on the compact tables (see patent_schema.py)
+def join_assignees(joined_g_cpc, profiler, loader=None, compact=False):
     # Step 3: Left join joined_g_cpc with g_assignee
     print('Step 3: Performing left join between joined_g_cpc and g_assignee...')
-    start_time = time.time()
-
-    ##g_assignee_df = pd.read_csv(g_assignee, sep='\t', usecols=['patent_id', 'disambig_assignee_individual_name_first', 'disambig_assignee_individual_name_last', 'disambig_assignee_organization','assignee_sequence','assignee_type', 'location_id'], dtype=str)
-    g_assignee_df = pd.read_csv(g_assignee, sep='\t', usecols=['patent_id', 'disambig_assignee_individual_name_first', 'disambig_assignee_individual_name_last', 'disambig_assignee_organization','assignee_sequence','assignee_type', 'location_id'], dtype={'patent_id': str, 'disambig_assignee_individual_name_first': str, 'disambig_assignee_individual_name_last': str, 'disambig_assignee_organization': str, 'assignee_type': str, 'location_id': str}, converters={'assignee_sequence': convert_assignee_sequence})
-
-    # Duplicate the 'assignee_type' column to create two new columns
-    g_assignee_df['assignee_type'] = g_assignee_df['assignee_type'].fillna('0').astype(int)
-    g_assignee_df['assignee_type_reg'] = g_assignee_df['assignee_type']
-
-    # Apply the 'assignee_type_mapping_reg' mappings
-    g_assignee_df['assignee_type_reg'] = g_assignee_df['assignee_type_reg'].map(assignee_type_mapping_reg).fillna(
-        'Unknown')
-
-    # Handle incompatible data types
-    g_assignee_df['assignee_type_reg'] = g_assignee_df['assignee_type_reg'].astype(str)
-
-    # Merge 'disambig_assignee_individual_name_first' and 'disambig_assignee_individual_name_last' into 'assignee_name'
-    g_assignee_df['assignee_name'] = g_assignee_df['disambig_assignee_organization']
-    empty_mask = g_assignee_df['assignee_name'].isnull()
-    g_assignee_df.loc[empty_mask, 'assignee_name'] = g_assignee_df['disambig_assignee_individual_name_first'] + ' ' + \
-                                                     g_assignee_df['disambig_assignee_individual_name_last']
-    g_assignee_df.drop(columns=['disambig_assignee_individual_name_first', 'disambig_assignee_individual_name_last',
-                                'disambig_assignee_organization'], inplace=True)
-
-
-    final_data = left_join(joined_g_cpc, g_assignee_df, 'patent_id')
-
-
-    print(f"Time taken: {time.time() - start_time:.2f} seconds")
+    with profiler.stage('Step 3-0: read g_assignee') as stage:
+        ##g_assignee_df = pd.read_csv(g_assignee, sep='\t', usecols=['patent_id', 'disambig_assignee_individual_name_first', 'disambig_assignee_individual_name_last', 'disambig_assignee_organization','assignee_sequence','assignee_type', 'location_id'], dtype=str)
+        # only the assignee rows of the selected patents are read
+        read = loader.read_tsv if loader is not None else read_tsv
+        g_assignee_df = read(g_assignee, usecols=g_assignee_columns, dtype=g_assignee_dtype, converters={'assignee_sequence': convert_assignee_sequence},
+                             keep_keys={'patent_id': restore_frame(joined_g_cpc[['patent_id']])['patent_id']})
+        stage.rows_out = len(g_assignee_df)
+
+    with profiler.stage('Step 3: prepare and join g_assignee', rows_in=len(joined_g_cpc)) as stage:
+        # assignee_type_reg and assignee_name, the same for every user of g_assignee (see assignee_table.py)
+        g_assignee_df = prepare_assignees(g_assignee_df)
+        if compact:
+            g_assignee_df = compact_frame(g_assignee_df, 'g_assignee')
+            joined_g_cpc, g_assignee_df = align_key(joined_g_cpc, g_assignee_df, 'patent_id')
+
+        final_data = left_join(joined_g_cpc, g_assignee_df, 'patent_id')
+        stage.rows_out = len(final_data)
     print()
+    return final_data, g_assignee_df
+
 
+# Function to join the locations of the assignees (Step 4)
+def join_locations(final_data, g_assignee_df, profiler, loader=None):
     # Step 4: Left join final_data with g_location based on location_id
     print('Step 4: Performing left join between final_data and g_location...')
-    start_time = time.time()
-    g_location_df = pd.read_csv(g_location, sep='\t', usecols=['location_id', 'disambig_state', 'disambig_country'], dtype=str)
-    final_data = left_join(final_data, g_location_df, 'location_id')
-    print(f"Time taken: {time.time() - start_time:.2f} seconds")
+    with profiler.stage('Step 4-0: read g_location') as stage:
+        # only the locations of the selected assignees are read
+        read = loader.read_tsv if loader is not None else read_tsv
+        g_location_df = read(g_location, usecols=g_location_columns, dtype=str,
+                             keep_keys={'location_id': g_assignee_df['location_id'].dropna()})
+        stage.rows_out = len(g_location_df)
+    with profiler.stage('Step 4: join g_location', rows_in=len(final_data)) as stage:
+        # state and country are gathered by the dense index of the location_id (see dimension_arrays.py)
+        final_data = LocationDimension(g_location_df).join(final_data)
+        stage.rows_out = len(final_data)
     print()
+    return final_data
+
 
+# Function to aggregate the assignees of every patent (Step 5)
+# float_sequences=True gives the assignee numbers as floats, as they are when some patent has no assignee
+# (used by incremental_update.py to process a part of the patents the way the whole run does)
+def aggregate(final_data, g_assignee_df, profiler, float_sequences=False):
     # Step 5: Remove cpc_sequence and location_id columns from the final_data
     final_data.drop(columns=['cpc_sequence', 'location_id', 'combined_text'], inplace=True)
+    if float_sequences:
+        final_data['assignee_type'] = final_data['assignee_type'].astype(float)
+        final_data['assignee_sequence'] = final_data['assignee_sequence'].astype(float)
+
+    with profiler.stage('Step 5: aggregate the assignees', rows_in=len(final_data)) as stage:
+        # Step 5-1: Find the maximum assignee_sequence for each patent_id
+        max_assignee_sequence = g_assignee_df.groupby('patent_id')['assignee_sequence'].max().reset_index()
+        if float_sequences:
+            max_assignee_sequence['assignee_sequence'] = max_assignee_sequence['assignee_sequence'].astype(float)
+
+        # Step 5-2: Aggregate the assignees of every patent_id and add assignee_type_unified
+        # (vectorized, same result as the old groupby('patent_id').apply(aggregate_assignees_reg))
+        final_data = aggregate_assignees(final_data, assignee_type_mapping_unified)
+
+        # Step 5-3: Merge max_assignee_sequence with final_data
+        final_data = pd.merge(final_data, max_assignee_sequence, on='patent_id', how='left')
+        stage.rows_out = len(final_data)
+
+    return final_data
+
+
+# Function to join the filtered patents with g_cpc, g_assignee and g_location and aggregate the assignees (Steps 2 to 5)
+def join_and_aggregate(filtered_patents, profiler, float_sequences=False):
+    joined_g_cpc = join_cpc(filtered_patents, profiler)
+    final_data, g_assignee_df = join_assignees(joined_g_cpc, profiler)
+    final_data = join_locations(final_data, g_assignee_df, profiler)
+    return aggregate(final_data, g_assignee_df, profiler, float_sequences)
+
+
+# Function to get Steps 1 to 4 as checkpointed steps (see checkpoints.py)
+# with a loader the tables of Steps 2 to 4 are read in threads while Step 1 runs
+# with compact=True the frames of Steps 2 to 4 are kept in compact dtypes
+def pipeline_steps(profiler, workers, loader=None, compact=False):
+    def keyword_scan(state):
+        # Step 1: Filter g_patent
+        print('Step 1: Filtering g_patent based on selected words...')
+        with profiler.stage('Step 1: keyword scan of g_patent') as stage:
+            filtered_patents = filter_g_patent(selected_word, workers=workers)
+            stage.rows_out = len(filtered_patents)
+        print('First 3 rows of filtered_patents:')
+        print(filtered_patents.head(3))
+        print()
+        return {'filtered_patents': filtered_patents}
+
+    def cpc_step(state):
+        return {'joined_g_cpc': join_cpc(state['filtered_patents'], profiler, loader, compact)}
+
+    def assignee_step(state):
+        final_data, g_assignee_df = join_assignees(state['joined_g_cpc'], profiler, loader, compact)
+        return {'final_data': final_data, 'g_assignee_df': g_assignee_df}
+
+    def location_step(state):
+        final_data = join_locations(state['final_data'], state['g_assignee_df'], profiler, loader)
+        return {'final_data': final_data, 'g_assignee_df': state['g_assignee_df']}
+
+    # the tables of Steps 2 to 4 are read while Step 1 runs, a setup of Step 1 that is not part of its key
+    read_ahead = (lambda: start_read_ahead(loader)) if loader is not None else None
+    return [Step('Step 1', keyword_scan, params={'selected_word': sorted(selected_word)}, files=[g_patent],
+                 setup=read_ahead),
+            Step('Step 2', cpc_step, params={'sequence': '0', 'columns': g_cpc_columns, 'compact': compact},
+                 files=[g_cpc]),
+            Step('Step 3', assignee_step, params={'columns': g_assignee_columns, 'dtype': g_assignee_dtype,
+                                                  'compact': compact}, files=[g_assignee]),
+            Step('Step 4', location_step, params={'columns': g_location_columns, 'compact': compact},
+                 files=[g_location])]
 
-    # Step 5-1: Find the maximum assignee_sequence for each patent_id
-    max_assignee_sequence = g_assignee_df.groupby('patent_id')['assignee_sequence'].max().reset_index()
-
-    # Step 5-2: Merge max_assignee_sequence with final_data
-    final_data = final_data.groupby('patent_id').apply(aggregate_assignees_reg).reset_index(drop=True)
-
-    # Split the 'assignee_type_reg' column on '&'
-    split_assignee_types = final_data['assignee_type_reg'].str.split('&')
-
-    # Map and join each part with '&'
-    unified_assignee_types = split_assignee_types.apply(
-        lambda parts: ' & '.join([assignee_type_mapping_unified.get(part.strip(), part.strip()) for part in parts]))
 
-    # Assign the result to the 'assignee_type_unified' column
-    final_data['assignee_type_unified'] = unified_assignee_types
-
-    # Step 5-3: Merge max_assignee_sequence with final_data
-    final_data = pd.merge(final_data, max_assignee_sequence, on='patent_id', how='left')
+# Main function
+# with checkpoints=True the state after Steps 1 to 4 is kept and a rerun resumes from the last step done
+# with read_ahead_memory_mb the tables of Steps 2 to 4 are read while Step 1 runs, 0 reads them one by one
+# with compact=True Steps 2 to 4 run on the compact tables, the result is the same
+def main(workers=g_patent_workers, checkpoints=use_checkpoints, restart=False,
+         read_ahead_memory_mb=read_ahead_mb, output_format=result_format, compact=compact_dtypes):
+    profiler = StageProfiler('patent_whole_data_selected_words')
+    store = CheckpointStore('patent_whole_data_selected_words') if checkpoints else None
+    if store is not None and restart:
+        store.clear()
+
+    loader = TableLoader(memory_cap_mb=read_ahead_memory_mb) if read_ahead_memory_mb else None
+    try:
+        state = run_steps(pipeline_steps(profiler, workers, loader, compact), store, profiler)
+    finally:
+        if loader is not None:
+            loader.close()
+    final_data, g_assignee_df = state['final_data'], state['g_assignee_df']
+    if compact:
+        # the aggregation and the result work on the str version of the frames
+        final_data, g_assignee_df = restore_frame(final_data), restore_frame(g_assignee_df)
+    final_data = aggregate(final_data, g_assignee_df, profiler)
 
     # Step 5-4: Print the number of distinct patent IDs with sequence=0
     num_distinct_patents = final_data['patent_id'].nunique()
     print("Number of distinct patent IDs with sequence=0:", num_distinct_patents)
 
-    # Step 6: Store the final_data in a CSV
-    output_file = 'final_data_blockchain_2024_n_1.csv'
-    final_data.to_csv(output_file, index=False)
+    # Step 6: Store the final_data in a CSV (or the format of output_format), written in batches
+    output_file = result_path(final_data_file, output_format)
+    with profiler.stage('Step 6: write the result', rows_in=len(final_data)):
+        write_result(final_data, output_file, output_format)
     print(f"Final data has been stored in '{output_file}'.")
     print()
+    profiler.print_summary()
+    print_scan_report()
+    print_memory_report()
+
+# Function to estimate how many patents selected_word matches and their primary cpc subclasses from random
+# blocks of g_patent, in seconds instead of a full run (see topic_estimate.py)
+def estimate(blocks=default_blocks):
+    print(f'Estimating the patents of {len(selected_word)} selected words from {blocks} random blocks of g_patent...')
+    print_estimate(estimate_topic(selected_word, g_patent, g_cpc, blocks=blocks))
+
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=g_patent_workers,
+                        help='number of processes for the g_patent keyword scan (Step 1)')
+    parser.add_argument('--no-checkpoints', action='store_true', help='do not keep or use the step checkpoints')
+    parser.add_argument('--restart', action='store_true', help='remove the checkpoints and run all steps again')
+    parser.add_argument('--read-ahead-mb', type=int, default=read_ahead_mb,
+                        help='memory for the tables read during Step 1, 0 reads them after it')
+    parser.add_argument('--output-format', choices=list(format_extensions), default=result_format,
+                        help='format of the result file')
+    parser.add_argument('--compact', action='store_true', default=compact_dtypes,
+                        help='keep the frames of Steps 2 to 4 in compact dtypes (same output, less memory)')
+    parser.add_argument('--estimate', action='store_true',
+                        help='only estimate the number of patents and their cpc split from random blocks')
+    parser.add_argument('--estimate-blocks', type=int, default=default_blocks, help='number of blocks of --estimate')
+    args = parser.parse_args()
+    if args.estimate:
+        estimate(args.estimate_blocks)
+    else:
+        main(workers=args.workers, checkpoints=not args.no_checkpoints, restart=args.restart,
+             read_ahead_memory_mb=args.read_ahead_mb, output_format=args.output_format, compact=args.compact)
@@ -0,0 +1,226 @@
+'''
+resident query server for keyword, CPC and patent-list queries
+
+every run of the scripts parses g_patent and g_cpc again before it can answer one question.
+this process loads the tables once, keeps them in memory and answers queries over local HTTP,
+so a repeated query only pays for the filtering.
+
+tables kept warm:
+- g_patent: patent_id, patent_type, patent_date, patent_title, patent_abstract and the lower-cased
+  combined_text of num_patent_text&cpc.py
+- g_cpc: the cpc_sequence == 0 rows (patent_id, cpc_subclass, cpc_sequence, cpc_class, cpc_group)
+with --compact the tables are kept in the compact dtypes of patent_schema.py (same answers, less memory)
+
+queries (POST with a json body, answers are json):
+- /keywords {"words": [...], "cpc_codes": [...]}: the patents of num_patent_text&cpc.py for these words and
+  cpc subclasses (cpc_codes is optional)
+- /cpc {"cpc_codes": [...]}: the patents of num_patent_cpc.py for these cpc subclasses
+- /patents {"patent_ids": [...]}: the g_patent rows of these patent ids
+every query also takes "limit" (number of rows returned in the answer, default 100) and, when the server
+was started with --output-dir, "output_file": the rows are written as csv to a file of that name in the
+output directory (a plain file name, not a path, so a client cannot write anywhere else)
+GET /status lists the loaded tables
+
+usage:
+python query_server.py --port 8765 --output-dir query_results
+curl -s localhost:8765/keywords -d '{"words": ["dental implant"], "cpc_codes": ["A61C"]}'
+'''
+
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from keyword_matcher import compile_keywords
+from patent_schema import compact_frame, encode_patent_id, patent_id_pattern, prefix_codes, restore_frame
+from tsv_cache import read_tsv
+
+# go to this address to download the dataset
+# https://patentsview.org/download/data-download-tables
+g_patent = 'g_patent.tsv'
+g_cpc = 'g_cpc_current.tsv'
+
+default_limit = 100
+
+
+class WarmTables:
+    '''
+    the parsed tables, each one is loaded on first use and then kept in memory
+    '''
+
+    def __init__(self, g_patent_path=g_patent, g_cpc_path=g_cpc, compact=False):
+        self.paths = {'g_patent': g_patent_path, 'g_cpc': g_cpc_path}
+        self.compact = compact
+        self.tables = {}
+        self.load_seconds = {}
+        self._lock = threading.Lock()
+
+    def _load(self, name):
+        if name == 'g_patent':
+            df = read_tsv(self.paths[name], usecols=['patent_id', 'patent_type', 'patent_date',
+                                                     'patent_title', 'patent_abstract'], dtype=str)
+            df['combined_text'] = df['patent_title'].str.lower() + ' ' + df['patent_abstract'].str.lower().fillna('')
+            return df
+        df = read_tsv(self.paths[name], usecols=['patent_id', 'cpc_sequence', 'cpc_class', 'cpc_subclass',
+                                                 'cpc_group'], dtype=str)
+        return df[df['cpc_sequence'] == '0'].reset_index(drop=True)
+
+    def get(self, name):
+        with self._lock:
+            if name not in self.tables:
+                print(f"loading {name} from '{self.paths[name]}'...")
+                start_time = time.time()
+                self.tables[name] = self._load(name)
+                if self.compact:
+                    self.tables[name] = compact_frame(self.tables[name], name)
+                self.load_seconds[name] = time.time() - start_time
+                print(f"{name}: {len(self.tables[name])} rows loaded in {self.load_seconds[name]:.2f} seconds")
+            return self.tables[name]
+
+    def status(self):
+        return {name: {'rows': len(df), 'load_seconds': round(self.load_seconds[name], 3),
+                       'memory_mb': round(df.memory_usage(deep=True).sum() / 1e6, 1)}
+                for name, df in self.tables.items()}
+
+
+# Function to answer a keyword query, same rows and columns as num_patent_text&cpc.py
+def keyword_query(tables, words, cpc_codes=None):
+    g_patent_df = tables.get('g_patent')
+    g_cpc_df = tables.get('g_cpc')
+    matcher = compile_keywords(set(words))
+    candidates = g_patent_df[matcher.contains(g_patent_df['combined_text'])]
+    filtered_g_cpc = g_cpc_df.drop(columns=['cpc_class', 'cpc_group'])
+    if cpc_codes:
+        filtered_g_cpc = filtered_g_cpc[filtered_g_cpc['cpc_subclass'].isin(cpc_codes)]
+    joined = pd.merge(candidates.drop(columns=['patent_type']), filtered_g_cpc, on='patent_id', how='left')
+    return restore_frame(joined.dropna(subset=['cpc_subclass']))
+
+
+# Function to answer a CPC query, same rows and columns as num_patent_cpc.py
+def cpc_query(tables, cpc_codes):
+    g_cpc_df = tables.get('g_cpc')
+    return restore_frame(g_cpc_df[g_cpc_df['cpc_subclass'].isin(cpc_codes)])
+
+
+# Function to answer a patent-list query, the g_patent rows of the patent ids (in g_patent order)
+def patent_query(tables, patent_ids):
+    g_patent_df = tables.get('g_patent')
+    patent_ids = pd.Series(list(map(str, patent_ids)), dtype=object)
+    if g_patent_df['patent_id'].dtype == 'int64':
+        # an id that does not fit the key format is not in g_patent, it is left out as without --compact
+        parts = patent_ids.str.extract(patent_id_pattern)
+        patent_ids = encode_patent_id(patent_ids[parts[1].notna() & parts[0].isin(prefix_codes)])
+    return restore_frame(g_patent_df.loc[g_patent_df['patent_id'].isin(set(patent_ids)), g_patent_df.columns[:-1]])
+
+
+# Function to find where an output_file of a query is written: a plain file name in the output directory
+def output_path(output_dir, output_file):
+    if output_dir is None:
+        raise ValueError('output_file is not enabled, start the server with --output-dir')
+    if not isinstance(output_file, str) or os.path.basename(output_file) != output_file \
+            or output_file in ('.', '..'):
+        raise ValueError(f'output_file must be a file name without a directory, got {output_file!r}')
+    return os.path.join(output_dir, output_file)
+
+
+# Function to turn a query result into the json answer
+def result_answer(result, request, seconds, output_dir=None):
+    answer = {'num_rows': len(result), 'num_patents': int(result['patent_id'].nunique()),
+              'seconds': round(seconds, 3)}
+    if request.get('output_file'):
+        path = output_path(output_dir, request['output_file'])
+        result.to_csv(path, index=False)
+        answer['output_file'] = path
+    limit = int(request.get('limit', default_limit))
+    answer['rows'] = json.loads(result.head(limit).to_json(orient='records'))
+    return answer
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    tables = None
+    output_dir = None
+
+    def send_json(self, status, answer):
+        body = json.dumps(answer).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/status':
+            self.send_json(200, self.tables.status())
+        else:
+            self.send_json(404, {'error': f'unknown path {self.path}'})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            start_time = time.time()
+            path = self.path.rstrip('/')
+            if path == '/keywords':
+                result = keyword_query(self.tables, request['words'], request.get('cpc_codes'))
+            elif path == '/cpc':
+                result = cpc_query(self.tables, request['cpc_codes'])
+            elif path == '/patents':
+                result = patent_query(self.tables, request['patent_ids'])
+            else:
+                self.send_json(404, {'error': f'unknown path {self.path}'})
+                return
+            self.send_json(200, result_answer(result, request, time.time() - start_time, self.output_dir))
+        except (KeyError, ValueError, TypeError) as error:
+            self.send_json(400, {'error': f'{type(error).__name__}: {error}'})
+        except Exception as error:
+            self.send_json(500, {'error': f'{type(error).__name__}: {error}'})
+
+
+# Function to make the server of the tables (port 0 picks a free port)
+# output_dir enables the output_file of the queries (None: queries cannot write files)
+def make_server(tables, host='127.0.0.1', port=8765, output_dir=None):
+    if output_dir is not None:
+        output_dir = os.path.abspath(output_dir)
+        os.makedirs(output_dir, exist_ok=True)
+    handler = type('Handler', (QueryHandler,), {'tables': tables, 'output_dir': output_dir})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+# Function to start the server, preload=True parses the tables before the first query
+def serve(host='127.0.0.1', port=8765, g_patent_path=g_patent, g_cpc_path=g_cpc, preload=True, compact=False,
+          output_dir=None):
+    tables = WarmTables(g_patent_path, g_cpc_path, compact)
+    if preload:
+        tables.get('g_patent')
+        tables.get('g_cpc')
+    server = make_server(tables, host, port, output_dir)
+    print(f'answering queries on http://{host}:{port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='resident query server for keyword, CPC and patent-list queries')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--g-patent', default=g_patent)
+    parser.add_argument('--g-cpc', default=g_cpc)
+    parser.add_argument('--lazy', action='store_true', help='load every table on its first query')
+    parser.add_argument('--compact', action='store_true', help='keep the tables in compact dtypes')
+    parser.add_argument('--output-dir', default=None,
+                        help='directory of the output_file of the queries (without it queries cannot write files)')
+    args = parser.parse_args()
+    serve(args.host, args.port, args.g_patent, args.g_cpc, preload=not args.lazy, compact=args.compact,
+          output_dir=args.output_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+'''
+streaming writer of the result tables
+
+Step 6 of the patent_whole_data_* scripts wrote the result with one to_csv call on the whole frame: one
+thread, no compression, and nothing on disk before the whole text was formatted. a ResultWriter takes the
+result in batches and writes every batch as soon as it gets it, in one of these formats (by the extension
+of the output file):
+- .csv: the same bytes as to_csv(index=False) of the whole frame
+- .csv.gz: the same csv, gzip compressed. the text is cut into blocks that are compressed in threads (zlib
+  releases the GIL) and written in order as gzip members, a file of several members is a normal gzip file
+  for gzip, zcat and pandas.read_csv
+- .csv.zst: the same with zstd frames (pyarrow's zstd codec, so it needs the pyarrow package)
+- .parquet: one row group per batch, zstd compressed (needs the pyarrow package)
+
+at the end the writer prints the rows, the MB of the result (the csv text, or the arrow data for parquet),
+the MB on disk and the throughput in MB/s.
+
+usage (in a script):
+with ResultWriter('result.csv.gz') as writer:
+    for batch in batches:
+        writer.write(batch)
+or write_result(final_data, 'result.csv.gz') for a frame that is already complete.
+'''
+
+import gzip
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from tsv_cache import pa, pq
+
+# extension of every output format
+format_extensions = {'csv': '.csv', 'csv.gz': '.csv.gz', 'csv.zst': '.csv.zst', 'parquet': '.parquet'}
+
+# rows formatted and written at a time by write_result
+write_batch_rows = 100000
+# bytes of csv text compressed at a time by one thread
+compress_block_size = 1 << 23
+default_threads = os.cpu_count() or 1
+default_levels = {'csv.gz': 6, 'csv.zst': 3}
+
+
+# Function to find the format of an output file by its extension
+def output_format(output_file):
+    for name, extension in sorted(format_extensions.items(), key=lambda item: len(item[1]), reverse=True):
+        if output_file.endswith(extension):
+            return name
+    raise ValueError(f"unknown output format of '{output_file}', use one of {', '.join(format_extensions.values())}")
+
+
+# Function to give an output file the extension of a format, e.g. ('result.csv', 'csv.gz') -> 'result.csv.gz'
+def result_path(output_file, result_format):
+    base = output_file
+    for extension in format_extensions.values():
+        if base.endswith(extension):
+            base = base[:-len(extension)]
+            break
+    return base + format_extensions[result_format]
+
+
+def gzip_member(data, level):
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def zstd_frame(data, level):
+    return pa.Codec('zstd', compression_level=level).compress(data, asbytes=True)
+
+
+class ResultWriter:
+    '''
+    writes a result table batch by batch
+    '''
+
+    def __init__(self, output_file, result_format=None, threads=default_threads, level=None):
+        self.output_file = output_file
+        self.format = result_format or output_format(output_file)
+        if self.format in ('csv.zst', 'parquet') and pa is None:
+            raise ImportError(f'the {self.format} output needs the pyarrow package')
+        self.level = level if level is not None else default_levels.get(self.format)
+        self.compress = {'csv.gz': gzip_member, 'csv.zst': zstd_frame}.get(self.format)
+        self.executor = ThreadPoolExecutor(max_workers=threads) if self.compress else None
+        # compressed blocks in flight, at most two per thread
+        self.max_pending = 2 * threads
+        self.pending = deque()
+        self.block = []
+        self.block_bytes = 0
+        self.rows = 0
+        self.data_bytes = 0
+        self.parquet_writer = None
+        self.schema = None
+        self.temp_path = output_file + '.tmp'
+        self.file = None if self.format == 'parquet' else open(self.temp_path, 'wb')
+        self.start_time = time.time()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    # Function to write a batch of rows (the batches must have the same columns and dtypes)
+    def write(self, df):
+        if self.format == 'parquet':
+            self._write_parquet(df)
+        else:
+            text = df.to_csv(index=False, header=self.data_bytes == 0).encode('utf-8')
+            self.data_bytes += len(text)
+            if self.compress is None:
+                self.file.write(text)
+            else:
+                self.block.append(text)
+                self.block_bytes += len(text)
+                if self.block_bytes >= compress_block_size:
+                    self._submit_block()
+        self.rows += len(df)
+
+    def _write_parquet(self, df):
+        # object columns can mix strings and numbers (e.g. joined assignee sequences), they are stored as the
+        # strings the csv has
+        df = df.copy()
+        for column in df.columns:
+            if df[column].dtype == object:
+                df[column] = df[column].astype(str).where(df[column].notna(), None)
+        if self.parquet_writer is None:
+            schema = pa.Schema.from_pandas(df, preserve_index=False)
+            self.schema = pa.schema([pa.field(field.name, pa.string()) if df[field.name].dtype == object else field
+                                     for field in schema], metadata=schema.metadata)
+            self.parquet_writer = pq.ParquetWriter(self.temp_path, self.schema, compression='zstd')
+        table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        self.data_bytes += table.nbytes
+        self.parquet_writer.write_table(table)
+
+    # Function to start compressing the block of csv text, and write the blocks that are done in order
+    def _submit_block(self):
+        data = b''.join(self.block)
+        self.block = []
+        self.block_bytes = 0
+        self.pending.append(self.executor.submit(self.compress, data, self.level))
+        while self.pending and (len(self.pending) > self.max_pending or self.pending[0].done()):
+            self.file.write(self.pending.popleft().result())
+
+    # Function to finish the file and print the throughput
+    def close(self):
+        if self.format == 'parquet':
+            if self.parquet_writer is None:
+                raise ValueError('no rows were written to a parquet result')
+            self.parquet_writer.close()
+        else:
+            if self.compress is not None:
+                if self.block or not self.pending:
+                    self._submit_block()
+                while self.pending:
+                    self.file.write(self.pending.popleft().result())
+                self.executor.shutdown()
+            self.file.close()
+        os.replace(self.temp_path, self.output_file)
+        self.print_report()
+
+    # Function to stop writing after an error, the partial file is removed
+    def abort(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+        if self.file is not None:
+            self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    def print_report(self):
+        seconds = max(time.time() - self.start_time, 1e-9)
+        data_mb = self.data_bytes / 1e6
+        disk_mb = os.path.getsize(self.output_file) / 1e6
+        print(f"  wrote {self.rows:,} rows to '{self.output_file}' ({self.format}): {data_mb:.1f} MB of "
+              f"{'arrow data' if self.format == 'parquet' else 'csv'}, {disk_mb:.1f} MB on disk, "
+              f"{seconds:.2f} seconds, {data_mb / seconds:.1f} MB/s")
+
+
+# Function to write a complete frame in batches, the csv is the same as df.to_csv(output_file, index=False)
+def write_result(df, output_file, result_format=None, threads=default_threads, batch_rows=write_batch_rows):
+    with ResultWriter(output_file, result_format, threads) as writer:
+        for start in range(0, max(len(df), 1), batch_rows):
+            writer.write(df.iloc[start:start + batch_rows])
+    return output_file
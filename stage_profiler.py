@@ -0,0 +1,184 @@
+'''
+per-stage measurements for the steps of the scripts
+
+every step of a script's main runs inside profiler.stage(name), which records:
+- wall time and CPU time: user + system of the process and of its child processes that ended during the
+  stage (the workers of the parallel keyword scan do most of the work of Step 1), the part of the children
+  is also kept on its own
+- peak RSS: the high-water mark of the process after the stage and how much the stage raised it, the change
+  of the current RSS and the peak of the largest child process so far (not on Windows, where the resource
+  module is missing: the peaks are left empty)
+- rows in / rows out (set by the step, e.g. stage.rows_out = len(df))
+- bytes read by the process during the stage (/proc/self/io, Linux only)
+
+at the end of the stage it prints 'Time taken: ... seconds' as the scripts did before, and
+print_summary() prints a table of all stages. the stages can also be written as json lines and
+profiled with cProfile without editing the scripts, through environment variables:
+- STAGE_LOG=stages.jsonl: append one json line per stage to this file
+- STAGE_PROFILE='Step 3,Step 5' (or 'all'): run the stages whose name starts with one of these under cProfile,
+  print the top functions and keep the stats in STAGE_PROFILE_DIR (default 'stage_profiles')
+
+usage:
+STAGE_LOG=stages.jsonl STAGE_PROFILE='Step 1' python patent_whole_data_selected_words.py
+'''
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# number of functions printed for a profiled stage
+profile_top = 15
+
+
+# Function to read the bytes read so far by this process (None where /proc is not available)
+def bytes_read():
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+# Function to get the current resident set size in MB (None where /proc is not available)
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except (OSError, ValueError):
+        return None
+
+
+# Function to get the peak resident set size of the process (or of its largest ended child) so far in MB
+# (None without the resource module)
+def peak_rss_mb(children=False):
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
+
+
+# Function to get the CPU time of the process and the CPU time of its ended child processes
+def cpu_times():
+    times = os.times()
+    return times.user + times.system, times.children_user + times.children_system
+
+
+class Stage:
+    '''
+    measurements of one stage, the step sets rows_in and rows_out
+    '''
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.record = None
+
+
+class StageProfiler:
+    '''
+    collects the stages of one script run
+    '''
+
+    def __init__(self, script, log_file=None, profile=None, profile_dir=None):
+        self.script = script
+        self.log_file = log_file if log_file is not None else os.environ.get('STAGE_LOG')
+        profile = profile if profile is not None else os.environ.get('STAGE_PROFILE', '')
+        self.profile = [p.strip() for p in profile.split(',') if p.strip()] if isinstance(profile, str) else profile
+        self.profile_dir = profile_dir or os.environ.get('STAGE_PROFILE_DIR', 'stage_profiles')
+        self.records = []
+
+    def _profiled(self, name):
+        return 'all' in self.profile or any(name.startswith(p) for p in self.profile)
+
+    @contextmanager
+    def stage(self, name, rows_in=None, quiet=False):
+        stage = Stage(name, rows_in)
+        profiler = cProfile.Profile() if self._profiled(name) else None
+        read_before = bytes_read()
+        rss_before = current_rss_mb()
+        peak_before = peak_rss_mb()
+        cpu_before, child_cpu_before = cpu_times()
+        start_time = time.time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield stage
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            wall_seconds = time.time() - start_time
+            read_after = bytes_read()
+            rss_after = current_rss_mb()
+            peak_after = peak_rss_mb()
+            child_peak = peak_rss_mb(children=True)
+            cpu_after, child_cpu_after = cpu_times()
+            child_cpu_seconds = child_cpu_after - child_cpu_before
+            stage.record = {
+                'script': self.script, 'stage': name, 'start': time.strftime('%Y-%m-%dT%H:%M:%S',
+                                                                              time.localtime(start_time)),
+                'wall_seconds': round(wall_seconds, 4),
+                'cpu_seconds': round(cpu_after - cpu_before + child_cpu_seconds, 4),
+                'child_cpu_seconds': round(child_cpu_seconds, 4),
+                'rows_in': stage.rows_in, 'rows_out': stage.rows_out,
+                'bytes_read': read_after - read_before if read_before is not None else None,
+                'peak_rss_mb': round(peak_after, 1) if peak_after is not None else None,
+                'peak_rss_delta_mb': round(peak_after - peak_before, 1) if peak_after is not None else None,
+                'rss_delta_mb': round(rss_after - rss_before, 1) if rss_before is not None else None,
+                'child_peak_rss_mb': round(child_peak, 1) if child_peak is not None else None,
+            }
+            self.records.append(stage.record)
+            if self.log_file:
+                with open(self.log_file, 'a') as f:
+                    f.write(json.dumps(stage.record) + '\n')
+            if profiler is not None:
+                self._report_profile(name, profiler)
+            if not quiet:
+                print(f"Time taken: {wall_seconds:.2f} seconds")
+
+    # Function to print the top functions of a profiled stage and keep its stats
+    def _report_profile(self, name, profiler):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', f'{self.script} {name}').strip('_')
+        stats_file = os.path.join(self.profile_dir, slug + '.prof')
+        profiler.dump_stats(stats_file)
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(profile_top)
+        print(output.getvalue())
+        print(f"profile of '{name}' has been stored in '{stats_file}'.")
+
+    # Function to print all stages of the run as a table
+    def print_summary(self):
+        if not self.records:
+            return
+        print(f'Stages of {self.script}:')
+        print(f"  {'stage':<45} {'wall (s)':>9} {'cpu (s)':>8} {'rows in':>11} {'rows out':>11} "
+              f"{'read (MB)':>10} {'peak +MB':>9}")
+        for record in self.records:
+            rows_in = '' if record['rows_in'] is None else f"{record['rows_in']:,}"
+            rows_out = '' if record['rows_out'] is None else f"{record['rows_out']:,}"
+            read_mb = '' if record['bytes_read'] is None else f"{record['bytes_read'] / 1e6:.1f}"
+            peak_mb = '' if record['peak_rss_delta_mb'] is None else f"{record['peak_rss_delta_mb']:.1f}"
+            print(f"  {record['stage'][:45]:<45} {record['wall_seconds']:>9.2f} {record['cpu_seconds']:>8.2f} "
+                  f"{rows_in:>11} {rows_out:>11} {read_mb:>10} {peak_mb:>9}")
+        total_wall = sum(record['wall_seconds'] for record in self.records)
+        last = self.records[-1]
+        peak = '' if last['peak_rss_mb'] is None else f"   peak RSS {last['peak_rss_mb']:.0f} MB"
+        if last['child_peak_rss_mb']:
+            peak += f", largest child process {last['child_peak_rss_mb']:.0f} MB"
+        print(f"  {'total':<45} {total_wall:>9.2f}{peak}")
@@ -0,0 +1,134 @@
+'''
+concurrent reads of the PatentsView tables
+
+the patent_whole_data_* scripts read g_patent, g_cpc, g_assignee and g_location one after another, so the
+CPU waits for the disk during the reads and the disk waits during the keyword scan of Step 1. a TableLoader
+starts the reads of the later steps in threads while Step 1 runs. the reads go through tsv_cache.read_tsv:
+pyarrow reads the parquet cache (and pandas parses a TSV) without holding the GIL most of the time, so the
+threads overlap with the scan.
+
+the tables a later step reads with keep_keys (a semi-join on the patents found by Step 1) are read whole
+while the keys are not known yet, and the keys are applied when the step takes the table, so the step gets
+the same rows. a whole table needs much more memory than its semi-join, so read-ahead is off unless a
+script is given a budget (--read-ahead-mb), and a table whose keys are known when the read starts is read
+with them. the tables in flight (read ahead and not taken yet) are limited to memory_cap_mb:
+- before a read the memory of the frame is estimated from the parquet cache (the uncompressed size of the
+  columns plus the python object of every string), or from the size of the TSV times tsv_memory_factor
+  when there is no cache yet
+- when the read is done the estimate is replaced by the memory_usage(deep=True) of the frame
+a table that does not fit in what is left of the budget is not read ahead, the step reads it with its keys
+as before. (the budget is taken when the read starts, not by the thread, so a step never waits for a
+table that waits for the budget of a later step.)
+
+usage (in a script):
+loader = TableLoader(memory_cap_mb=4096)
+loader.prefetch(g_cpc, usecols=[...], dtype=str)
+... Step 1 ...
+g_cpc_df = loader.read_tsv(g_cpc, usecols=[...], dtype=str, keep_keys={'patent_id': ids})
+'''
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tsv_cache import cache_paths, key_mask, key_sets, log_scan, pq, read_tsv, valid_cache_meta
+
+# default limit of the memory of the tables read ahead and not taken yet
+default_memory_cap_mb = 4096
+default_workers = 3
+# bytes of a python string object and its pointer in a frame, besides the text
+string_overhead_bytes = 57
+# memory of a frame per byte of its TSV when there is no cache (1.4 to 6 times on the PatentsView tables)
+tsv_memory_factor = 6
+
+
+# Function to estimate the memory of a table read in MB
+def estimate_mb(file_path, usecols=None):
+    meta = valid_cache_meta(file_path) if pq is not None else None
+    if meta is None:
+        return os.path.getsize(file_path) * tsv_memory_factor / 1e6
+    metadata = pq.ParquetFile(cache_paths(file_path)[0]).metadata
+    columns = [j for j in range(metadata.num_columns)
+               if usecols is None or metadata.schema.column(j).name in usecols]
+    data_bytes = sum(metadata.row_group(i).column(j).total_uncompressed_size
+                     for i in range(metadata.num_row_groups) for j in columns)
+    return (data_bytes + metadata.num_rows * len(columns) * string_overhead_bytes) / 1e6
+
+
+class TableLoader:
+    '''
+    reads tables ahead in threads, within a memory budget
+    '''
+
+    def __init__(self, memory_cap_mb=default_memory_cap_mb, workers=default_workers):
+        self.memory_cap_mb = memory_cap_mb
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='table_loader')
+        self.lock = threading.Lock()
+        self.reserved_mb = 0
+        # MB of the budget taken by every table in flight
+        self.reservations = {}
+        self.pending = {}
+
+    def _release(self, file_path):
+        with self.lock:
+            self.reserved_mb -= self.reservations.pop(file_path, 0)
+
+    def _read(self, file_path, read_args):
+        start_time = time.time()
+        df = read_tsv(file_path, **read_args)
+        seconds = time.time() - start_time
+        # the estimate is replaced by the measured memory of the frame
+        size_mb = df.memory_usage(deep=True).sum() / 1e6
+        with self.lock:
+            if file_path in self.reservations:
+                self.reserved_mb += size_mb - self.reservations[file_path]
+                self.reservations[file_path] = size_mb
+        return df, seconds, size_mb
+
+    # Function to start reading a table in a thread (read_args are those of tsv_cache.read_tsv)
+    # gives False when the table does not fit in what is left of the budget and is not read ahead
+    def prefetch(self, file_path, **read_args):
+        size_mb = estimate_mb(file_path, read_args.get('usecols'))
+        with self.lock:
+            fits = self.reserved_mb + size_mb <= self.memory_cap_mb
+            if fits:
+                self.reserved_mb += size_mb
+                self.reservations[file_path] = size_mb
+        if not fits:
+            print(f"  {os.path.basename(file_path)} (about {size_mb:.0f} MB) does not fit in the read-ahead budget "
+                  f"({self.memory_cap_mb} MB), it is read when it is needed")
+            return False
+        future = self.executor.submit(self._read, file_path, read_args)
+        self.pending[file_path] = (future, read_args)
+        return True
+
+    # Function to get a table: the table read ahead (with keep_keys applied) or, if it was not read ahead
+    # with the same arguments, tsv_cache.read_tsv
+    def read_tsv(self, file_path, keep_keys=None, **read_args):
+        if file_path not in self.pending or self.pending[file_path][1].get('usecols') != read_args.get('usecols'):
+            return read_tsv(file_path, keep_keys=keep_keys, **read_args)
+        future, prefetch_args = self.pending.pop(file_path)
+        wait_start = time.time()
+        try:
+            df, read_seconds, size_mb = future.result()
+        finally:
+            self._release(file_path)
+        print(f"  {os.path.basename(file_path)}: read ahead in {read_seconds:.2f} seconds ({size_mb:.0f} MB), "
+              f"waited {time.time() - wait_start:.2f} seconds")
+        if keep_keys is not None:
+            keep_keys = key_sets(keep_keys)
+            rows_scanned = len(df)
+            df = df[key_mask(df, keep_keys)].reset_index(drop=True)
+            if prefetch_args.get('keep_keys') is None:
+                log_scan(file_path, rows_scanned, len(df))
+        return df
+
+    # Function to drop the tables that were not taken and stop the threads
+    def close(self):
+        for future, _ in self.pending.values():
+            future.cancel()
+        self.executor.shutdown(wait=True)
+        for file_path in self.pending:
+            self._release(file_path)
+        self.pending = {}
@@ -0,0 +1,83 @@
+'''
+checks the vectorized aggregate_assignees of assignee_aggregation.py against the per-patent groupby/apply
+code the scripts used before (Step 5-2)
+
+python -m pytest test_assignee_aggregation.py
+'''
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from assignee_aggregation import aggregate_assignees, joined_columns
+from assignee_table import assignee_type_mapping_unified
+
+
+# the groupby/apply version of Step 5-2 before it was vectorized
+def concat_sequence(group):
+    # Convert 'assignee_sequence' to string type and fill NaN with '0'
+    group['assignee_sequence'] = group['assignee_sequence'].astype(str).fillna('0')
+    return ', '.join(group['assignee_sequence'])
+
+
+def aggregate_assignees_reg(group):
+    max_sequence = group['assignee_sequence'].max()
+    if max_sequence != 0:
+        group['assignee_sequence'] = concat_sequence(group)
+        for column in joined_columns:
+            joined = '& '.join(group[column].astype(str))
+            group.iloc[0, group.columns.get_loc(column)] = joined
+        return group.iloc[[0]]
+    else:
+        return group
+
+
+def aggregate_assignees_groupwise(final_data, assignee_type_mapping_unified):
+    with warnings.catch_warnings():
+        # groupby.apply on the grouping column warns in pandas 2.x
+        warnings.simplefilter('ignore', FutureWarning)
+        final_data = final_data.groupby('patent_id').apply(aggregate_assignees_reg).reset_index(drop=True)
+    split_assignee_types = final_data['assignee_type_reg'].str.split('&')
+    final_data['assignee_type_unified'] = split_assignee_types.apply(
+        lambda parts: ' & '.join([assignee_type_mapping_unified.get(part.strip(), part.strip()) for part in parts]))
+    return final_data
+
+
+# final_data as Step 5-1 gives it: one row per patent and assignee, left joined (NaN without an assignee)
+def fixture():
+    rows = [
+        # one assignee
+        ('3', 'title 3', 0.0, 'US Company or Corporation', 'Acme', 'CA', 'US'),
+        # several assignees, one without a name and one without a location
+        ('1', 'title 1', 0.0, 'US Company or Corporation', 'Acme', 'CA', 'US'),
+        ('1', 'title 1', 1.0, 'Foreign Individual', np.nan, np.nan, 'JP'),
+        ('1', 'title 1', 2.0, 'Unassigned', 'Beta', 'NY', 'US'),
+        # no assignee at all
+        ('2', 'title 2', np.nan, np.nan, np.nan, np.nan, np.nan),
+        # two rows that are both assignee_sequence 0 (kept as they are)
+        ('5', 'title 5', 0.0, 'US Individual', 'Doe John', 'TX', 'US'),
+        ('5', 'title 5', 0.0, 'Unknown', 'Doe Jane', np.nan, np.nan),
+        # a type without a unified name and a second multi-assignee patent between the others
+        ('4', 'title 4', 1.0, 'Foreign Company or Corporation', 'Gamma', np.nan, 'DE'),
+        ('4', 'title 4', 0.0, 'Unknown', np.nan, np.nan, np.nan),
+        # a row without patent_id is dropped by groupby
+        (np.nan, 'no id', 0.0, 'Unknown', 'Nobody', np.nan, np.nan),
+    ]
+    return pd.DataFrame(rows, columns=['patent_id', 'patent_title', 'assignee_sequence', 'assignee_type_reg',
+                                       'assignee_name', 'disambig_state', 'disambig_country'])
+
+
+def test_aggregate_assignees_matches_groupwise():
+    expected = aggregate_assignees_groupwise(fixture(), assignee_type_mapping_unified)
+    result = aggregate_assignees(fixture(), assignee_type_mapping_unified)
+    pd.testing.assert_frame_equal(result, expected)
+    assert result.to_csv(index=False) == expected.to_csv(index=False)
+
+
+def test_aggregate_assignees_without_multi_assignee_patents():
+    data = fixture()
+    data = data[data['patent_id'].isin(['3', '5'])]
+    expected = aggregate_assignees_groupwise(data, assignee_type_mapping_unified)
+    result = aggregate_assignees(data, assignee_type_mapping_unified)
+    assert result.to_csv(index=False) == expected.to_csv(index=False)
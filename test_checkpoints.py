@@ -0,0 +1,82 @@
+'''
+the checkpoint keys of Steps 1 to 4 only change with the code and settings these steps use
+
+the modules are copied to a temporary folder and edited there, the keys are computed in a new process
+for every version (python -m pytest test_checkpoints.py)
+'''
+
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+print_keys = '''
+import json
+import patent_whole_data_selected_words as selected_words
+from checkpoints import step_key
+from stage_profiler import StageProfiler
+
+keys = []
+for step in selected_words.pipeline_steps(StageProfiler('test'), 1):
+    keys.append(step_key(step, keys[-1] if keys else ''))
+print(json.dumps(keys))
+'''
+
+
+# Function to copy the modules of the package to a folder, with empty tables (the keys use their size and
+# modification time)
+def copy_package(directory):
+    for file_path in glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '*.py')):
+        shutil.copy(file_path, directory)
+    for table in ['g_patent_n.tsv', 'g_cpc_current_n.tsv', 'g_assignee_disambiguated_n.tsv',
+                  'g_location_disambiguated_n.tsv']:
+        open(os.path.join(directory, table), 'w').close()
+
+
+# Function to replace a text in a copied module
+def edit(directory, module, old, new):
+    path = os.path.join(directory, module)
+    with open(path, newline='') as f:
+        source = f.read()
+    assert old in source
+    with open(path, 'w', newline='') as f:
+        f.write(source.replace(old, new, 1))
+
+
+# Function to get the keys of Steps 1 to 4 of the copied patent_whole_data_selected_words.py
+def step_keys(directory):
+    output = subprocess.run([sys.executable, '-c', print_keys], cwd=directory, capture_output=True, text=True,
+                            check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_aggregation_edits_keep_the_keys(tmp_path):
+    copy_package(tmp_path)
+    keys = step_keys(tmp_path)
+    assert step_keys(tmp_path) == keys
+
+    # the unified mapping and unify_types are only used by the aggregation (Step 5)
+    edit(tmp_path, 'assignee_table.py', "'Unassigned': 'Unassigned',", "'Unassigned': 'Not assigned',")
+    edit(tmp_path, 'dimension_arrays.py', "import numpy as np", "# a comment\nimport numpy as np")
+    edit(tmp_path, 'dimension_arrays.py', "    stripped = ", "    # a comment\n    stripped = ")
+    edit(tmp_path, 'assignee_aggregation.py', "import numpy as np", "# a comment\nimport numpy as np")
+    assert step_keys(tmp_path) == keys
+
+
+def test_step_edits_change_the_keys(tmp_path):
+    copy_package(tmp_path)
+    keys = step_keys(tmp_path)
+
+    # the assignee type names are set in Step 3, the keys of Steps 3 and 4 change
+    edit(tmp_path, 'assignee_table.py', "1: 'Unassigned',", "1: 'Not assigned',")
+    new_keys = step_keys(tmp_path)
+    assert new_keys[:2] == keys[:2]
+    assert new_keys[2] != keys[2] and new_keys[3] != keys[3]
+
+    # read_tsv is used by Steps 2 to 4, g_cpc_columns by Step 2
+    edit(tmp_path, 'patent_whole_data_selected_words.py', "'cpc_sequence','cpc_class']",
+         "'cpc_sequence', 'cpc_class', 'cpc_group']")
+    newer_keys = step_keys(tmp_path)
+    assert newer_keys[0] == keys[0] and newer_keys[1] != new_keys[1]
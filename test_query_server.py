@@ -0,0 +1,69 @@
+'''
+the answers of query_server.py are the same with and without --compact
+
+a server on a free port answers queries over two small tables (python -m pytest test_query_server.py)
+'''
+
+import json
+import threading
+import urllib.request
+
+import pytest
+
+from query_server import WarmTables, make_server
+
+g_patent_rows = [
+    ['patent_id', 'patent_type', 'patent_date', 'patent_title', 'patent_abstract'],
+    ['10000001', 'utility', '2019-01-01', 'Dental implant', 'A dental implant with a screw.'],
+    ['10000002', 'utility', '2019-02-01', 'Solar panel', 'A solar panel.'],
+    ['D900001', 'design', '2020-03-01', 'Toothbrush', 'An ornamental toothbrush.'],
+]
+g_cpc_rows = [
+    ['patent_id', 'cpc_sequence', 'cpc_section', 'cpc_class', 'cpc_subclass', 'cpc_group'],
+    ['10000001', '0', 'A', 'A61', 'A61C', 'A61C8/00'],
+    ['10000002', '0', 'H', 'H02', 'H02S', 'H02S20/00'],
+    ['D900001', '0', 'D', 'D04', 'D04D', 'D04D1/00'],
+]
+
+# valid ids, ids that are not in g_patent and ids that do not fit the key format
+patent_ids = ['10000001', 'D900001', '99999999', 'not-a-patent', 'XY123', '', 10000002]
+
+
+def write_tsv(path, rows):
+    with open(path, 'w') as f:
+        f.write(''.join('\t'.join(row) + '\n' for row in rows))
+
+
+# Function to send a query to a server of the tables, gives the status and the json answer
+def post(tables, path, request):
+    server = make_server(tables, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = f'http://127.0.0.1:{server.server_address[1]}{path}'
+        try:
+            with urllib.request.urlopen(url, data=json.dumps(request).encode()) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as error:
+            return error.code, json.loads(error.read())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def table_paths(tmp_path):
+    write_tsv(tmp_path / 'g_patent.tsv', g_patent_rows)
+    write_tsv(tmp_path / 'g_cpc_current.tsv', g_cpc_rows)
+    return str(tmp_path / 'g_patent.tsv'), str(tmp_path / 'g_cpc_current.tsv')
+
+
+def test_patents_with_invalid_ids(table_paths):
+    answers = []
+    for compact in [False, True]:
+        status, answer = post(WarmTables(*table_paths, compact=compact), '/patents', {'patent_ids': patent_ids})
+        assert status == 200
+        answers.append(answer)
+    assert [row['patent_id'] for row in answers[0]['rows']] == ['10000001', '10000002', 'D900001']
+    answers[0].pop('seconds'), answers[1].pop('seconds')
+    assert answers[1] == answers[0]
@@ -0,0 +1,238 @@
+'''
+fast estimate of the size of a keyword topic, from random blocks of g_patent.tsv
+
+before a full run of patent_whole_data_selected_words.py with a new keyword set, this estimates how many
+patents the keywords match and how they split over the primary cpc subclasses, in seconds instead of a
+full scan:
+- the file is cut into `blocks` equal strata of bytes, and in every stratum a block of `block_bytes` at a
+  random position is read. a block holds the records that start inside it, so the blocks never overlap and
+  every record has about the same chance to be sampled. with an up to date offset index (see
+  offset_index.py) the record starts are exact, without it a record starts at a line that starts with a
+  patent id and a tab.
+- the records are parsed with the header of the file and filtered with the same keyword matcher and
+  combined text as Step 1 of the script, the cpc rows (sequence 0) of the matched patents are read with a
+  semi-join of g_cpc, optionally filtered by cpc subclasses.
+- the blocks are clusters of records, so the share of matching patents is a ratio estimate
+  (matches / records of all blocks) and its standard error comes from the spread of the blocks (cluster
+  sampling, with the finite population correction). count = share * number of patents, with a confidence
+  interval of +- z standard errors.
+
+usage:
+python topic_estimate.py g_patent.tsv g_cpc_current.tsv --words blockchain bitcoin "distributed ledger"
+python topic_estimate.py g_patent.tsv g_cpc_current.tsv --words-file words.txt --cpc H04L G06Q --blocks 400
+python patent_whole_data_selected_words.py --estimate
+'''
+
+import argparse
+import io
+import math
+import mmap
+import time
+
+import numpy as np
+import pandas as pd
+
+from keyword_matcher import compile_keywords
+from offset_index import OffsetIndex, offset_index_is_current
+from patent_reader import combined_text, g_patent_columns, next_record_start
+from tsv_cache import read_tsv, valid_cache_meta
+
+default_blocks = 200
+block_bytes = 1 << 20
+# z of the confidence intervals (95%)
+confidence_z = 1.96
+# subclasses printed in the split
+top_subclasses = 20
+
+
+# Function to find the number of records of g_patent without reading it (None if it is not known)
+def count_records(g_patent, index=None):
+    if index is not None:
+        return index.meta['records']
+    meta = valid_cache_meta(g_patent)
+    return meta['rows'] if meta is not None else None
+
+
+class BlockSampler:
+    '''
+    reads the records that start in a byte range of g_patent.tsv
+    '''
+
+    def __init__(self, g_patent):
+        self.g_patent = g_patent
+        self.index = OffsetIndex(g_patent) if offset_index_is_current(g_patent) else None
+        self.file = open(g_patent, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.header = self.data[:self.data.find(b'\n')].rstrip(b'\r')
+        # first byte of the first record
+        self.data_start = len(self.header) + 1 + (self.data[len(self.header):len(self.header) + 1] == b'\r')
+        if self.index is not None:
+            # the index is sorted by patent, the blocks need the records in the order of the file
+            order = np.argsort(self.index.offsets)
+            self.starts = np.asarray(self.index.offsets)[order]
+            self.ends = self.starts + np.asarray(self.index.lengths)[order]
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    # Function to find the first record start at or after a position (without index)
+    def next_record_start(self, position):
+        if position <= self.data_start:
+            return self.data_start
+        return next_record_start(self.data, position)
+
+    # Function to get the raw records that start in [start, end)
+    def block_records(self, start, end):
+        if self.index is not None:
+            low, high = np.searchsorted(self.starts, [start, end])
+            if low == high:
+                return b''
+            return self.data[int(self.starts[low]):int(self.ends[high - 1])]
+        first = self.next_record_start(start)
+        if first >= end:
+            return b''
+        return self.data[first:self.next_record_start(end)].rstrip(b'\r\n')
+
+    # Function to parse raw records as read_csv of the whole file gives them
+    def parse(self, records):
+        text = self.header + b'\n' + records + b'\n'
+        return pd.read_csv(io.BytesIO(text), sep='\t', usecols=g_patent_columns, dtype=str)
+
+    # Function to choose the byte ranges of the blocks: one random block in every one of `blocks` strata
+    # gives the ranges and the share of the file they cover
+    def block_ranges(self, blocks, size=block_bytes, seed=None):
+        rng = np.random.default_rng(seed)
+        total = len(self.data) - self.data_start
+        # blocks that would cover the whole file are read as strata of `size` bytes, which is the whole file
+        blocks = max(1, min(blocks, math.ceil(total / size)))
+        edges = self.data_start + np.linspace(0, total, blocks + 1).astype(np.int64)
+        ranges = []
+        for low, high in zip(edges[:-1].tolist(), edges[1:].tolist()):
+            size_in_stratum = min(size, high - low)
+            start = low + int(rng.integers(0, high - low - size_in_stratum + 1))
+            ranges.append((start, start + size_in_stratum))
+        return ranges, sum(end - start for start, end in ranges) / total
+
+
+# Function to estimate a total from the per-block matches and records (ratio estimate of cluster sampling)
+# gives the estimate and its standard error
+def ratio_estimate(matches, records, total_records, sampled_share):
+    matches = np.asarray(matches, dtype=np.float64)
+    records = np.asarray(records, dtype=np.float64)
+    if records.sum() == 0:
+        return 0.0, float('nan')
+    share = matches.sum() / records.sum()
+    blocks = len(records)
+    if blocks < 2:
+        return share * total_records, float('nan')
+    residuals = matches - share * records
+    variance = (1 - min(sampled_share, 1.0)) * blocks / (blocks - 1) * np.sum(residuals ** 2) / records.sum() ** 2
+    return share * total_records, math.sqrt(variance) * total_records
+
+
+# Function to estimate the patents of a keyword set (and optional cpc subclasses) from random blocks
+# gives a dict with the estimate, its confidence interval and a frame of the split over the subclasses
+def estimate_topic(selected_word, g_patent, g_cpc, cpc_codes=None, blocks=default_blocks, size=block_bytes,
+                   seed=None, z=confidence_z):
+    start_time = time.time()
+    matcher = compile_keywords(selected_word)
+    sampler = BlockSampler(g_patent)
+    try:
+        ranges, sampled_share = sampler.block_ranges(blocks, size, seed)
+        block_numbers, matched = [], []
+        records = np.zeros(len(ranges), dtype=np.int64)
+        for number, (start, end) in enumerate(ranges):
+            raw = sampler.block_records(start, end)
+            if not raw:
+                continue
+            chunk = sampler.parse(raw)
+            records[number] = len(chunk)
+            found = chunk.loc[matcher.contains(combined_text(chunk)).to_numpy(dtype=bool), 'patent_id']
+            matched.append(found)
+            block_numbers.append(np.full(len(found), number))
+        total_records = count_records(g_patent, sampler.index)
+    finally:
+        sampler.close()
+    if total_records is None:
+        # no index and no cache: the number of records is estimated from the bytes of the sample
+        total_records = int(round(records.sum() / min(sampled_share, 1.0)))
+
+    matched = pd.DataFrame({'patent_id': pd.concat(matched, ignore_index=True) if matched else pd.Series(dtype=str),
+                            'block': np.concatenate(block_numbers) if block_numbers else np.zeros(0, dtype=np.int64)})
+    matched_sampled = matched['patent_id'].nunique()
+    g_cpc_df = read_tsv(g_cpc, usecols=['patent_id', 'cpc_subclass', 'cpc_sequence'], dtype=str,
+                        keep_keys={'patent_id': matched['patent_id']})
+    g_cpc_df = g_cpc_df[g_cpc_df['cpc_sequence'] == '0'][['patent_id', 'cpc_subclass']].drop_duplicates()
+    matched = pd.merge(matched, g_cpc_df, on='patent_id', how='left')
+    if cpc_codes:
+        matched = matched[matched['cpc_subclass'].isin(cpc_codes)]
+    matched['cpc_subclass'] = matched['cpc_subclass'].fillna('(no cpc)')
+
+    # the patents of every block (a patent with two primary subclasses is counted once)
+    block_matches = matched.drop_duplicates(['block', 'patent_id']).groupby('block').size()
+    block_matches = block_matches.reindex(range(len(ranges)), fill_value=0).to_numpy()
+    estimate, error = ratio_estimate(block_matches, records, total_records, sampled_share)
+
+    split = []
+    subclass_counts = matched.groupby(['cpc_subclass', 'block']).size()
+    for subclass, counts in subclass_counts.groupby(level=0):
+        counts = counts.droplevel(0).reindex(range(len(ranges)), fill_value=0).to_numpy()
+        subclass_estimate, subclass_error = ratio_estimate(counts, records, total_records, sampled_share)
+        split.append({'cpc_subclass': subclass, 'sampled': int(counts.sum()), 'estimate': subclass_estimate,
+                      'low': max(subclass_estimate - z * subclass_error, 0),
+                      'high': subclass_estimate + z * subclass_error})
+    split = pd.DataFrame(split, columns=['cpc_subclass', 'sampled', 'estimate', 'low', 'high'])
+    split = split.sort_values('estimate', ascending=False, ignore_index=True)
+
+    return {'estimate': estimate, 'low': max(estimate - z * error, 0), 'high': estimate + z * error,
+            'records_sampled': int(records.sum()), 'total_records': total_records, 'blocks': len(ranges),
+            'sampled_share': min(sampled_share, 1.0), 'matched_sampled': matched_sampled,
+            'split': split,
+            'exact_offsets': offset_index_is_current(g_patent), 'seconds': time.time() - start_time}
+
+
+def print_estimate(result, z=confidence_z):
+    print(f"sampled {result['records_sampled']:,} of {result['total_records']:,} patents in {result['blocks']} "
+          f"blocks ({result['sampled_share']:.1%} of the file, "
+          f"{'offset index' if result['exact_offsets'] else 'record starts found by pattern'})")
+    print(f"{result['matched_sampled']:,} distinct patents of the sample match the keywords")
+    level = math.erf(z / math.sqrt(2))
+    print(f"Estimated number of patents: {result['estimate']:,.0f} "
+          f"({level:.0%} interval {result['low']:,.0f} to {result['high']:,.0f})")
+    split = result['split']
+    if len(split):
+        print(f'Estimated split over the primary cpc subclasses (top {top_subclasses}):')
+        shown = split.head(top_subclasses)
+        print(f"  {'cpc_subclass':<12} {'sampled':>8} {'estimate':>12} {'low':>12} {'high':>12}")
+        for row in shown.itertuples(index=False):
+            print(f'  {row.cpc_subclass:<12} {row.sampled:>8,} {row.estimate:>12,.0f} {row.low:>12,.0f} '
+                  f'{row.high:>12,.0f}')
+    print(f"({result['seconds']:.1f} seconds)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='estimate the patents of a keyword topic from random blocks')
+    parser.add_argument('g_patent', help='g_patent TSV')
+    parser.add_argument('g_cpc', help='g_cpc_current TSV')
+    parser.add_argument('--words', nargs='+', default=[], help='keywords to search in the title and abstract')
+    parser.add_argument('--words-file', default=None, help='file with one keyword per line')
+    parser.add_argument('--cpc', nargs='+', default=None, help='keep only these primary cpc subclasses')
+    parser.add_argument('--blocks', type=int, default=default_blocks, help='number of random blocks')
+    parser.add_argument('--block-kb', type=int, default=block_bytes // 1024, help='size of a block in KB')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    words = set(args.words)
+    if args.words_file:
+        with open(args.words_file) as f:
+            words |= {line.strip() for line in f if line.strip()}
+    if not words:
+        parser.error('give keywords with --words or --words-file')
+    result = estimate_topic(words, args.g_patent, args.g_cpc, cpc_codes=args.cpc, blocks=args.blocks,
+                            size=args.block_kb * 1024, seed=args.seed)
+    print_estimate(result)
+
+
+if __name__ == "__main__":
+    main()
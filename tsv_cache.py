@@ -0,0 +1,256 @@
+'''
+columnar cache of the PatentsView TSV files
+
+parsing the raw TSVs is most of the runtime of every script. the first time a table is read it is
+converted once to a compressed parquet file (only the columns the scripts use, stored as typed string
+columns) in a 'patentsview_cache' folder next to the TSV, and every later read only loads the needed
+columns from that file.
+
+the cache remembers the size, modification time and hash of the source TSV and is rebuilt when the
+TSV changes (a new modification time with the same hash only refreshes the stored time).
+parquet needs the pyarrow package, without it the loaders read the TSV as before.
+
+one-time conversion of the downloaded tables:
+python tsv_cache.py g_patent.tsv g_cpc_current.tsv g_assignee_disambiguated.tsv g_location_disambiguated.tsv
+'''
+
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+cache_dir_name = 'patentsview_cache'
+convert_chunksize = 1000000
+
+# rows scanned and kept of every read with keep_keys, see print_scan_report()
+scan_log = []
+
+# columns kept in the cache for every table, the union of the columns the scripts read
+cache_columns = {
+    'g_patent': ['patent_id', 'patent_type', 'patent_date', 'patent_title', 'patent_abstract'],
+    'g_cpc_current': ['patent_id', 'cpc_sequence', 'cpc_section', 'cpc_class', 'cpc_subclass', 'cpc_group'],
+    'g_assignee_disambiguated': ['patent_id', 'assignee_sequence', 'disambig_assignee_individual_name_first',
+                                 'disambig_assignee_individual_name_last', 'disambig_assignee_organization',
+                                 'assignee_type', 'location_id'],
+    'g_location_disambiguated': ['location_id', 'disambig_state', 'disambig_country'],
+}
+
+
+# Function to find the table name of a file, e.g. 'g_patent_n.tsv' -> 'g_patent'
+def table_name(file_path):
+    base_name = os.path.basename(file_path)
+    for name in sorted(cache_columns, key=len, reverse=True):
+        if base_name.startswith(name):
+            return name
+    return None
+
+
+def cache_paths(file_path):
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(file_path)), cache_dir_name)
+    base_name = os.path.basename(file_path)
+    return os.path.join(cache_dir, base_name + '.parquet'), os.path.join(cache_dir, base_name + '.json')
+
+
+# Function to hash a file in blocks
+def file_hash(file_path, block_size=1 << 24):
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_header(file_path):
+    return pd.read_csv(file_path, sep='\t', nrows=0).columns.tolist()
+
+
+# Function to load the cache metadata if the cache still matches the source TSV, otherwise None
+def valid_cache_meta(file_path):
+    parquet_path, meta_path = cache_paths(file_path)
+    if not (os.path.exists(parquet_path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    stat = os.stat(file_path)
+    if stat.st_size != meta['size']:
+        return None
+    if stat.st_mtime_ns != meta['mtime_ns']:
+        if file_hash(file_path) != meta['sha1']:
+            return None
+        # same content, only the time changed (copied or touched file)
+        meta['mtime_ns'] = stat.st_mtime_ns
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f, indent=1)
+    return meta
+
+
+# Function to convert a TSV to the parquet cache, reading it in chunks
+def build_cache(file_path, columns=None):
+    if pq is None:
+        raise ImportError('the TSV cache needs the pyarrow package')
+    parquet_path, meta_path = cache_paths(file_path)
+    os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+
+    header = read_header(file_path)
+    if columns is None:
+        columns = cache_columns.get(table_name(file_path), header)
+    columns = [c for c in header if c in set(columns)]
+    schema = pa.schema([(c, pa.string()) for c in columns])
+
+    stat = os.stat(file_path)
+    num_rows = 0
+    temp_path = parquet_path + '.tmp'
+    with pq.ParquetWriter(temp_path, schema, compression='zstd') as writer:
+        for chunk in pd.read_csv(file_path, sep='\t', usecols=columns, dtype=str, chunksize=convert_chunksize):
+            writer.write_table(pa.Table.from_pandas(chunk[columns], schema=schema, preserve_index=False))
+            num_rows += len(chunk)
+    os.replace(temp_path, parquet_path)
+
+    meta = {'source': os.path.basename(file_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'sha1': file_hash(file_path), 'columns': columns, 'rows': num_rows}
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=1)
+    return meta
+
+
+# Function to get a valid cache for the columns, builds or rebuilds it when needed (None without pyarrow)
+def ensure_cache(file_path, usecols=None):
+    if pq is None:
+        return None
+    meta = valid_cache_meta(file_path)
+    if meta is not None and (usecols is None or set(usecols) <= set(meta['columns'])):
+        return meta
+    columns = cache_columns.get(table_name(file_path)) or read_header(file_path)
+    if usecols is not None:
+        columns = list(columns) + [c for c in usecols if c not in columns]
+    print(f"building the columnar cache of '{file_path}'...")
+    return build_cache(file_path, columns)
+
+
+# Function to turn a cached arrow table into the frame read_csv would give
+def to_frame(table, columns, dtype=None, converters=None):
+    df = table.to_pandas()[columns]
+    for column in columns:
+        # parquet gives None for missing strings, read_csv gives NaN
+        df[column] = df[column].where(df[column].notna(), np.nan)
+    for column, converter in (converters or {}).items():
+        if column in df.columns:
+            df[column] = df[column].map(converter)
+    if isinstance(dtype, dict):
+        dtype = {c: t for c, t in dtype.items() if t is not str and c in df.columns}
+        if dtype:
+            df = df.astype(dtype)
+    elif dtype is not None and dtype is not str:
+        df = df.astype(dtype)
+    return df
+
+
+# Function to record and print how many rows a filtered read scanned and kept
+def log_scan(file_path, rows_scanned, rows_kept):
+    scan_log.append({'table': os.path.basename(file_path), 'rows_scanned': rows_scanned, 'rows_kept': rows_kept})
+    print(f"  {os.path.basename(file_path)}: kept {rows_kept:,} of {rows_scanned:,} rows scanned")
+
+
+# Function to print the rows scanned versus kept of every filtered read so far
+def print_scan_report():
+    if not scan_log:
+        return
+    print('Rows scanned versus kept:')
+    print(f"  {'table':<40} {'scanned':>14} {'kept':>12} {'kept (%)':>9}")
+    for entry in scan_log:
+        share = entry['rows_kept'] / entry['rows_scanned'] if entry['rows_scanned'] else 0
+        print(f"  {entry['table']:<40} {entry['rows_scanned']:>14,} {entry['rows_kept']:>12,} {share:>9.3%}")
+
+
+# Function to turn keep_keys into sets of keys, missing keys are dropped (no row of the tables has an
+# empty key, and the parquet filter cannot compare a NaN with the strings)
+def key_sets(keep_keys):
+    return {column: set(pd.Series(list(values), dtype=object).dropna()) for column, values in keep_keys.items()}
+
+
+# Function to keep the rows whose key columns have a value in keep_keys
+def key_mask(df, keep_keys):
+    mask = np.ones(len(df), dtype=bool)
+    for column, values in keep_keys.items():
+        mask &= df[column].isin(values).to_numpy()
+    return mask
+
+
+# Function to read columns of a TSV through the cache, gives the same frame as
+# pd.read_csv(file_path, sep='\t', usecols=usecols, dtype=dtype, converters=converters)
+# keep_keys={'patent_id': ids} pushes a semi-join into the read: the table is streamed and only the
+# rows with a key in the set are materialized (keys are compared as the raw strings of the file)
+def read_tsv(file_path, usecols=None, dtype=str, converters=None, use_cache=True, keep_keys=None):
+    meta = ensure_cache(file_path, usecols) if use_cache else None
+    if keep_keys is not None:
+        keep_keys = key_sets(keep_keys)
+
+    if meta is None:
+        if keep_keys is None:
+            return pd.read_csv(file_path, sep='\t', usecols=usecols, dtype=dtype, converters=converters)
+        chunks = []
+        rows_scanned = 0
+        for chunk in pd.read_csv(file_path, sep='\t', usecols=usecols, dtype=dtype, converters=converters,
+                                 chunksize=convert_chunksize):
+            rows_scanned += len(chunk)
+            chunks.append(chunk[key_mask(chunk, keep_keys)])
+        if not chunks:
+            return pd.read_csv(file_path, sep='\t', usecols=usecols, dtype=dtype, nrows=0)
+        df = pd.concat(chunks).reset_index(drop=True)
+        log_scan(file_path, rows_scanned, len(df))
+        return df
+
+    columns = [c for c in meta['columns'] if usecols is None or c in usecols]
+    parquet_path = cache_paths(file_path)[0]
+    if keep_keys is None:
+        table = pq.read_table(parquet_path, columns=columns)
+    elif any(len(values) == 0 for values in keep_keys.values()):
+        table = pq.ParquetFile(parquet_path).schema_arrow.empty_table().select(columns)
+    else:
+        filters = [(column, 'in', list(values)) for column, values in keep_keys.items()]
+        table = pq.read_table(parquet_path, columns=columns, filters=filters)
+    df = to_frame(table, columns, dtype, converters)
+    if keep_keys is not None:
+        log_scan(file_path, meta['rows'], len(df))
+    return df
+
+
+# Function to read a TSV chunk by chunk through the cache (the row index keeps counting across chunks)
+def iter_tsv_chunks(file_path, usecols=None, dtype=str, chunksize=500000, use_cache=True):
+    meta = ensure_cache(file_path, usecols) if use_cache else None
+    if meta is None:
+        yield from pd.read_csv(file_path, sep='\t', usecols=usecols, dtype=dtype, chunksize=chunksize)
+        return
+    columns = [c for c in meta['columns'] if usecols is None or c in usecols]
+    rows_before = 0
+    for batch in pq.ParquetFile(cache_paths(file_path)[0]).iter_batches(batch_size=chunksize, columns=columns):
+        chunk = to_frame(pa.Table.from_batches([batch]), columns, dtype)
+        chunk.index = pd.RangeIndex(rows_before, rows_before + len(chunk))
+        rows_before += len(chunk)
+        yield chunk
+
+
+def main():
+    if pq is None:
+        sys.exit('the TSV cache needs the pyarrow package: pip install pyarrow')
+    for file_path in sys.argv[1:]:
+        meta = valid_cache_meta(file_path)
+        if meta is None:
+            meta = build_cache(file_path)
+            print(f"'{file_path}': cached {meta['rows']} rows, columns {', '.join(meta['columns'])}")
+        else:
+            print(f"'{file_path}': cache is up to date")
+
+
+if __name__ == "__main__":
+    main()